@@ -13,6 +13,7 @@ import detect_tools as tools
 import paddlehub as hub
 from PIL import ImageFont, Image
 from paddleocr import PaddleOCR
+from perf_profiles import apply_profile
 
 class FilePickerWindow(QWidget):
     def __init__(self):
@@ -20,6 +21,9 @@ class FilePickerWindow(QWidget):
         self.selected_file = None
         self.enter_btn = None
         self.crop_img_labels = []
+        # 性能配置档由环境变量 PLATE_PERF_PROFILE 选择；检测模型首次使用时加载并预热
+        self.perf = apply_profile()
+        self.detector = None
         self.initUI()
 
     def initUI(self):
@@ -103,8 +107,9 @@ class FilePickerWindow(QWidget):
 
         # YOLO检测
         yolo_model_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models', 'best.pt')
-        model = YOLO(yolo_model_path, task='detect')
-        results = model(self.selected_file)[0]
+        if self.detector is None:
+            self.detector = self.perf.load_model(yolo_model_path)
+        results = self.detector(self.selected_file, **self.perf.predict_kwargs())[0]
         location_list = results.boxes.xyxy.tolist()
         if len(location_list) >= 1:
             location_list = [list(map(int, e)) for e in location_list]
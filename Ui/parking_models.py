@@ -0,0 +1,183 @@
+"""
+停车场界面的 Qt 数据模型（model/view）
+1. VehicleListModel：在场车辆，按进出场事件增量插入/删除行，不再整表重建
+2. HistoryTableModel：停车历史，滚动到底部时才向后端按页查询（fetchMore）
+3. EventLogModel：事件日志环形缓冲区，超过上限时丢弃最旧的行
+视图只绘制可见行，几万辆车或一整天的事件也不会拖慢界面。
+"""
+
+from collections import deque
+
+from PyQt5.QtCore import QAbstractListModel, QAbstractTableModel, QModelIndex, Qt
+from PyQt5.QtGui import QFont
+
+_row_font = None
+
+
+def row_font():
+    """所有行共用一个字体对象（在 QApplication 创建之后才构造）"""
+    global _row_font
+    if _row_font is None:
+        _row_font = QFont("Consolas", 11)
+    return _row_font
+
+
+class VehicleListModel(QAbstractListModel):
+    """当前在场车辆"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._plates = []   # 行顺序（按入场先后）
+        self._entries = {}  # {车牌号: 入场时间字符串}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._plates)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        plate = self._plates[index.row()]
+        if role == Qt.DisplayRole:
+            return f"{plate}  入场:{self._entries[plate]}"
+        if role == Qt.FontRole:
+            return row_font()
+        return None
+
+    def reload(self, vehicles):
+        """与后端的 get_current_vehicles() 做差异同步：只删除离场的行、追加新入场的行"""
+        latest = {v['plate_number']: v['entry_time'] for v in vehicles}
+        for row in range(len(self._plates) - 1, -1, -1):
+            if self._plates[row] not in latest:
+                self._remove_row(row)
+        for row, plate in enumerate(self._plates):
+            if self._entries[plate] != latest[plate]:
+                self._entries[plate] = latest[plate]
+                self.dataChanged.emit(self.index(row), self.index(row))
+        for plate, entry_time in latest.items():
+            if plate not in self._entries:
+                self._append(plate, entry_time)
+
+    def apply_event(self, result):
+        """根据一次进出场结果增量更新"""
+        plate = result.get('plate_number')
+        if result.get('action') == '进入' and plate not in self._entries:
+            self._append(plate, result.get('time', ''))
+        elif result.get('action') == '驶出' and plate in self._entries:
+            self._remove_row(self._plates.index(plate))
+
+    def _append(self, plate, entry_time):
+        row = len(self._plates)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._plates.append(plate)
+        self._entries[plate] = entry_time
+        self.endInsertRows()
+
+    def _remove_row(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        plate = self._plates.pop(row)
+        del self._entries[plate]
+        self.endRemoveRows()
+
+
+class HistoryTableModel(QAbstractTableModel):
+    """停车历史（新的在上），按需分页加载"""
+
+    HEADERS = ('车牌号', '入场时间', '驶出时间', '停车时长', '费用(元)')
+
+    def __init__(self, backend, page_size=100, parent=None):
+        super().__init__(parent)
+        self.backend = backend
+        self.page_size = page_size
+        self._rows = []
+        self._exhausted = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return self._rows[index.row()][index.column()]
+        if role == Qt.FontRole:
+            return row_font()
+        return None
+
+    # 视图滚动到底部时调用
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        page = self.backend.get_parking_history(limit=self.page_size, offset=len(self._rows))
+        if len(page) < self.page_size:
+            self._exhausted = True
+        if not page:
+            return
+        row = len(self._rows)
+        self.beginInsertRows(QModelIndex(), row, row + len(page) - 1)
+        self._rows.extend(self._format(record) for record in page)
+        self.endInsertRows()
+
+    def reset(self):
+        """重新从第一页加载（例如清空数据之后）"""
+        self.beginResetModel()
+        self._rows = []
+        self._exhausted = False
+        self.endResetModel()
+
+    def apply_event(self, result):
+        """新的驶出记录插到最上面，已加载的页无需重新查询"""
+        if result.get('action') != '驶出' or 'exit_time' not in result:
+            return
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self._rows.insert(0, (result['plate_number'], result['entry_time'], result['exit_time'],
+                              result['duration'], f"{result.get('fee') or 0:.2f}"))
+        self.endInsertRows()
+
+    @staticmethod
+    def _format(record):
+        fee = record.get('fee')
+        return (record['plate_number'],
+                record['entry_time'].replace('T', ' ')[:19],
+                (record['exit_time'] or '').replace('T', ' ')[:19],
+                record.get('duration_formatted') or '',
+                f"{fee:.2f}" if fee is not None else '-')
+
+
+class EventLogModel(QAbstractListModel):
+    """容量固定的事件日志"""
+
+    def __init__(self, capacity=500, parent=None):
+        super().__init__(parent)
+        self._lines = deque()
+        self.capacity = capacity
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._lines)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return self._lines[index.row()]
+        if role == Qt.FontRole:
+            return row_font()
+        return None
+
+    def append(self, line):
+        if len(self._lines) >= self.capacity:
+            self.beginRemoveRows(QModelIndex(), 0, 0)
+            self._lines.popleft()
+            self.endRemoveRows()
+        row = len(self._lines)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._lines.append(line)
+        self.endInsertRows()
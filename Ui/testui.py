@@ -6,7 +6,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QPushButton, QFileDialog,
-    QVBoxLayout, QLabel, QHBoxLayout, QFrame, QGridLayout, QTextEdit, QListWidget, QListWidgetItem
+    QVBoxLayout, QLabel, QHBoxLayout, QFrame, QGridLayout, QListView, QTableView, QAbstractItemView
 )
 from PyQt5.QtGui import QPixmap, QImage, QMovie, QFont
 from PyQt5.QtCore import Qt, QTimer, QTime
@@ -19,6 +19,10 @@ import json
 
 # 导入后端系统
 from parking_backend import ParkingBackend
+from pipeline_metrics import metrics
+from ocr_memo import OcrMemo
+from perf_profiles import apply_profile
+from parking_models import VehicleListModel, HistoryTableModel, EventLogModel
 
 
 class FilePickerWindow(QWidget):
@@ -37,10 +41,19 @@ class FilePickerWindow(QWidget):
         # 初始化后端系统和OCR
         self.parking_backend = ParkingBackend()
         self.ocr = hub.Module(name="ch_pp-ocrv3")
+        # 同一辆车连续检测时复用上次的识别结果
+        self.ocr_memo = OcrMemo()
+        # 性能配置档由环境变量 PLATE_PERF_PROFILE 选择；检测模型首次使用时加载并预热
+        self.perf = apply_profile()
+        self.detector = None
 
         # 添加信息显示区域
         self.info_display = None
         self.current_vehicles_list = None  # 车辆列表控件
+        # 列表数据模型：视图只绘制可见行，数据按事件增量更新
+        self.event_log = EventLogModel(capacity=500)
+        self.vehicle_model = VehicleListModel()
+        self.history_model = HistoryTableModel(self.parking_backend, page_size=100)
 
         self.initUI()
 
@@ -102,11 +115,11 @@ class FilePickerWindow(QWidget):
         info_label.setAlignment(Qt.AlignCenter)
         right_layout.addWidget(info_label)
 
-        # 信息显示文本框
-        self.info_display = QTextEdit(self)
-        self.info_display.setReadOnly(True)
+        # 事件日志（环形缓冲区，只保留最近 500 条）
+        self.info_display = QListView(self)
+        self.info_display.setModel(self.event_log)
+        self.info_display.setUniformItemSizes(True)
         self.info_display.setMaximumHeight(300)
-        self.info_display.setFont(QFont("Consolas", 10))
         right_layout.addWidget(self.info_display)
 
         # 统计信息显示
@@ -127,14 +140,36 @@ class FilePickerWindow(QWidget):
         vehicles_title.setAlignment(Qt.AlignCenter)
         vehicles_layout.addWidget(vehicles_title)
 
-        self.current_vehicles_list = QListWidget(self)
-        self.current_vehicles_list.setFont(QFont("Consolas", 11))
+        self.vehicles_empty_label = QLabel("暂无车辆在场", self)
+        self.vehicles_empty_label.setFont(QFont("Consolas", 11))
+        vehicles_layout.addWidget(self.vehicles_empty_label)
+
+        self.current_vehicles_list = QListView(self)
+        self.current_vehicles_list.setModel(self.vehicle_model)
+        self.current_vehicles_list.setUniformItemSizes(True)
         self.current_vehicles_list.setStyleSheet("background-color: #ffffff;")
         vehicles_layout.addWidget(self.current_vehicles_list)
 
         vehicles_frame.setLayout(vehicles_layout)
         right_layout.addWidget(vehicles_frame)
 
+        # 停车历史（滚动到底部时才向后端查询下一页）
+        history_title = QLabel("停车历史", self)
+        history_title.setFont(QFont("Arial", 12, QFont.Bold))
+        history_title.setAlignment(Qt.AlignCenter)
+        right_layout.addWidget(history_title)
+
+        self.history_view = QTableView(self)
+        self.history_view.setModel(self.history_model)
+        self.history_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.history_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.history_view.verticalHeader().setVisible(False)
+        self.history_view.horizontalHeader().setStretchLastSection(True)
+        right_layout.addWidget(self.history_view)
+
+        # 启动时同步一次在场车辆，之后按事件增量更新
+        self.vehicle_model.reload(self.parking_backend.get_current_vehicles())
+
         right_frame.setLayout(right_layout)
 
         # 更新信息显示
@@ -210,37 +245,42 @@ class FilePickerWindow(QWidget):
 
     def detectVehicle(self):
         self.showLoading()
-        now_img = tools.img_cvread(self.selected_file)  # BGR格式
+        with metrics.stage('decode'):
+            now_img = tools.img_cvread(self.selected_file)  # BGR格式
+        metrics.count('frames')
 
         # YOLO检测
         yolo_model_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models', 'best.pt')
         yolo_model_path = r'D:\Study\college_course\da_2_xia\xiaoxueqi\firstWeek\FirstWeek\runs\detect\train5\weights\best.pt'
-        model = YOLO(yolo_model_path, task='detect')
-        results = model(self.selected_file)[0]
-        location_list = results.boxes.xyxy.tolist()
+        if self.detector is None:
+            self.detector = self.perf.load_model(yolo_model_path)
+        with metrics.stage('yolo'):
+            results = self.detector(self.selected_file, **self.perf.predict_kwargs())[0]
+        # 先在原图上批量截取车牌（框裁剪到图像范围内，标准化为 240x80），再画框
+        with metrics.stage('crop'):
+            crops, boxes, valid = tools.crop_plates(now_img, results.boxes.xyxy)
+        location_list = boxes[valid].tolist()
         crop_imgs = []
         plate_numbers = []  # 存储识别到的车牌号
 
+        # 本帧没有再出现的车牌框对应的 OCR 记忆立即作废
+        self.ocr_memo.begin_frame(location_list)
         if len(location_list) >= 1:
-            location_list = [list(map(int, e)) for e in location_list]
-            for each in location_list:
+            metrics.count('plates', len(location_list))
+            for each, cropImg in zip(location_list, crops[valid]):
                 x1, y1, x2, y2 = each
-                cv2.rectangle(now_img, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                cropImg = now_img[y1:y2, x1:x2]
-                cropImg = cv2.resize(cropImg, (240, 80), interpolation=cv2.INTER_LINEAR)
+                with metrics.stage('annotate'):
+                    cv2.rectangle(now_img, (x1, y1), (x2, y2), (0, 255, 0), 2)
                 crop_imgs.append(cropImg)
 
                 # OCR识别车牌号
                 try:
-                    result = self.ocr.recognize_text(images=[cropImg])
-                    for ocr_result in result:
-                        if ocr_result['data']:
-                            text = ocr_result['data'][0]['text']
-                            confidence = ocr_result['data'][0]['confidence']
-                            if confidence > 0.7:  # 置信度阈值
-                                plate_numbers.append(text)
-                                print(f"识别到车牌: {text}, 置信度: {confidence:.2f}")
+                    text, confidence = self.ocr_memo.recognize(cropImg, each, self.recognize_plate)
+                    if text and confidence > 0.7:  # 置信度阈值
+                        plate_numbers.append(text)
+                        print(f"识别到车牌: {text}, 置信度: {confidence:.2f}")
                 except Exception as e:
+                    metrics.count('ocr_failures')
                     print(f"OCR识别失败: {e}")
 
         # 处理识别到的车牌，使用虚拟时间
@@ -252,6 +292,16 @@ class FilePickerWindow(QWidget):
 
         # 更新信息显示
         self.update_info_display()
+        metrics.write_prometheus()
+
+    def recognize_plate(self, cropImg):
+        """OCR识别单张车牌截图，返回 (车牌号, 置信度)"""
+        with metrics.stage('ocr'):
+            result = self.ocr.recognize_text(images=[cropImg])
+        if not result or not result[0]['data']:
+            metrics.count('ocr_failures')
+            return None, None
+        return result[0]['data'][0]['text'], result[0]['data'][0]['confidence']
 
     def process_plates(self, plate_numbers):
         """处理识别到的车牌号，使用虚拟时间"""
@@ -284,14 +334,18 @@ class FilePickerWindow(QWidget):
             display_text = f"[{virtual_time_str}] 🚗 进入: {result['plate_number']}"
         elif action == '驶出':
             duration = result.get('duration', '未知')
+            fee = result.get('fee')
             display_text = f"[{virtual_time_str}] 🚙 驶出: {result['plate_number']} (停车时长: {duration})"
+            if fee is not None:
+                display_text += f" 费用: {fee:.2f}元"
         else:
             display_text = f"[{virtual_time_str}] ⚠️ {message}"
 
+        self.event_log.append(display_text)
         if self.info_display:
-            self.info_display.append(display_text)
-            scrollbar = self.info_display.verticalScrollBar()
-            scrollbar.setValue(scrollbar.maximum())
+            self.info_display.scrollToBottom()
+        self.vehicle_model.apply_event(result)
+        self.history_model.apply_event(result)
 
     def update_info_display(self):
         """更新信息显示和车辆列表"""
@@ -304,25 +358,15 @@ class FilePickerWindow(QWidget):
 • 总完成停车次数: {stats['total_completed_parkings']}
 • 当前在场车辆: {stats['current_vehicles_count']}
 • 平均停车时长: {stats['average_parking_duration']}
-• 总识别次数: {stats['total_recognitions']}"""
+• 总识别次数: {stats['total_recognitions']}
+• 累计停车费: {stats['total_fee']:.2f}元"""
 
         self.stats_label.setText(stats_text)
 
-        # 更新当前在场车辆列表
-        current_vehicles = self.parking_backend.get_current_vehicles()
-        self.current_vehicles_list.clear()
-        if current_vehicles:
-            for vehicle in current_vehicles:
-                plate = vehicle['plate_number']
-                in_time = vehicle.get('in_time', '')
-                display = plate
-                if in_time:
-                    display += f"  入场:{in_time}"
-                item = QListWidgetItem(display)
-                item.setFont(QFont("Consolas", 11))
-                self.current_vehicles_list.addItem(item)
-        else:
-            self.current_vehicles_list.addItem("暂无车辆在场")
+        # 在场车辆列表由 display_parking_result 按事件增量更新，这里只切换空列表提示
+        empty = self.vehicle_model.rowCount() == 0
+        self.vehicles_empty_label.setVisible(empty)
+        self.current_vehicles_list.setVisible(not empty)
 
     def displayLabeledImage(self, img):
         img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
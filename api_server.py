@@ -0,0 +1,458 @@
+# encoding:utf-8
+"""
+停车场本地 HTTP / WebSocket 接口
+基于 asyncio 的轻量服务，只用标准库，供道闸控制器与看板访问 ParkingBackend：
+    GET  /vehicles                          在场车辆
+    GET  /history?limit=50&offset=0         分页停车历史（可加 start / end，ISO 时间）
+    GET  /statistics                        统计信息
+    POST /plates   {"plate": "皖A12345"}    提交一次闸口事件（可带 "time"），每次调用都计一次进出
+    POST /crops    车牌截图（JPEG/PNG 字节） 识别车牌号，?submit=1 时同时进出场
+    POST /frames   整帧图片（JPEG/PNG 字节） 检测 + 识别，并把车牌提交给后端
+/crops 与 /frames 的客户端通常是连续推帧，同一辆车会被识别很多次；这两个接口提交前先经过
+PlateDebouncer 合并（车牌消失超过 dedup 秒再出现才算新的进出），被合并时 parking 为 null、debounced 为 true。
+两者都可用 ?time=ISO 时间 指定帧的采集时刻，默认取收到请求的时刻。
+    GET  /events   WebSocket，推送进出场事件
+HTTP/1.1 连接默认保持（keep-alive）。后端调用都放在单线程执行器中串行执行，
+ParkingBackend 本身无需加锁；检测与 OCR 在另外的线程池中执行，不阻塞事件循环。
+用法:
+    python api_server.py --port 8080 [--model models/best.pt --ocr hub]
+    python api_server.py --bench            # 本地压测
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from parking_backend import ParkingBackend, PlateDebouncer
+from perf_profiles import add_profile_argument, apply_profile
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC11B85"
+MAX_PAGE_SIZE = 500
+MAX_BODY_BYTES = 16 * 1024 * 1024
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"无法序列化 {type(value)}")
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise HttpError(400, f"时间格式错误: {value}")
+
+
+def _decode_image(body: bytes) -> np.ndarray:
+    import cv2
+    img = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise HttpError(400, "无法解码图片")
+    return img
+
+
+class ParkingApiServer:
+    """停车场 HTTP / WebSocket 服务"""
+
+    def __init__(self, backend: ParkingBackend, host: str = '127.0.0.1', port: int = 8080,
+                 model=None, ocr_func: Callable = None, idle_timeout: float = 30.0,
+                 predict_kwargs: Dict = None, debouncer: PlateDebouncer = None):
+        """
+        Args:
+            backend: 停车场后端
+            model: 可选的 YOLO 检测模型，提供时才开放 /frames
+            ocr_func: 可选的 OCR 函数 crop -> (车牌号, 置信度)，提供时才开放 /crops 与 /frames
+            idle_timeout: keep-alive 连接的空闲超时（秒）
+            predict_kwargs: 检测时传给模型的参数（性能配置档的 imgsz 等）
+            debouncer: /crops 与 /frames 提交前的车牌去抖，默认 PlateDebouncer()
+        """
+        self.backend = backend
+        self.host = host
+        self.port = port
+        self.model = model
+        self.ocr_func = ocr_func
+        self.predict_kwargs = predict_kwargs or {}
+        self.debouncer = debouncer if debouncer is not None else PlateDebouncer()
+        self.idle_timeout = idle_timeout
+        # 后端只在这一个线程里访问
+        self._backend_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='parking-backend')
+        self._vision_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='parking-vision')
+        self._subscribers = set()  # WebSocket 事件队列
+        self._loop = None
+        self._server = None
+        self.requests_served = 0
+        self.routes = {
+            ('GET', '/vehicles'): self.handle_vehicles,
+            ('GET', '/history'): self.handle_history,
+            ('GET', '/statistics'): self.handle_statistics,
+            ('POST', '/plates'): self.handle_plates,
+            ('POST', '/crops'): self.handle_crops,
+            ('POST', '/frames'): self.handle_frames,
+        }
+
+    # --------- 生命周期 ----------
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self.backend.add_listener(self._on_backend_event)
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        print(f"停车场接口已启动: http://{self.host}:{self.port}")
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        self.backend.remove_listener(self._on_backend_event)
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for queue in list(self._subscribers):
+            queue.put_nowait(None)
+        self._backend_executor.shutdown(wait=False)
+        self._vision_executor.shutdown(wait=False)
+
+    def _call_backend(self, func, *args, **kwargs):
+        return self._loop.run_in_executor(self._backend_executor, lambda: func(*args, **kwargs))
+
+    def _call_vision(self, func, *args):
+        return self._loop.run_in_executor(self._vision_executor, func, *args)
+
+    # --------- 事件推送 ----------
+    def _on_backend_event(self, result: Dict):
+        """后端回调（在后端线程中），转交给事件循环广播"""
+        if self._loop is not None and self._subscribers:
+            self._loop.call_soon_threadsafe(self._broadcast, result)
+
+    def _broadcast(self, result: Dict):
+        message = json.dumps({'type': 'parking_event', 'data': result}, ensure_ascii=False, default=_json_default)
+        for queue in self._subscribers:
+            if queue.qsize() < 1000:  # 慢客户端不拖垮服务，积压过多时丢弃
+                queue.put_nowait(message)
+
+    # --------- 路由处理 ----------
+    async def handle_vehicles(self, query, body):
+        vehicles = await self._call_backend(self.backend.get_current_vehicles)
+        return {'count': len(vehicles), 'items': vehicles}
+
+    async def handle_history(self, query, body):
+        try:
+            limit = min(int(query.get('limit', 50)), MAX_PAGE_SIZE)
+            offset = max(int(query.get('offset', 0)), 0)
+        except ValueError:
+            raise HttpError(400, "limit / offset 必须是整数")
+        start, end = _parse_time(query.get('start')), _parse_time(query.get('end'))
+        # 多取一条判断是否还有下一页
+        items = await self._call_backend(self.backend.get_parking_history, limit + 1, start, end, offset)
+        return {
+            'offset': offset,
+            'limit': limit,
+            'items': items[:limit],
+            'has_more': len(items) > limit,
+            'next_offset': offset + limit if len(items) > limit else None,
+        }
+
+    async def handle_statistics(self, query, body):
+        return await self._call_backend(self.backend.get_statistics)
+
+    async def handle_plates(self, query, body):
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            raise HttpError(400, "请求体不是合法的 JSON")
+        plate = str(payload.get('plate') or '').strip()
+        if not plate:
+            raise HttpError(400, "缺少 plate")
+        return await self._call_backend(self.backend.process_plate_recognition, plate,
+                                        _parse_time(payload.get('time')))
+
+    async def handle_crops(self, query, body):
+        if self.ocr_func is None:
+            raise HttpError(503, "未加载 OCR 模型")
+        crop = _decode_image(body)
+        text, conf = await self._call_vision(self.ocr_func, crop)
+        result = {'plate': text, 'confidence': conf}
+        if text and query.get('submit') in ('1', 'true'):
+            await self._submit_plate(result, text, _parse_time(query.get('time')))
+        return result
+
+    async def handle_frames(self, query, body):
+        if self.model is None or self.ocr_func is None:
+            raise HttpError(503, "未加载检测或 OCR 模型")
+        img = _decode_image(body)
+        seen_at = _parse_time(query.get('time'))
+        plates = await self._call_vision(self._recognize_frame, img)
+        for plate in plates:
+            if plate['plate']:
+                await self._submit_plate(plate, plate['plate'], seen_at)
+        return {'count': len(plates), 'plates': plates}
+
+    async def _submit_plate(self, result: Dict, text: str, seen_at: Optional[datetime]):
+        """识别出的车牌经去抖后提交给后端，结果写回 result"""
+        parking = await self._call_backend(self.debouncer.submit, self.backend, text, seen_at or datetime.now())
+        result['parking'] = parking
+        result['debounced'] = parking is None
+
+    def _recognize_frame(self, img):
+        import detect_tools as tools
+        result = self.model(img, verbose=False, **self.predict_kwargs)[0]
+        crops, boxes, valid = tools.crop_plates(img, result.boxes.xyxy)
+        plates = []
+        for crop, box in zip(crops[valid], boxes[valid]):
+            text, conf = self.ocr_func(crop)
+            plates.append({'box': box.tolist(), 'plate': text, 'confidence': conf})
+        return plates
+
+    # --------- HTTP ----------
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.idle_timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                url = urlsplit(target)
+                query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+                if url.path == '/events' and headers.get('upgrade', '').lower() == 'websocket':
+                    await self._handle_websocket(reader, writer, headers)
+                    return
+
+                # Content-Length 必须是非负十进制整数，否则无法确定请求体边界，回 400 并关闭连接
+                length_text = headers.get('content-length', '') or '0'
+                if not (length_text.isascii() and length_text.isdigit()):
+                    await self._respond(writer, 400, {'error': 'Content-Length 不合法'}, keep_alive=False)
+                    break
+                length = int(length_text)
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {'error': '请求体过大'}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+
+                handler = self.routes.get((method, url.path))
+                if handler is None:
+                    known = any(path == url.path for _, path in self.routes)
+                    status, payload = (405, {'error': '不支持的方法'}) if known else (404, {'error': '未知的路径'})
+                else:
+                    try:
+                        status, payload = 200, await handler(query, body)
+                    except HttpError as e:
+                        status, payload = e.status, {'error': str(e)}
+                    except Exception as e:
+                        status, payload = 500, {'error': str(e)}
+                self.requests_served += 1
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status: int, payload, keep_alive: bool = True):
+        body = json.dumps(payload, ensure_ascii=False, default=_json_default).encode('utf-8')
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    # --------- WebSocket ----------
+    async def _handle_websocket(self, reader, writer, headers):
+        key = headers.get('sec-websocket-key')
+        if not key:
+            await self._respond(writer, 400, {'error': '缺少 Sec-WebSocket-Key'}, keep_alive=False)
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode('latin-1'))
+        await writer.drain()
+
+        queue = asyncio.Queue()
+        self._subscribers.add(queue)
+        receiver = asyncio.ensure_future(self._ws_receive(reader, writer, queue))
+        try:
+            while True:
+                message = await queue.get()
+                if message is None:
+                    break
+                writer.write(_ws_frame(message.encode('utf-8')))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._subscribers.discard(queue)
+            receiver.cancel()
+            writer.close()
+
+    @staticmethod
+    async def _ws_receive(reader, writer, queue):
+        """处理客户端发来的帧：回应 ping，收到 close 或断开时结束推送"""
+        try:
+            while True:
+                opcode, payload = await _ws_read_frame(reader)
+                if opcode == 0x8:
+                    break
+                if opcode == 0x9:
+                    writer.write(_ws_frame(payload, opcode=0xA))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        queue.put_nowait(None)
+
+
+def _ws_frame(payload: bytes, opcode: int = 0x1) -> bytes:
+    """服务端发出的帧不加掩码"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def _ws_read_frame(reader):
+    first, second = await reader.readexactly(2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', await reader.readexactly(8))[0]
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return opcode, payload
+
+
+# --------- 本地压测 ----------
+async def _bench_client(host, port, paths, requests, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for i in range(requests):
+            path = paths[i % len(paths)]
+            start = time.perf_counter()
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+            await writer.drain()
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = int(head.lower().split(b'content-length:')[1].split(b'\r\n')[0])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def run_load_test(backend: ParkingBackend, connections: int = 20, requests_per_connection: int = 200,
+                        seed_events: int = 2000) -> Dict:
+    """在本进程内启动服务，用 keep-alive 连接并发请求只读接口，返回每秒请求数与延迟分位数"""
+    from datetime import timedelta
+    t = datetime(2024, 1, 1, 8)
+    for i in range(seed_events):
+        t += timedelta(minutes=1)
+        backend.process_plate_recognition(f"BENCH{i // 2 % 500:03d}", t)
+
+    server = ParkingApiServer(backend, port=0)
+    await server.start()
+    paths = ['/statistics', '/vehicles', '/history?limit=20', '/history?limit=20&offset=100']
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[_bench_client(server.host, server.port, paths, requests_per_connection, latencies)
+                           for _ in range(connections)])
+    elapsed = time.perf_counter() - start
+    await server.close()
+    samples = np.array(latencies) * 1000
+    result = {
+        'connections': connections,
+        'requests': len(latencies),
+        'requests_per_s': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p95_ms': float(np.percentile(samples, 95)),
+        'p99_ms': float(np.percentile(samples, 99)),
+    }
+    print(f"{result['requests']} 个请求，{connections} 个连接: {result['requests_per_s']:.0f} 请求/秒, "
+          f"p50 {result['p50_ms']:.1f}ms, p95 {result['p95_ms']:.1f}ms, p99 {result['p99_ms']:.1f}ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="停车场 HTTP / WebSocket 接口")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--data', default='runs/api/parking_data.json', help='停车数据文件')
+    parser.add_argument('--model', default=None, help='YOLO 模型路径，提供时开放 /frames')
+    parser.add_argument('--ocr', default=None, help="OCR 引擎 'hub' / 'paddleocr'，提供时开放 /crops")
+    parser.add_argument('--bench', action='store_true', help='用临时数据目录做本地压测')
+    parser.add_argument('--connections', type=int, default=20)
+    parser.add_argument('--dedup-seconds', type=float, default=30.0,
+                        help='/crops 与 /frames：同一车牌消失超过该秒数后再出现才算新的进出场')
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    if args.bench:
+        import shutil
+        import tempfile
+        workdir = tempfile.mkdtemp(prefix='parking_api_bench_')
+        try:
+            asyncio.run(run_load_test(ParkingBackend(f"{workdir}/parking_data.json"), args.connections))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        return
+
+    profile = apply_profile(args.profile)
+    model = profile.load_model(args.model) if args.model else None
+    ocr_func = None
+    if args.ocr:
+        from ocr_executor import create_ocr_func
+        ocr_func = create_ocr_func(args.ocr, profile.ocr_threads)
+    os.makedirs(os.path.dirname(args.data) or '.', exist_ok=True)
+    server = ParkingApiServer(ParkingBackend(args.data), args.host, args.port, model, ocr_func,
+                              predict_kwargs=profile.predict_kwargs(),
+                              debouncer=PlateDebouncer(args.dedup_seconds))
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
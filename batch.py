@@ -2,12 +2,15 @@
 from ultralytics import YOLO
 import cv2
 import detect_tools as tools
-import paddlehub as hub
 from PIL import ImageFont, Image
 import numpy as np
 import re
 import os
 import glob
+from pipeline_metrics import metrics
+from result_cache import DetectionCache
+from ocr_executor import OcrExecutor
+from perf_profiles import apply_profile
 
 if __name__ == "__main__":
     # 设置图片文件夹路径
@@ -15,42 +18,71 @@ if __name__ == "__main__":
     img_paths = glob.glob(os.path.join(img_folder, "*"))  # 获取所有文件
     img_paths = [p for p in img_paths if p.lower().endswith(('.jpg', '.jpeg', '.png'))]  # 过滤图片
 
-    # 加载模型
+    # 加载模型；性能配置档由环境变量 PLATE_PERF_PROFILE 选择
+    profile = apply_profile()
     fontC = ImageFont.truetype("Font/platech.ttf", 50, 0)
     yolo_model_path = r'models/best.pt'
-    model = YOLO(yolo_model_path, task='detect')
-    ocr = hub.Module(name="ch_pp-ocrv3")
+    model = profile.load_model(yolo_model_path)
+    # 多进程OCR，每个进程加载一次 ch_pp-ocrv3；OCR_WORKERS=0 时在当前进程内识别
+    ocr = OcrExecutor(num_workers=int(os.environ.get('OCR_WORKERS', profile.ocr_workers or os.cpu_count())),
+                      engine='hub', threads=profile.ocr_threads)
+    # 结果缓存，重复运行时未变化的图片无需重新检测
+    cache = DetectionCache(persist_path=".cache/batch_results.json")
 
-    for img_path in img_paths:
+    # 后台线程池并行预读解码，主循环只等待已经解码好的图片
+    decoded = tools.img_cvread_iter(img_paths)
+    while True:
+        with metrics.stage('decode'):
+            img_path, now_img = next(decoded, (None, None))
+        if img_path is None:
+            break
         print(f"\n【正在处理】{img_path}")
-        now_img = tools.img_cvread(img_path)
-
-        # YOLO检测
-        results = model(img_path)[0]
-        location_list = results.boxes.xyxy.tolist()
-        if len(location_list) >= 1:
-            location_list = [list(map(int, e)) for e in location_list]
-            license_imgs = []
-            for each in location_list:
-                x1, y1, x2, y2 = each
-                cropImg = now_img[y1:y2, x1:x2]
-                cropImg = cv2.resize(cropImg, (240, 80), interpolation=cv2.INTER_LINEAR)
-                license_imgs.append(cropImg)
-
-            # OCR识别
+        metrics.count('frames')
+
+        # 内容相同的图片直接复用缓存结果
+        cached = cache.get_file(img_path)
+        if cached is not None:
+            metrics.count('cache_hits')
+            location_list, lisence_res = cached['boxes'], cached['texts']
+        else:
+            # YOLO检测
+            # 直接传入已解码的图片，避免 YOLO 再读一遍文件
+            with metrics.stage('yolo'):
+                results = model(now_img, **profile.predict_kwargs())[0]
+            # 批量裁剪到图像范围内并标准化为 240x80，丢弃越界后面积为零的框
+            with metrics.stage('crop'):
+                crops, boxes, valid = tools.crop_plates(now_img, results.boxes.xyxy)
+            license_imgs = crops[valid]
+            location_list = boxes[valid].tolist()
+            metrics.count('plates', len(license_imgs))
+
+            # OCR识别：未命中缓存的截图交给多进程执行器并行识别
+            ocr_results = [cache.get_crop(cropImg) for cropImg in license_imgs]
+            todo = [i for i, r in enumerate(ocr_results) if r is None]
+            with metrics.stage('ocr'):
+                recognized = ocr.map([license_imgs[i] for i in todo])
+            for i, (text, conf) in zip(todo, recognized):
+                ocr_results[i] = (text, conf)
+                if text:
+                    cache.put_crop(license_imgs[i], text, conf)
+
             lisence_res = []
             conf_list = []
-            for cropImg in license_imgs:
-                result = ocr.recognize_text(images=[cropImg])
-                for each in result:
-                    text = each['data'][0]['text']
-                    conf = each['data'][0]['confidence']
-                    print("识别结果：", text)
-                    print("置信度：", conf)
-                    lisence_res.append(text)
-                    conf_list.append(conf)
-
-            # 绘制结果
+            for text, conf in ocr_results:
+                if not text:
+                    metrics.count('ocr_failures')
+                    lisence_res.append('无法识别')
+                    conf_list.append(0)
+                    continue
+                print("识别结果：", text)
+                print("置信度：", conf)
+                lisence_res.append(text)
+                conf_list.append(conf)
+            result = {'boxes': location_list, 'texts': lisence_res, 'confs': conf_list}
+            cache.put_file(img_path, result)
+
+        # 绘制结果
+        with metrics.stage('annotate'):
             for text, box in zip(lisence_res, location_list):
                 now_img = tools.drawRectBox(now_img, box, text, fontC)
 
@@ -59,4 +91,8 @@ if __name__ == "__main__":
         cv2.imshow("YOLOv8 Detection", now_img)
         cv2.waitKey(0)
 
-    cv2.destroyAllWindows()
\ No newline at end of file
+    cv2.destroyAllWindows()
+    ocr.close()
+    cache.save()
+    metrics.report()
+    metrics.write_prometheus()
\ No newline at end of file
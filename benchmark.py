@@ -0,0 +1,329 @@
+# coding:utf-8
+"""
+端到端性能基准测试
+覆盖：
+1. YOLO 检测吞吐（不同 batch 与 imgsz）
+2. 单张车牌 OCR 延迟（PaddleOCR 与 PaddleHub ch_pp-ocrv3）
+3. ParkingBackend.process_plate_recognition 每秒事件数（随历史规模增长）
+4. detect_tools 标注开销（drawRectBox / draw_boxes）
+5. 性能配置档对比：每个配置档在独立子进程中跑检测基准（线程数与 CPU 亲和性是进程级设置）
+输入为固定随机种子的合成数据和 TestFiles/1.mp4 的视频帧，结果写入 JSON，
+便于在纯 CPU 机器上跨版本对比。缺少依赖或文件的项目会记录为 skipped。
+
+用法: python benchmark.py --out bench_results.json [--only detector,ocr,backend,annotate,profiles] [--profile 名称]
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+
+from perf_profiles import PROFILES, add_profile_argument, apply_profile
+
+VIDEO_PATH = "TestFiles/1.mp4"
+MODEL_PATH = "models/best.pt"
+FONT_PATH = "Font/platech.ttf"
+
+
+def time_calls(func, repeat=20, warmup=2, items_per_call=1):
+    """多次调用 func，返回延迟分位数（毫秒）与吞吐（条/秒）"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    samples = np.array(samples)
+    return {
+        'repeat': repeat,
+        'mean_ms': float(samples.mean() * 1000),
+        'p50_ms': float(np.percentile(samples, 50) * 1000),
+        'p95_ms': float(np.percentile(samples, 95) * 1000),
+        'throughput_per_s': float(items_per_call / samples.mean()),
+    }
+
+
+def synthetic_frames(count, rng, size=(1080, 1920)):
+    """带一块类似车牌的矩形区域的随机帧"""
+    frames = []
+    for _ in range(count):
+        img = rng.integers(0, 255, (size[0], size[1], 3), dtype=np.uint8)
+        x, y = int(rng.integers(0, size[1] - 240)), int(rng.integers(0, size[0] - 80))
+        img[y:y + 80, x:x + 240] = (180, 80, 20)
+        frames.append(img)
+    return frames
+
+
+def video_frames(path, count):
+    """从测试视频中均匀抽取帧"""
+    if not os.path.exists(path):
+        return []
+    cap = cv2.VideoCapture(path)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or count
+    frames = []
+    for idx in np.linspace(0, total - 1, count).astype(int):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(idx))
+        ok, frame = cap.read()
+        if ok:
+            frames.append(frame)
+    cap.release()
+    return frames
+
+
+def synthetic_crops(count, rng):
+    """240x80 的合成车牌图，白色字符写在蓝底上"""
+    crops = []
+    for _ in range(count):
+        crop = np.zeros((80, 240, 3), dtype=np.uint8)
+        crop[:] = (180, 80, 20)
+        text = "A" + "".join(str(d) for d in rng.integers(0, 10, 5))
+        cv2.putText(crop, text, (20, 58), cv2.FONT_HERSHEY_SIMPLEX, 1.6, (255, 255, 255), 3)
+        crops.append(crop)
+    return crops
+
+
+# --------- 各项基准 ----------
+def bench_detector(rng, profile, batch_sizes=(1, 4, 8), imgsz_list=(320, 480, 640), repeat=5):
+    if not os.path.exists(MODEL_PATH):
+        return {'skipped': f'模型文件不存在: {MODEL_PATH}'}
+    # 配置档固定了输入尺寸时只测该尺寸；静态形状的 ONNX 只能逐张推理
+    if profile.imgsz:
+        imgsz_list = (profile.imgsz,)
+    if profile.static_shape:
+        batch_sizes = (1,)
+    elif profile.batch > 1:
+        batch_sizes = tuple(sorted(set(batch_sizes) | {profile.batch}))
+    start = time.perf_counter()
+    model = profile.load_model(MODEL_PATH)
+    load_seconds = time.perf_counter() - start
+    frames = video_frames(VIDEO_PATH, max(batch_sizes)) or synthetic_frames(max(batch_sizes), rng)
+
+    # 加载（含预热）之后的第一次调用，反映首个真实请求的延迟
+    start = time.perf_counter()
+    model(frames[0], imgsz=imgsz_list[0], device='cpu', verbose=False)
+    first_call_ms = (time.perf_counter() - start) * 1000
+    print(f"detector 加载 {load_seconds:.2f}s，首次调用 {first_call_ms:.1f}ms")
+
+    results = []
+    for imgsz in imgsz_list:
+        for batch in batch_sizes:
+            batch_frames = [frames[i % len(frames)] for i in range(batch)]
+            stats = time_calls(lambda: model(batch_frames, imgsz=imgsz, device='cpu', verbose=False),
+                               repeat=repeat, warmup=1, items_per_call=batch)
+            stats.update({'imgsz': imgsz, 'batch': batch})
+            results.append(stats)
+            print(f"detector imgsz={imgsz} batch={batch}: {stats['throughput_per_s']:.1f} 帧/秒")
+    return {'source': VIDEO_PATH if os.path.exists(VIDEO_PATH) else 'synthetic', 'load_seconds': load_seconds,
+            'first_call_ms': first_call_ms, 'runs': results}
+
+
+def bench_ocr(rng, profile, repeat=20):
+    from ocr_executor import create_ocr_func
+    crops = synthetic_crops(repeat, rng)
+    engines = {}
+
+    for name, engine in (('paddleocr', 'paddleocr'), ('ch_pp-ocrv3', 'hub')):
+        try:
+            recognize = create_ocr_func(engine, profile.ocr_threads)
+            crop_cycle = itertools.cycle(crops)
+            engines[name] = time_calls(lambda: recognize(next(crop_cycle)), repeat=repeat)
+        except Exception as e:
+            engines[name] = {'skipped': str(e)}
+
+    for name, stats in engines.items():
+        if 'p50_ms' in stats:
+            print(f"ocr {name}: p50 {stats['p50_ms']:.1f}ms")
+    return engines
+
+
+def _prefill_history(backend, size, rng, start):
+    """直接写入分区归档，快速构造指定规模的历史"""
+    from parking_backend import ParkingRecord
+    t = start
+    for i in range(size):
+        t += timedelta(seconds=int(rng.integers(1, 120)))
+        record = ParkingRecord(f"P{i % 5000:05d}", t, t + timedelta(minutes=int(rng.integers(5, 600))))
+        backend.history.append(record)
+    return t
+
+
+def bench_backend(rng, profile, history_sizes=(0, 1000, 10000, 50000), events=2000):
+    from parking_backend import ParkingBackend
+    results = []
+    for size in history_sizes:
+        workdir = tempfile.mkdtemp(prefix="parking_bench_")
+        try:
+            data_file = os.path.join(workdir, "parking_data.json")
+            backend = ParkingBackend(data_file)
+            t = _prefill_history(backend, size, rng, datetime(2024, 1, 1))
+
+            startup = time.perf_counter()
+            backend = ParkingBackend(data_file)
+            startup = time.perf_counter() - startup
+
+            plates = [f"Q{i:05d}" for i in range(events // 2)]
+            order = plates + plates  # 先全部进入，再全部驶出
+            start = time.perf_counter()
+            for plate in order:
+                t += timedelta(seconds=30)
+                backend.process_plate_recognition(plate, t)
+            elapsed = time.perf_counter() - start
+            stats = {
+                'history_size': size,
+                'events': len(order),
+                'events_per_s': len(order) / elapsed,
+                'startup_ms': startup * 1000,
+            }
+            results.append(stats)
+            print(f"backend history={size}: {stats['events_per_s']:.0f} 事件/秒, 启动 {stats['startup_ms']:.1f}ms")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def bench_annotate(rng, profile, repeat=50):
+    import detect_tools as tools
+    frame = synthetic_frames(1, rng)[0]
+    boxes = [[100, 200, 340, 280], [800, 600, 1040, 680]]
+    results = {'draw_boxes': time_calls(lambda: tools.draw_boxes(frame.copy(), boxes), repeat=repeat)}
+    if os.path.exists(FONT_PATH):
+        results['drawRectBox'] = time_calls(
+            lambda: tools.drawRectBox(frame.copy(), boxes[0], "皖A12345", None), repeat=repeat)
+    else:
+        results['drawRectBox'] = {'skipped': f'字体文件不存在: {FONT_PATH}'}
+    return results
+
+
+def bench_profiles(rng, profile, seed=0):
+    """
+    逐个配置档在子进程中运行检测与 OCR 基准，汇总首次调用延迟、最佳单帧延迟与最大吞吐，
+    并与 default 配置档对比，用来验证配置档确实带来收益
+    """
+    summary = {}
+    for name in PROFILES:
+        fd, out_path = tempfile.mkstemp(suffix='.json', prefix=f'bench_{name}_')
+        os.close(fd)
+        try:
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--only', 'detector,ocr',
+                                   '--profile', name, '--seed', str(seed), '--out', out_path],
+                                  capture_output=True, text=True)
+            if proc.returncode != 0:
+                summary[name] = {'error': proc.stderr.strip().splitlines()[-1:] or proc.returncode}
+                continue
+            with open(out_path, 'r', encoding='utf-8') as f:
+                results = json.load(f)['results']
+        finally:
+            os.remove(out_path)
+        detector = results.get('detector', {})
+        runs = detector.get('runs', [])
+        if not runs:
+            summary[name] = {'skipped': detector.get('skipped') or detector.get('error')}
+            continue
+        single = [r for r in runs if r['batch'] == 1]
+        ocr_p50 = {k: v['p50_ms'] for k, v in results.get('ocr', {}).items() if 'p50_ms' in v}
+        summary[name] = {
+            'first_call_ms': detector['first_call_ms'],
+            'best_p50_ms': min(r['p50_ms'] for r in single) if single else None,
+            'max_throughput_per_s': max(r['throughput_per_s'] for r in runs),
+            # 按输入尺寸分别记录，对比时只比较相同 imgsz 的结果
+            'p50_ms_by_imgsz': {str(r['imgsz']): r['p50_ms'] for r in single},
+            'throughput_by_imgsz': {str(imgsz): max(r['throughput_per_s'] for r in runs if r['imgsz'] == imgsz)
+                                    for imgsz in {r['imgsz'] for r in runs}},
+            'ocr_p50_ms': ocr_p50,
+        }
+        print(f"profile {name}: 首次调用 {summary[name]['first_call_ms']:.1f}ms, "
+              f"单帧 p50 {summary[name]['best_p50_ms']}ms, 吞吐 {summary[name]['max_throughput_per_s']:.1f} 帧/秒")
+
+    # default 测了多个输入尺寸，取与各配置档相同 imgsz 的结果对比，避免拿固定尺寸去比 default 的最优尺寸
+    base = summary.get('default', {})
+    for name, stats in summary.items():
+        if name == 'default' or 'p50_ms_by_imgsz' not in stats or 'p50_ms_by_imgsz' not in base:
+            continue
+        shared = sorted(set(stats['throughput_by_imgsz']) & set(base['throughput_by_imgsz']), key=int)
+        if not shared:
+            stats['vs_default'] = '没有相同的 imgsz，无法对比'
+            continue
+        imgsz = shared[-1]
+        stats['compared_at_imgsz'] = int(imgsz)
+        if imgsz in stats['p50_ms_by_imgsz'] and imgsz in base['p50_ms_by_imgsz']:
+            stats['latency_speedup_vs_default'] = (base['p50_ms_by_imgsz'][imgsz]
+                                                   / max(stats['p50_ms_by_imgsz'][imgsz], 1e-9))
+        stats['throughput_speedup_vs_default'] = (stats['throughput_by_imgsz'][imgsz]
+                                                  / max(base['throughput_by_imgsz'][imgsz], 1e-9))
+    return summary
+
+
+BENCHMARKS = {
+    'detector': bench_detector,
+    'ocr': bench_ocr,
+    'backend': bench_backend,
+    'annotate': bench_annotate,
+    'profiles': bench_profiles,
+}
+
+
+def environment_info():
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+    }
+    for module in ('torch', 'ultralytics', 'paddle', 'paddleocr', 'paddlehub'):
+        try:
+            info[module] = __import__(module).__version__
+        except Exception:
+            info[module] = None
+    return info
+
+
+def main():
+    parser = argparse.ArgumentParser(description="车牌识别系统性能基准测试")
+    parser.add_argument('--out', default='bench_results.json', help='结果 JSON 文件')
+    parser.add_argument('--only', default=','.join(BENCHMARKS), help='逗号分隔的基准项目')
+    parser.add_argument('--seed', type=int, default=0, help='合成数据随机种子')
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    profile = apply_profile(args.profile)
+    cv2.setRNGSeed(args.seed)
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'seed': args.seed,
+        'profile': profile.to_dict(),
+        'environment': environment_info(),
+        'results': {},
+    }
+    for name in args.only.split(','):
+        name = name.strip()
+        if name not in BENCHMARKS:
+            print(f"未知的基准项目: {name}")
+            continue
+        print(f"\n=== {name} ===")
+        rng = np.random.default_rng(args.seed)
+        try:
+            report['results'][name] = BENCHMARKS[name](rng, profile)
+        except Exception as e:
+            print(f"{name} 基准失败: {e}")
+            report['results'][name] = {'error': str(e)}
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入 {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+# coding:utf-8
+"""
+CCPD 文件名解析与列式数据集索引
+CCPD 的标注全部编码在文件名中，例如:
+    025-95_113-154&383_386&473-386&473_177&454_154&383_363&402-0_0_22_27_27_33_16-37-15.jpg
+依次为: 车牌面积占比-水平_垂直倾角-左上&右下框-四个角点(从右下开始顺时针)-字符下标-亮度-模糊度
+
+CcpdIndex 把整个数据集的所有字段解析成 NumPy 列，保存为一个 .npz 文件，
+检测标签、OCR 截图与评估真值都从同一个索引读取，不再逐文件读写文本。
+用法:
+    index = build_index(['ccpd_green/train', 'ccpd_green/val'], 'ccpd_index.npz')
+    index = CcpdIndex.load('ccpd_index.npz')
+    subset = index.subset(split='val', province='皖', max_blur=50)
+    labels = subset.yolo_labels()      # (N, 4) 归一化 cx, cy, w, h
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+PROVINCES = ["皖", "沪", "津", "渝", "冀", "晋", "蒙", "辽", "吉", "黑", "苏", "浙", "京", "闽", "赣", "鲁",
+             "豫", "鄂", "湘", "粤", "桂", "琼", "川", "贵", "云", "藏", "陕", "甘", "青", "宁", "新", "警",
+             "学", "O"]
+ALPHABETS = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'J', 'K', 'L', 'M', 'N', 'P', 'Q', 'R', 'S', 'T',
+             'U', 'V', 'W', 'X', 'Y', 'Z', 'O']
+ADS = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'J', 'K', 'L', 'M', 'N', 'P', 'Q', 'R', 'S', 'T', 'U',
+       'V', 'W', 'X', 'Y', 'Z', '0', '1', '2', '3', '4', '5', '6', '7', '8', '9', 'O']
+
+
+def plate_text(indices) -> str:
+    """字符下标 -> 车牌号：第 1 位省份，第 2 位字母，其余为字母或数字（绿牌共 8 位）"""
+    indices = [int(i) for i in indices]
+    return PROVINCES[indices[0]] + ALPHABETS[indices[1]] + "".join(ADS[i] for i in indices[2:])
+
+
+def parse_ccpd_name(filename: str) -> Optional[Dict]:
+    """
+    解析 CCPD 文件名，不是 CCPD 格式时返回 None
+    Returns:
+        {'area': 车牌面积占整图的百分比, 'tilt': (水平, 垂直), 'box': [x1, y1, x2, y2],
+         'corners': 4x2 数组（左上、右上、右下、左下，可直接传给 crop_plates），
+         'chars': 字符下标列表, 'text', 'brightness', 'blur'}
+    """
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    fields = stem.split('-')
+    if len(fields) < 7:
+        return None
+    try:
+        horizontal, vertical = fields[1].split('_', 1)
+        lt, rb = fields[2].split('_', 1)
+        box = [int(v) for v in lt.split('&')] + [int(v) for v in rb.split('&')]
+        chars = [int(v) for v in fields[4].split('_')]
+        points = np.array([[int(v) for v in p.split('&')] for p in fields[3].split('_')], dtype=np.float32)
+        return {
+            # CCPD2019 为 '025'，CCPD2020 为 '0136360677083'，前两位都是百分比的整数部分
+            'area': int(fields[0]) / 10 ** (len(fields[0]) - 2),
+            'tilt': (int(horizontal), int(vertical)),
+            'box': box,
+            # 文件名中的顺序为右下、左下、左上、右上
+            'corners': points[[2, 3, 0, 1]],
+            'chars': chars,
+            'text': plate_text(chars),
+            'brightness': int(fields[5]),
+            'blur': int(fields[6]),
+        }
+    except (ValueError, IndexError):
+        return None
+
+
+# 绿牌 8 位，蓝牌 7 位；不足 8 位的用 -1 填充
+MAX_CHARS = 8
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def _parse_chunk(paths: List[str]) -> List[Optional[Dict]]:
+    """工作进程：解析文件名并只读文件头得到图片尺寸"""
+    from PIL import Image
+    rows = []
+    for path in paths:
+        info = parse_ccpd_name(path)
+        if info is None:
+            rows.append(None)
+            continue
+        try:
+            with Image.open(path) as img:
+                info['size'] = img.size
+        except OSError:
+            info['size'] = (0, 0)  # 无法读取的图片，build_index 时丢弃
+        rows.append(info)
+    return rows
+
+
+class CcpdIndex:
+    """CCPD 数据集的列式索引，每个字段一列，下标对齐"""
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns['path'])
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get('columns')
+        if columns is not None and name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict]) -> 'CcpdIndex':
+        n = len(rows)
+        chars = np.full((n, MAX_CHARS), -1, dtype=np.int8)
+        for i, r in enumerate(rows):
+            chars[i, :len(r['chars'])] = r['chars'][:MAX_CHARS]
+        return cls({
+            'path': np.array([r['path'] for r in rows], dtype=str),
+            'split': np.array([r['split'] for r in rows], dtype=str),
+            'area': np.array([r['area'] for r in rows], dtype=np.float32),
+            'tilt': np.array([r['tilt'] for r in rows], dtype=np.int16).reshape(n, 2),
+            'box': np.array([r['box'] for r in rows], dtype=np.int32).reshape(n, 4),
+            'corners': np.array([r['corners'] for r in rows], dtype=np.float32).reshape(n, 4, 2),
+            'chars': chars,
+            'text': np.array([r['text'] for r in rows], dtype=str),
+            'brightness': np.array([r['brightness'] for r in rows], dtype=np.int16),
+            'blur': np.array([r['blur'] for r in rows], dtype=np.int16),
+            'width': np.array([r['size'][0] for r in rows], dtype=np.int32),
+            'height': np.array([r['size'][1] for r in rows], dtype=np.int32),
+        })
+
+    # --------- 持久化 ----------
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, **self.columns)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'CcpdIndex':
+        with np.load(path, allow_pickle=False) as data:
+            return cls({name: data[name] for name in data.files})
+
+    # --------- 筛选 ----------
+    def take(self, indices) -> 'CcpdIndex':
+        """按下标或布尔掩码取子集"""
+        return CcpdIndex({name: column[indices] for name, column in self.columns.items()})
+
+    def mask(self, split: str = None, province: str = None, text_prefix: str = None, num_chars: int = None,
+             min_area: float = None, max_tilt: int = None, min_brightness: int = None,
+             max_brightness: int = None, max_blur: int = None) -> np.ndarray:
+        """各条件取交集的布尔掩码，未给出的条件不过滤"""
+        keep = np.ones(len(self), dtype=bool)
+        if split is not None:
+            keep &= self.columns['split'] == split
+        if province is not None:
+            keep &= self.columns['chars'][:, 0] == PROVINCES.index(province)
+        if text_prefix is not None:
+            keep &= np.char.startswith(self.columns['text'], text_prefix)
+        if num_chars is not None:
+            keep &= (self.columns['chars'] >= 0).sum(axis=1) == num_chars
+        if min_area is not None:
+            keep &= self.columns['area'] >= min_area
+        if max_tilt is not None:
+            # 倾角以 90 度为正对
+            keep &= (np.abs(self.columns['tilt'] - 90) <= max_tilt).all(axis=1)
+        if min_brightness is not None:
+            keep &= self.columns['brightness'] >= min_brightness
+        if max_brightness is not None:
+            keep &= self.columns['brightness'] <= max_brightness
+        if max_blur is not None:
+            keep &= self.columns['blur'] <= max_blur
+        return keep
+
+    def subset(self, **filters) -> 'CcpdIndex':
+        """按条件筛选子集，参数同 mask"""
+        return self.take(np.flatnonzero(self.mask(**filters)))
+
+    # --------- 下游使用 ----------
+    def yolo_labels(self) -> np.ndarray:
+        """检测标签：(N, 4) 归一化 cx, cy, w, h（单类别）"""
+        box = self.columns['box'].astype(np.float64)
+        size = np.stack([self.columns['width'], self.columns['height']], axis=1).astype(np.float64)
+        centers = (box[:, :2] + box[:, 2:]) / 2 / size
+        wh = (box[:, 2:] - box[:, :2]) / size
+        return np.concatenate([centers, wh], axis=1).astype(np.float32)
+
+    def lookup(self, paths: Iterable[str]) -> np.ndarray:
+        """文件名 -> 索引下标，不在索引中的为 -1"""
+        queries = np.array([os.path.basename(p) for p in paths], dtype=str)
+        if len(self) == 0:
+            return np.full(len(queries), -1, dtype=np.int64)
+        names = np.char.rpartition(np.char.replace(self.columns['path'], '\\', '/'), '/')[:, 2]
+        order = np.argsort(names)
+        sorted_names = names[order]
+        pos = np.minimum(np.searchsorted(sorted_names, queries), len(names) - 1)
+        return np.where(sorted_names[pos] == queries, order[pos], -1)
+
+
+def build_index(image_dirs, out_path: str = None, workers: int = None, chunk_size: int = 2000) -> CcpdIndex:
+    """
+    并行扫描若干 CCPD 目录建立索引；split 取自目录名（train / val / test）
+    非 CCPD 文件名与无法读取的图片会被跳过
+    """
+    if isinstance(image_dirs, str):
+        image_dirs = [image_dirs]
+    paths, splits = [], []
+    for image_dir in image_dirs:
+        split = os.path.basename(os.path.normpath(image_dir))
+        for entry in os.scandir(image_dir):
+            if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTS):
+                paths.append(entry.path)
+                splits.append(split)
+
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for start, parsed in zip(range(0, len(paths), chunk_size), pool.map(_parse_chunk, chunks)):
+            for offset, info in enumerate(parsed):
+                if info is None or info['size'][0] == 0:
+                    continue
+                info['path'] = paths[start + offset]
+                info['split'] = splits[start + offset]
+                rows.append(info)
+    index = CcpdIndex.from_rows(rows)
+    print(f"CCPD 索引: {len(index)} 张图片（共扫描 {len(paths)} 个文件）")
+    if out_path:
+        index.save(out_path)
+    return index
@@ -6,6 +6,10 @@ from PIL import ImageFont
 from paddleocr import PaddleOCR
 import glob
 import os
+from pipeline_metrics import metrics
+from result_cache import DetectionCache
+from ocr_memo import OcrMemo
+from perf_profiles import apply_profile
 
 def get_license_result(ocr, image):
     """
@@ -25,63 +29,102 @@ def get_license_result(ocr, image):
         print(f"OCR识别出错: {e}")
         return None, None
 
-def process_image(img_path, model, ocr, fontC):
+def recognize_plates(img_path, now_img, model, ocr, cache=None, memo=None, predict_kwargs=None):
+    """
+    检测并识别单张图片中的车牌
+    memo: 可选的 OcrMemo，上一帧同一位置、截图没有变化的车牌复用上次的识别结果
+    predict_kwargs: 性能配置档给出的检测参数（imgsz 等）
+    返回: 车牌框列表, 车牌号列表, 置信度列表
+    """
+    with metrics.stage('yolo'):
+        results = model(img_path, **(predict_kwargs or {}))[0]
+
+    # 检查是否有检测结果
+    if results.boxes is None or len(results.boxes) == 0:
+        return [], [], []
+
+    # 截取每个车牌区域的照片（裁剪到图像范围内并标准化为 240x80）
+    with metrics.stage('crop'):
+        crops, boxes, valid = tools.crop_plates(now_img, results.boxes.xyxy)
+    license_imgs = crops[valid]
+    location_list = boxes[valid].tolist()
+    print(f"检测到 {len(location_list)} 个车牌区域")
+    metrics.count('plates', len(license_imgs))
+
+    # 车牌识别结果；本帧没有再出现的车牌框对应的记忆立即作废
+    if memo is not None:
+        memo.begin_frame(location_list)
+    lisence_res = []
+    conf_list = []
+    for i, (each, box) in enumerate(zip(license_imgs, location_list)):
+        cached = cache.get_crop(each) if cache is not None else None
+        if cached is None and memo is not None:
+            cached = memo.lookup(each, box)
+        if cached is not None:
+            license_num, conf = cached
+        else:
+            with metrics.stage('ocr'):
+                license_num, conf = get_license_result(ocr, each)
+            if license_num and cache is not None:
+                cache.put_crop(each, license_num, conf)
+            if memo is not None:
+                memo.store(each, box, license_num, conf)
+        if license_num:
+            lisence_res.append(license_num)
+            conf_list.append(conf)
+            print(f"车牌 {i+1}: {license_num} (置信度: {conf:.2f})")
+        else:
+            lisence_res.append('无法识别')
+            conf_list.append(0)
+            metrics.count('ocr_failures')
+            print(f"车牌 {i+1}: 无法识别")
+    return location_list, lisence_res, conf_list
+
+def process_image(img_path, model, ocr, fontC, cache=None, memo=None, predict_kwargs=None):
     """
     处理单张图片
+    cache: 可选的 DetectionCache，内容相同的图片与车牌截图直接复用结果
+    memo: 可选的 OcrMemo，见 recognize_plates
     """
     print(f"正在处理图片: {img_path}")
     
     # 读取图片
-    now_img = tools.img_cvread(img_path)
+    with metrics.stage('decode'):
+        now_img = tools.img_cvread(img_path)
+    metrics.count('frames')
     if now_img is None:
         print(f"无法读取图片: {img_path}")
         return
     
     try:
-        # 检测图片
-        results = model(img_path)[0]
-        
-        # 检查是否有检测结果
-        if results.boxes is None or len(results.boxes) == 0:
+        cached = None
+        if cache is not None:
+            # 按文件内容精确命中
+            cached = cache.get_file(img_path)
+        if cached is not None:
+            metrics.count('cache_hits')
+            location_list, lisence_res = cached['boxes'], cached['texts']
+        else:
+            location_list, lisence_res, conf_list = recognize_plates(img_path, now_img, model, ocr, cache, memo,
+                                                                     predict_kwargs)
+            if cache is not None:
+                result = {'boxes': location_list, 'texts': lisence_res, 'confs': conf_list}
+                cache.put_file(img_path, result)
+
+        if not location_list:
             print(f"在图片 {img_path} 中未检测到车牌")
             return
-            
-        location_list = results.boxes.xyxy.tolist()
-        
-        if len(location_list) >= 1:
-            location_list = [list(map(int, e)) for e in location_list]
-            print(f"检测到 {len(location_list)} 个车牌区域")
-            
-            # 截取每个车牌区域的照片
-            license_imgs = []
-            for each in location_list:
-                x1, y1, x2, y2 = each
-                cropImg = now_img[y1:y2, x1:x2]
-                license_imgs.append(cropImg)
-                
-            # 车牌识别结果
-            lisence_res = []
-            conf_list = []
-            for i, each in enumerate(license_imgs):
-                license_num, conf = get_license_result(ocr, each)
-                if license_num:
-                    lisence_res.append(license_num)
-                    conf_list.append(conf)
-                    print(f"车牌 {i+1}: {license_num} (置信度: {conf:.2f})")
-                else:
-                    lisence_res.append('无法识别')
-                    conf_list.append(0)
-                    print(f"车牌 {i+1}: 无法识别")
                     
-            # 在图片上标注结果
+        # 在图片上标注结果
+        with metrics.stage('annotate'):
             for text, box in zip(lisence_res, location_list):
                 now_img = tools.drawRectBox(now_img, box, text, fontC)
-            
-            # 调整显示尺寸
-            now_img = cv2.resize(now_img, dsize=None, fx=0.5, fy=0.5, interpolation=cv2.INTER_LINEAR)
-            cv2.imshow(f"Detection - {os.path.basename(img_path)}", now_img)
-            cv2.waitKey(0)
-            cv2.destroyAllWindows()
+        
+        # 调整显示尺寸
+        now_img = cv2.resize(now_img, dsize=None, fx=0.5, fy=0.5, interpolation=cv2.INTER_LINEAR)
+        cv2.imshow(f"Detection - {os.path.basename(img_path)}", now_img)
+        cv2.waitKey(0)
+        cv2.destroyAllWindows()
             
     except Exception as e:
         print(f"处理图片 {img_path} 时出错: {e}")
@@ -107,9 +150,10 @@ if __name__ == "__main__":
         print(f"模型文件不存在: {model_path}")
         exit(1)
         
-    # 加载预训练模型
+    # 加载预训练模型；性能配置档由环境变量 PLATE_PERF_PROFILE 选择
+    profile = apply_profile()
     try:
-        model = YOLO(model_path, task='detect')
+        model = profile.load_model(model_path)
         print("YOLO模型加载成功")
     except Exception as e:
         print(f"YOLO模型加载失败: {e}")
@@ -128,8 +172,8 @@ if __name__ == "__main__":
             pattern = os.path.join(root, ext)
             image_files.extend(glob.glob(pattern))
     
-    # 去重并过滤
-    image_files = list(set(image_files))
+    # 去重并过滤（glob 与 os.walk 会以 ./a.jpg 和 a.jpg 两种形式收集同一文件）
+    image_files = sorted(set(os.path.normpath(f) for f in image_files))
     image_files = [f for f in image_files if os.path.isfile(f)]
     
     if not image_files:
@@ -141,7 +185,12 @@ if __name__ == "__main__":
             print(f"  - {img_file}")
         
         print("\n开始处理图片...")
+        cache = DetectionCache(persist_path=".cache/demo_results.json")
+        memo = OcrMemo()
         for img_path in image_files:
-            process_image(img_path, model, ocr, fontC)
+            process_image(img_path, model, ocr, fontC, cache, memo, profile.predict_kwargs())
+        cache.save()
             
-    print("处理完成！")
\ No newline at end of file
+    print("处理完成！")
+    metrics.report()
+    metrics.write_prometheus()
\ No newline at end of file
@@ -5,6 +5,8 @@ import numpy as np
 from PIL import Image,ImageDraw,ImageFont
 import csv
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # fontC = ImageFont.truetype("Font/platech.ttf", 20, 0)
 
@@ -45,13 +47,137 @@ def drawRectBox(image, rect, addText, fontC, color=(0,0,255)):
     return imagex
 
 
-def img_cvread(path):
-    # 读取含中文名的图片文件
+# 缩小解码倍数对应的 imdecode 标志
+REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def img_cvread(path, reduce=1):
+    """
+    读取含中文名的图片文件
+    文件以内存映射方式交给 imdecode，不再额外分配一份文件大小的缓冲区
+    :param reduce: 缩小解码倍数 1/2/4/8，JPEG 可在解码阶段直接降采样，
+                   结果坐标需乘以 reduce 才能对应原图
+    """
     # img = cv2.imread(path)
-    img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if os.path.getsize(path) == 0:
+        return None
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    img = cv2.imdecode(data, REDUCED_FLAGS[reduce])
+    del data
     return img
 
 
+def choose_reduction(path, target_size=640):
+    """
+    只读取文件头得到图片尺寸，返回缩小后长边仍不小于 target_size 的最大倍数
+    用于直接送入 640 letterbox 的场景
+    """
+    with Image.open(path) as img:
+        long_side = max(img.size)
+    for reduce in (8, 4, 2):
+        if long_side // reduce >= target_size:
+            return reduce
+    return 1
+
+
+def img_cvread_batch(paths, reduce=1, max_workers=None):
+    """线程池并行解码（imdecode 会释放 GIL），按输入顺序返回"""
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        return list(pool.map(lambda p: img_cvread(p, reduce), paths))
+
+
+def img_cvread_iter(paths, reduce=1, max_workers=None, prefetch=None):
+    """
+    边处理边预读：后台线程池保持 prefetch 张图片在解码中，按顺序逐张产出 (路径, 图片)
+    """
+    max_workers = max_workers or os.cpu_count()
+    prefetch = prefetch or max_workers * 2
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append((path, pool.submit(img_cvread, path, reduce)))
+            if len(pending) >= prefetch:
+                done_path, future = pending.popleft()
+                yield done_path, future.result()
+        while pending:
+            done_path, future = pending.popleft()
+            yield done_path, future.result()
+
+
+# 车牌截图标准尺寸 (宽, 高)
+PLATE_SIZE = (240, 80)
+
+
+def _as_numpy(array):
+    """兼容 torch 张量（results.boxes.xyxy）与列表"""
+    if hasattr(array, 'cpu'):
+        array = array.cpu().numpy()
+    return np.asarray(array, dtype=np.float32)
+
+
+def clamp_boxes(boxes, img_shape):
+    """
+    把 [x1, y1, x2, y2] 框批量裁剪到图像范围内
+    :return: int32 框数组 (N, 4)，以及面积大于零的有效框掩码
+    """
+    boxes = np.round(_as_numpy(boxes).reshape(-1, 4)).astype(np.int32)
+    height, width = img_shape[:2]
+    boxes[:, 0::2] = np.clip(boxes[:, 0::2], 0, width)
+    boxes[:, 1::2] = np.clip(boxes[:, 1::2], 0, height)
+    valid = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+    return boxes, valid
+
+
+def crop_plates(image, boxes, corners=None, size=PLATE_SIZE, out=None):
+    """
+    批量截取并标准化车牌区域
+    :param image: 原始图像
+    :param boxes: 车牌框 (N, 4)，可直接传入 results.boxes.xyxy
+    :param corners: 可选的车牌四角 (N, 4, 2)，顺序为左上、右上、右下、左下，提供时做透视校正
+    :param size: 输出尺寸 (宽, 高)
+    :param out: 可复用的预分配缓冲区 (M, 高, 宽, 3)，M >= N
+    :return: 截图 (N, 高, 宽, 3)、裁剪后的 int 框 (N, 4)、有效框掩码 (N,)
+    """
+    boxes, valid = clamp_boxes(boxes, image.shape)
+    n = len(boxes)
+    width, height = size
+    if out is None or out.shape[0] < n or out.shape[1:] != (height, width, 3):
+        out = np.empty((n, height, width, 3), dtype=np.uint8)
+    crops = out[:n]
+    crops[~valid] = 0
+
+    if corners is not None:
+        corners = _as_numpy(corners).reshape(-1, 4, 2).copy()
+        corners[..., 0] = np.clip(corners[..., 0], 0, image.shape[1] - 1)
+        corners[..., 1] = np.clip(corners[..., 1], 0, image.shape[0] - 1)
+        dst = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+        for i in np.flatnonzero(valid):
+            matrix = cv2.getPerspectiveTransform(corners[i], dst)
+            cv2.warpPerspective(image, matrix, size, dst=crops[i], flags=cv2.INTER_LINEAR,
+                                borderMode=cv2.BORDER_REPLICATE)
+        return crops, boxes, valid
+
+    # 所有框到输出尺寸的仿射矩阵一次性算出（与 cv2.resize 相同的像素中心对齐），
+    # 每个框只需一次 warpAffine，结果直接写入缓冲区
+    box_w = np.maximum(boxes[:, 2] - boxes[:, 0], 1).astype(np.float64)
+    box_h = np.maximum(boxes[:, 3] - boxes[:, 1], 1).astype(np.float64)
+    sx, sy = width / box_w, height / box_h
+    matrices = np.zeros((n, 2, 3), dtype=np.float64)
+    matrices[:, 0, 0] = sx
+    matrices[:, 1, 1] = sy
+    matrices[:, 0, 2] = 0.5 * sx - 0.5 - boxes[:, 0] * sx
+    matrices[:, 1, 2] = 0.5 * sy - 0.5 - boxes[:, 1] * sy
+    for i in np.flatnonzero(valid):
+        cv2.warpAffine(image, matrices[i], size, dst=crops[i], flags=cv2.INTER_LINEAR,
+                       borderMode=cv2.BORDER_REPLICATE)
+    return crops, boxes, valid
+
+
 def draw_boxes(img, boxes):
     for each in boxes:
         x1 = each[0]
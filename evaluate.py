@@ -0,0 +1,350 @@
+# coding:utf-8
+"""
+检测器评估：精度与速度的权衡
+在 datasets/PlateData 的 val/test 上扫描推理设置：
+    imgsz、置信度阈值、NMS IoU 阈值、batch、模型格式（PyTorch / ONNX / ONNX 动态 int8 量化）
+每组设置输出 mAP50、precision/recall、端到端车牌号准确率（与 CCPD 文件名中的字符比对）、
+单张延迟分位数与吞吐，汇总为一张表并写入 JSON。
+
+用法:
+    python evaluate.py --model models/best.pt --split val --imgsz 320,480,640 --batch 1,8 \
+                       --formats pt,onnx,onnx-int8 --ocr hub --out eval_results.json
+"""
+
+import argparse
+import glob
+import itertools
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import yaml
+from PIL import Image
+
+import detect_tools as tools
+from ccpd import CcpdIndex, parse_ccpd_name
+from ocr_executor import OcrExecutor
+from perf_profiles import add_profile_argument, apply_profile
+
+DATA_YAML = "datasets/PlateData/data.yaml"
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+# --------- 数据集 ----------
+def resolve_split_dir(data_yaml: str, split: str) -> str:
+    """data.yaml 中是训练机器上的绝对路径，不存在时退回数据集目录下的 images/<split>"""
+    with open(data_yaml, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    path = str(config.get(split) or '').strip()
+    root = config.get('path') or os.path.dirname(data_yaml)
+    if path and not os.path.isabs(path):
+        path = os.path.join(root, path)
+    if path and os.path.isdir(path):
+        return path
+    return os.path.join(os.path.dirname(data_yaml), 'images', split)
+
+
+def read_yolo_labels(label_path: str, img_shape) -> np.ndarray:
+    """YOLO 归一化 (cls cx cy w h) -> 像素 [x1, y1, x2, y2]"""
+    if not os.path.exists(label_path):
+        return None
+    rows = np.loadtxt(label_path, ndmin=2, dtype=np.float64)
+    if rows.size == 0:
+        return np.empty((0, 4), np.float32)
+    height, width = img_shape[:2]
+    cx, cy, w, h = rows[:, 1] * width, rows[:, 2] * height, rows[:, 3] * width, rows[:, 4] * height
+    return np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1).astype(np.float32)
+
+
+def image_shape(path: str):
+    """只读取文件头得到 (高, 宽)，无法识别的文件返回 None"""
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+            # imdecode 会按 EXIF 方向旋转图片，这里保持一致
+            if img.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                width, height = height, width
+    except Exception:
+        return None
+    return height, width
+
+
+def load_split(data_yaml: str, split: str, limit: int = None, index: CcpdIndex = None):
+    """
+    读取评估集：图片路径、尺寸、真值框与真值车牌号
+    给出 CCPD 索引时真值直接取自索引；否则优先 labels/*.txt，其次解析 CCPD 文件名
+    这里不解码图片，只读文件头取尺寸；图片在评估时按 batch 解码（iter_batches），整个评估集不会同时驻留内存
+    """
+    image_dir = resolve_split_dir(data_yaml, split)
+    paths = sorted(p for p in glob.glob(os.path.join(image_dir, '*')) if p.lower().endswith(IMAGE_EXTS))
+    if limit:
+        paths = paths[:limit]
+    rows = index.lookup(paths) if index is not None else np.full(len(paths), -1)
+    samples = []
+    for path, row in zip(paths, rows):
+        shape = image_shape(path)
+        if shape is None:
+            continue
+        if row >= 0:
+            samples.append({'path': path, 'shape': shape, 'boxes': index.box[row:row + 1].astype(np.float32),
+                            'text': str(index.text[row])})
+            continue
+        ccpd = parse_ccpd_name(path)
+        label_path = os.path.splitext(path.replace(os.sep + 'images' + os.sep, os.sep + 'labels' + os.sep))[0] + '.txt'
+        boxes = read_yolo_labels(label_path, shape)
+        if boxes is None:
+            boxes = np.array([ccpd['box']], np.float32) if ccpd else np.empty((0, 4), np.float32)
+        samples.append({'path': path, 'shape': shape, 'boxes': boxes,
+                        'text': ccpd['text'] if ccpd else None})
+    print(f"评估集 {image_dir}: {len(samples)} 张图片")
+    return samples
+
+
+def iter_batches(samples, batch: int):
+    """后台线程预读解码，按 batch 逐批产出 (样本列表, 图片列表)；解码失败的图片连同样本一起跳过"""
+    chunk_samples, chunk_images = [], []
+    decoded = tools.img_cvread_iter([s['path'] for s in samples], prefetch=max(batch * 2, 8))
+    for sample, (_, img) in zip(samples, decoded):
+        if img is None:
+            print(f"无法读取图片: {sample['path']}")
+            continue
+        chunk_samples.append(sample)
+        chunk_images.append(img)
+        if len(chunk_images) == batch:
+            yield chunk_samples, chunk_images
+            chunk_samples, chunk_images = [], []
+    if chunk_images:
+        yield chunk_samples, chunk_images
+
+
+# --------- 指标 ----------
+def box_iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """(N, 4) 与 (M, 4) 框的两两交并比"""
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def match_predictions(pred_boxes, pred_scores, gt_boxes, iou_threshold=0.5) -> np.ndarray:
+    """按置信度从高到低贪心匹配，返回每个预测框是否为 TP"""
+    tp = np.zeros(len(pred_boxes), dtype=bool)
+    if len(pred_boxes) == 0 or len(gt_boxes) == 0:
+        return tp
+    ious = box_iou_matrix(pred_boxes, gt_boxes)
+    matched = np.zeros(len(gt_boxes), dtype=bool)
+    for i in np.argsort(-pred_scores):
+        candidates = np.where(~matched, ious[i], 0)
+        j = int(np.argmax(candidates))
+        if candidates[j] >= iou_threshold:
+            tp[i] = True
+            matched[j] = True
+    return tp
+
+
+def average_precision(tp: np.ndarray, scores: np.ndarray, num_gt: int):
+    """COCO 式 101 点插值 AP，以及全部预测下的 precision / recall"""
+    if num_gt == 0:
+        return 0.0, 0.0, 0.0
+    order = np.argsort(-scores)
+    tp = tp[order].astype(np.float64)
+    tp_cum = np.cumsum(tp)
+    fp_cum = np.cumsum(1 - tp)
+    recall = tp_cum / num_gt
+    precision = tp_cum / np.maximum(tp_cum + fp_cum, 1e-9)
+    # 精度包络：从右往左取最大值
+    envelope = np.maximum.accumulate(np.concatenate([[0.0], precision, [0.0]])[::-1])[::-1]
+    recall_points = np.concatenate([[0.0], recall, [1.0]])
+    grid = np.linspace(0, 1, 101)
+    idx = np.searchsorted(recall_points, grid, side='left')
+    ap = float(envelope[idx].mean())
+    p = float(precision[-1]) if len(precision) else 0.0
+    r = float(recall[-1]) if len(recall) else 0.0
+    return ap, p, r
+
+
+def text_accuracy(predicted, expected):
+    """整牌准确率与逐字符准确率（只统计有真值车牌号的图片）"""
+    pairs = [(p or '', e) for p, e in zip(predicted, expected) if e]
+    if not pairs:
+        return None, None
+    exact = sum(p == e for p, e in pairs) / len(pairs)
+    chars = sum(sum(a == b for a, b in zip(p, e)) / max(len(p), len(e)) for p, e in pairs) / len(pairs)
+    return exact, chars
+
+
+# --------- 模型 ----------
+def load_model(model_path: str, fmt: str):
+    """
+    fmt: 'pt' 原始 PyTorch 权重；'onnx' 导出的 FP32 ONNX；
+         'onnx-int8' 在 ONNX 基础上做 onnxruntime 动态 int8 量化
+    导出结果放在权重旁边，已存在时直接复用
+    """
+    from ultralytics import YOLO
+    if fmt == 'pt':
+        return YOLO(model_path, task='detect')
+    stem = os.path.splitext(model_path)[0]
+    onnx_path = stem + '.onnx'
+    if not os.path.exists(onnx_path):
+        onnx_path = YOLO(model_path, task='detect').export(format='onnx', dynamic=True, simplify=True)
+    if fmt == 'onnx':
+        return YOLO(onnx_path, task='detect')
+    if fmt == 'onnx-int8':
+        int8_path = stem + '_int8.onnx'
+        if not os.path.exists(int8_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QUInt8)
+        return YOLO(int8_path, task='detect')
+    raise ValueError(f"不支持的模型格式: {fmt}")
+
+
+def run_config(model, samples, imgsz, batch, conf, iou, device, ocr=None):
+    """
+    按一组设置跑完整个评估集，返回指标
+    图片逐批解码，计时只包含模型推理；需要评估车牌号时只保留每张图最佳框的 240x80 截图
+    """
+    batches = iter_batches(samples, batch)
+    first = next(batches, None)
+    if first is None:
+        raise ValueError("评估集中没有可解码的图片")
+    # 预热一次，避免把首次图优化/内存分配算进延迟
+    model(first[1], imgsz=imgsz, conf=conf, iou=iou, device=device, verbose=False)
+
+    tp_all, score_all, num_gt, batch_seconds = [], [], 0, []
+    crops, texts_expected = [], []
+    for chunk_samples, chunk_images in itertools.chain([first], batches):
+        t0 = time.perf_counter()
+        results = model(chunk_images, imgsz=imgsz, conf=conf, iou=iou, device=device, verbose=False)
+        batch_seconds.append((time.perf_counter() - t0, len(chunk_images)))
+        for sample, img, result in zip(chunk_samples, chunk_images, results):
+            boxes, scores = result.boxes.xyxy.cpu().numpy(), result.boxes.conf.cpu().numpy()
+            tp_all.append(match_predictions(boxes, scores, sample['boxes']))
+            score_all.append(scores)
+            num_gt += len(sample['boxes'])
+            if ocr is None or sample['text'] is None:
+                continue
+            # 端到端：每张图取置信度最高的框，截图标准化后识别
+            texts_expected.append(sample['text'])
+            crop = None
+            if len(boxes):
+                best = int(np.argmax(scores))
+                plate, _, valid = tools.crop_plates(img, boxes[best:best + 1])
+                if valid[0]:
+                    crop = plate[0]
+            crops.append(crop)
+    map50, precision, recall = average_precision(np.concatenate(tp_all), np.concatenate(score_all), num_gt)
+
+    images = sum(n for _, n in batch_seconds)
+    per_image_ms = np.concatenate([np.full(n, seconds / n * 1000) for seconds, n in batch_seconds])
+    total_seconds = sum(seconds for seconds, _ in batch_seconds)
+    row = {
+        'map50': map50,
+        'precision': precision,
+        'recall': recall,
+        'p50_ms': float(np.percentile(per_image_ms, 50)),
+        'p95_ms': float(np.percentile(per_image_ms, 95)),
+        'throughput_per_s': images / max(total_seconds, 1e-9),
+        'plate_accuracy': None,
+        'char_accuracy': None,
+    }
+
+    if ocr is not None:
+        owners = [i for i, crop in enumerate(crops) if crop is not None]
+        texts = [None] * len(crops)
+        for idx, (text, _) in zip(owners, ocr.map([crops[i] for i in owners])):
+            texts[idx] = text.replace('·', '').replace(' ', '') if text else None
+        row['plate_accuracy'], row['char_accuracy'] = text_accuracy(texts, texts_expected)
+    return row
+
+
+def format_table(rows) -> str:
+    header = f"{'格式':<10}{'imgsz':>6}{'batch':>6}{'conf':>6}{'iou':>6}{'mAP50':>8}{'P':>7}{'R':>7}" \
+             f"{'整牌':>7}{'字符':>7}{'p50ms':>8}{'p95ms':>8}{'张/秒':>8}"
+    lines = [header, '-' * 96]
+
+    def pct(value):
+        return f"{value:>7.3f}" if value is not None else f"{'-':>7}"
+
+    for r in rows:
+        lines.append(f"{r['format']:<10}{r['imgsz']:>6}{r['batch']:>6}{r['conf']:>6.2f}{r['iou']:>6.2f}"
+                     f"{r['map50']:>8.3f}{r['precision']:>7.3f}{r['recall']:>7.3f}"
+                     f"{pct(r['plate_accuracy'])}{pct(r['char_accuracy'])}"
+                     f"{r['p50_ms']:>8.1f}{r['p95_ms']:>8.1f}{r['throughput_per_s']:>8.1f}")
+    return '\n'.join(lines)
+
+
+def _parse_list(text, cast):
+    return [cast(v) for v in text.split(',') if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="车牌检测器精度/速度评估")
+    parser.add_argument('--model', default='models/best.pt')
+    parser.add_argument('--data', default=DATA_YAML)
+    parser.add_argument('--split', default='val', choices=['val', 'test'])
+    parser.add_argument('--limit', type=int, default=None, help='只评估前 N 张图片')
+    parser.add_argument('--index', default=None, help='CCPD 索引 (.npz)，提供时真值取自索引')
+    parser.add_argument('--imgsz', default='320,480,640')
+    parser.add_argument('--conf', default='0.25')
+    parser.add_argument('--iou', default='0.7')
+    parser.add_argument('--batch', default='1,8')
+    parser.add_argument('--formats', default='pt,onnx,onnx-int8')
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--ocr', default='hub', help="OCR 引擎 'hub' / 'paddleocr'，'none' 不评估车牌号")
+    parser.add_argument('--ocr-workers', type=int, default=0, help='OCR 进程数，0 表示在当前进程内识别')
+    parser.add_argument('--out', default='eval_results.json')
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    # 格式与尺寸由本脚本扫描，配置档只决定线程数与 CPU 亲和性
+    perf = apply_profile(args.profile)
+
+    index = CcpdIndex.load(args.index) if args.index else None
+    samples = load_split(args.data, args.split, args.limit, index)
+    if not samples:
+        print("评估集为空")
+        return
+    ocr = None if args.ocr == 'none' else OcrExecutor(num_workers=args.ocr_workers, engine=args.ocr,
+                                                            threads=perf.ocr_threads)
+
+    rows = []
+    try:
+        for fmt in _parse_list(args.formats, str):
+            try:
+                model = load_model(args.model, fmt)
+            except Exception as e:
+                print(f"跳过格式 {fmt}: {e}")
+                continue
+            for imgsz, batch, conf, iou in itertools.product(
+                    _parse_list(args.imgsz, int), _parse_list(args.batch, int),
+                    _parse_list(args.conf, float), _parse_list(args.iou, float)):
+                row = {'format': fmt, 'imgsz': imgsz, 'batch': batch, 'conf': conf, 'iou': iou}
+                row.update(run_config(model, samples, imgsz, batch, conf, iou, args.device, ocr))
+                rows.append(row)
+                print(f"{fmt} imgsz={imgsz} batch={batch} conf={conf} iou={iou}: "
+                      f"mAP50={row['map50']:.3f}, {row['throughput_per_s']:.1f} 张/秒")
+    finally:
+        if ocr is not None:
+            ocr.close()
+
+    print()
+    print(format_table(rows))
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'model': args.model,
+        'split': args.split,
+        'images': len(samples),
+        'device': args.device,
+        'profile': perf.to_dict(),
+        'results': rows,
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入 {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+# coding:utf-8
+"""
+离线车牌截图提取
+把数据集中的车牌批量截取为透视校正后的 240x80 截图及其车牌号，用于 OCR 评估与微调。
+1. 车牌位置来自 CCPD 索引的四角标注（透视校正），或检测模型输出（框截取）
+2. 截图按分片写入可内存映射的 .npy 数组，不产生大量小 PNG
+3. 进程池并行，每个分片一个任务
+4. 已完成的分片记录在 manifest.json 中，中断后重新运行只处理剩余分片；
+   manifest 同时记录输入（索引/目录、split、图片列表摘要、检测参数），输入不同时拒绝续跑，避免混入两份数据
+用法:
+    python extract_crops.py --index ccpd_index.npz --split train --out crops/train
+    python extract_crops.py --images TestFiles --model models/best.pt --out crops/testfiles
+    shards = CropShards('crops/train'); crop, text = shards[0]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from perf_profiles import add_profile_argument, apply_profile
+
+PLATE_SHAPE = (80, 240, 3)  # 与 detect_tools.PLATE_SIZE 对应的 (高, 宽, 通道)
+TEXT_DTYPE = '<U10'
+
+_worker_model = None
+
+
+def _init_detector(model_path: Optional[str], imgsz: int, conf: float):
+    """进程池初始化：检测模式下每个进程只加载一次模型"""
+    global _worker_model
+    if model_path:
+        from ultralytics import YOLO
+        _worker_model = (YOLO(model_path, task='detect'), imgsz, conf)
+
+
+def _extract_shard(out_dir: str, shard_id: int, paths: List[str], texts: List[str],
+                   corners: Optional[np.ndarray]) -> Dict:
+    """
+    处理一个分片：解码图片、截取车牌，直接写进内存映射的分片文件
+    corners 为 None 时用检测模型取置信度最高的框
+    """
+    import detect_tools as tools
+
+    name = f"shard_{shard_id:05d}"
+    tmp_crops = os.path.join(out_dir, name + ".crops.tmp.npy")
+    crops = np.lib.format.open_memmap(tmp_crops, mode='w+', dtype=np.uint8, shape=(len(paths),) + PLATE_SHAPE)
+    kept = np.zeros(len(paths), dtype=bool)
+    size = (PLATE_SHAPE[1], PLATE_SHAPE[0])
+    for i, path in enumerate(paths):
+        img = tools.img_cvread(path)
+        if img is None:
+            continue
+        if corners is not None:
+            quad = corners[i:i + 1]
+            box = np.concatenate([quad.min(axis=1), quad.max(axis=1)], axis=1)
+            _, _, valid = tools.crop_plates(img, box, corners=quad, size=size, out=crops[i:i + 1])
+        else:
+            model, imgsz, conf = _worker_model
+            result = model(img, imgsz=imgsz, conf=conf, verbose=False)[0]
+            if len(result.boxes) == 0:
+                continue
+            best = int(result.boxes.conf.argmax())
+            _, _, valid = tools.crop_plates(img, result.boxes.xyxy[best:best + 1], size=size, out=crops[i:i + 1])
+        kept[i] = valid[0]
+
+    # 丢掉读图失败或没有检测到车牌的行，压实后再落盘
+    count = int(kept.sum())
+    final_crops = os.path.join(out_dir, name + ".crops.npy")
+    if count == len(paths):
+        crops.flush()
+        del crops
+        os.replace(tmp_crops, final_crops)
+    else:
+        compact = np.lib.format.open_memmap(final_crops + ".tmp.npy", mode='w+', dtype=np.uint8,
+                                            shape=(count,) + PLATE_SHAPE)
+        compact[:] = crops[kept]
+        compact.flush()
+        del compact, crops
+        os.replace(final_crops + ".tmp.npy", final_crops)
+        os.remove(tmp_crops)
+    labels = np.array(texts, dtype=TEXT_DTYPE)[kept]
+    sources = np.array(paths, dtype=str)[kept]
+    np.savez(os.path.join(out_dir, name + ".labels.npz"), texts=labels, sources=sources)
+    return {'shard': shard_id, 'name': name, 'count': count, 'skipped': len(paths) - count}
+
+
+def _paths_digest(paths: List[str]) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        h.update(path.encode('utf-8') + b'\n')
+    return h.hexdigest()
+
+
+class CropExtractor:
+    """分片、可续跑的截图提取任务"""
+
+    def __init__(self, out_dir: str, shard_size: int = 4096, workers: int = None):
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.workers = workers
+        self.manifest_path = os.path.join(out_dir, 'manifest.json')
+        os.makedirs(out_dir, exist_ok=True)
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self) -> Dict:
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {'shard_size': self.shard_size, 'plate_shape': list(PLATE_SHAPE), 'shards': {}}
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _check_source(self, source: Dict):
+        """输出目录已有分片时，输入必须与第一次运行完全一致"""
+        stored = self.manifest.get('source')
+        if self.manifest['shards'] and stored != source:
+            if stored is None:
+                raise ValueError(f"{self.out_dir} 中的分片没有记录输入参数，无法确认能否续跑，请换一个输出目录")
+            diff = sorted(key for key in set(stored) | set(source) if stored.get(key) != source.get(key))
+            raise ValueError(f"{self.out_dir} 是由不同的输入生成的（{', '.join(diff)} 不一致），"
+                             f"拒绝续跑；请换一个输出目录或删除原有分片")
+        self.manifest['source'] = source
+
+    def run(self, paths: List[str], texts: List[str] = None, corners: np.ndarray = None,
+            model_path: str = None, imgsz: int = 640, conf: float = 0.25, source: Dict = None) -> Dict:
+        """
+        Args:
+            paths: 图片路径
+            texts: 真值车牌号（检测模式下可为空字符串）
+            corners: (N, 4, 2) 四角标注；为 None 时使用 model_path 指定的检测模型
+            source: 输入的描述（索引文件、split 等），与图片列表摘要一起写入 manifest
+        """
+        if corners is None and not model_path:
+            raise ValueError("需要四角标注或检测模型")
+        source = dict(source or {}, num_images=len(paths), paths_digest=_paths_digest(paths))
+        if corners is None:
+            source.update(model=os.path.abspath(model_path), imgsz=imgsz, conf=conf)
+        self._check_source(source)
+        self._save_manifest()
+        # 续跑时必须沿用第一次的分片大小，否则分片编号对不上
+        shard_size = self.manifest['shard_size']
+        texts = texts if texts is not None else [''] * len(paths)
+        todo = [start for start in range(0, len(paths), shard_size)
+                if str(start // shard_size) not in self.manifest['shards']]
+        print(f"共 {len(paths)} 张图片，{-(-len(paths) // shard_size)} 个分片，待处理 {len(todo)} 个")
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_detector,
+                                 initargs=(None if corners is not None else model_path, imgsz, conf)) as pool:
+            futures = [pool.submit(_extract_shard, self.out_dir, start // shard_size,
+                                   paths[start:start + shard_size], texts[start:start + shard_size],
+                                   None if corners is None else corners[start:start + shard_size])
+                       for start in todo]
+            for future in as_completed(futures):
+                info = future.result()
+                self.manifest['shards'][str(info['shard'])] = info
+                self._save_manifest()
+                print(f"{info['name']}: {info['count']} 张截图，跳过 {info['skipped']} 张")
+        total = sum(info['count'] for info in self.manifest['shards'].values())
+        print(f"截图总数 {total}，输出目录 {self.out_dir}")
+        return self.manifest
+
+
+class CropShards:
+    """以内存映射方式读取提取结果，按全局下标取 (截图, 车牌号)"""
+
+    def __init__(self, out_dir: str):
+        with open(os.path.join(out_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        shards = sorted(manifest['shards'].values(), key=lambda info: info['shard'])
+        self.crops, texts, sources = [], [], []
+        for info in shards:
+            self.crops.append(np.load(os.path.join(out_dir, info['name'] + ".crops.npy"), mmap_mode='r'))
+            with np.load(os.path.join(out_dir, info['name'] + ".labels.npz")) as labels:
+                texts.append(labels['texts'])
+                sources.append(labels['sources'])
+        self.texts = np.concatenate(texts) if texts else np.empty(0, dtype=TEXT_DTYPE)
+        self.sources = np.concatenate(sources) if sources else np.empty(0, dtype=str)
+        self._offsets = np.cumsum([0] + [len(c) for c in self.crops])
+
+    def __len__(self):
+        return int(self._offsets[-1])
+
+    def __getitem__(self, idx: int):
+        if idx < 0:
+            idx += len(self)
+        shard = int(np.searchsorted(self._offsets, idx, side='right')) - 1
+        return self.crops[shard][idx - self._offsets[shard]], str(self.texts[idx])
+
+    def batches(self):
+        """逐分片产出 (截图数组, 车牌号数组)，适合批量 OCR 评估"""
+        for shard, crops in enumerate(self.crops):
+            yield crops, self.texts[self._offsets[shard]:self._offsets[shard + 1]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线车牌截图提取")
+    parser.add_argument('--index', help='CCPD 索引 (.npz)，使用四角标注做透视校正')
+    parser.add_argument('--split', default=None, help='只提取索引中的某个 split')
+    parser.add_argument('--images', help='图片目录，配合 --model 用检测结果截取')
+    parser.add_argument('--model', default=None)
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--out', required=True, help='输出目录')
+    parser.add_argument('--shard-size', type=int, default=4096)
+    parser.add_argument('--workers', type=int, default=None)
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    # 线程数相关的环境变量与 CPU 亲和性会被工作进程继承
+    apply_profile(args.profile)
+
+    extractor = CropExtractor(args.out, args.shard_size, args.workers)
+    if args.index:
+        from ccpd import CcpdIndex
+        index = CcpdIndex.load(args.index)
+        if args.split:
+            index = index.subset(split=args.split)
+        extractor.run(list(index.path), list(index.text), corners=index.corners,
+                      source={'index': os.path.abspath(args.index), 'split': args.split})
+    elif args.images and args.model:
+        from ccpd import IMAGE_EXTS, parse_ccpd_name
+        paths = sorted(os.path.join(args.images, f) for f in os.listdir(args.images)
+                       if f.lower().endswith(IMAGE_EXTS))
+        # 文件名是 CCPD 格式时顺便带上真值车牌号
+        texts = [(parse_ccpd_name(p) or {}).get('text', '') for p in paths]
+        extractor.run(paths, texts, model_path=args.model, imgsz=args.imgsz, conf=args.conf,
+                      source={'images': os.path.abspath(args.images)})
+    else:
+        parser.error("需要 --index，或同时给出 --images 与 --model")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+# encoding:utf-8
+"""
+共享内存帧环形缓冲区
+功能：
+1. 固定数量、固定大小的帧槽位，放在 multiprocessing.shared_memory 中
+2. 采集进程把帧写入一次（VideoCapture 可直接解码进槽位），之后各阶段只传槽位号
+3. 检测、OCR 等阶段通过槽位号拿到零拷贝的 numpy 视图
+4. 每个槽位带引用计数，所有读者 release 后槽位才会被复用
+目前是独立组件（live_scheduler 等入口仍在进程内用队列传帧），供需要跨进程传帧的流水线使用
+用法:
+    ring = FrameRing(slots=16, frame_shape=(1080, 1920, 3))       # 主进程创建
+    Process(target=stage, args=(ring, queue))                     # 子进程中自动 attach
+    slot = ring.write(frame, frame_id, readers=2)                 # 采集
+    img = ring.view(slot); ...; ring.release(slot)                # 读者
+"""
+
+import multiprocessing as mp
+import time
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+
+# capture 的返回状态
+CAPTURE_OK = 'ok'            # 读到一帧，已写入槽位
+CAPTURE_END = 'end'          # 视频结束或读取失败
+CAPTURE_TIMEOUT = 'timeout'  # 等待空闲槽位超时，本帧尚未读取，可稍后重试
+
+# 槽位头信息
+HEADER_DTYPE = np.dtype([
+    ('refcount', np.int32),
+    ('height', np.int32),
+    ('width', np.int32),
+    ('frame_id', np.int64),
+    ('timestamp', np.float64),
+])
+
+
+class FrameRing:
+    """共享内存帧环形缓冲区"""
+
+    def __init__(self, slots: int = 16, frame_shape: Tuple[int, int, int] = (1080, 1920, 3),
+                 name: str = None, lock=None, create: bool = True):
+        """
+        Args:
+            slots: 槽位数
+            frame_shape: 单帧最大尺寸 (高, 宽, 通道)，更小的帧也可以写入
+            name: 共享内存名称，attach 时必须提供
+            lock: 跨进程锁，保护引用计数；创建时默认新建一个
+            create: True 创建新的缓冲区，False 连接到已有缓冲区
+        """
+        self.slots = slots
+        self.frame_shape = tuple(frame_shape)
+        self.frame_bytes = int(np.prod(frame_shape))
+        self.lock = lock if lock is not None else mp.get_context('spawn').Lock()
+        header_bytes = HEADER_DTYPE.itemsize * slots
+        # 帧数据按 64 字节对齐
+        self._data_offset = (header_bytes + 63) // 64 * 64
+        size = self._data_offset + self.frame_bytes * slots
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self._owner = create
+        self.header = np.ndarray((slots,), dtype=HEADER_DTYPE, buffer=self.shm.buf)
+        self.frames = np.ndarray((slots,) + self.frame_shape, dtype=np.uint8,
+                                 buffer=self.shm.buf, offset=self._data_offset)
+        if create:
+            self.header[:] = 0
+        self._next = 0
+
+    # --------- 跨进程传递 ----------
+    def __getstate__(self):
+        return {'slots': self.slots, 'frame_shape': self.frame_shape, 'name': self.shm.name, 'lock': self.lock}
+
+    def __setstate__(self, state):
+        self.__init__(state['slots'], state['frame_shape'], name=state['name'], lock=state['lock'], create=False)
+
+    # --------- 写入 ----------
+    def acquire(self, readers: int = 1) -> Optional[int]:
+        """占用一个空闲槽位并把引用计数设为 readers，没有空闲槽位时返回 None"""
+        with self.lock:
+            for i in range(self.slots):
+                slot = (self._next + i) % self.slots
+                if self.header['refcount'][slot] == 0:
+                    self.header['refcount'][slot] = readers
+                    self._next = (slot + 1) % self.slots
+                    return slot
+        return None
+
+    def acquire_wait(self, readers: int = 1, timeout: float = None, interval: float = 0.001) -> Optional[int]:
+        """等待空闲槽位（背压），超时返回 None"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            slot = self.acquire(readers)
+            if slot is not None:
+                return slot
+            if deadline is not None and time.monotonic() > deadline:
+                return None
+            time.sleep(interval)
+
+    def slot_array(self, slot: int, height: int = None, width: int = None) -> np.ndarray:
+        """槽位的可写视图，可直接作为 cv2.VideoCapture.read / cv2.resize 的输出"""
+        height = height or self.frame_shape[0]
+        width = width or self.frame_shape[1]
+        return self.frames[slot, :height, :width]
+
+    def commit(self, slot: int, frame_id: int, height: int = None, width: int = None, timestamp: float = None):
+        """写入完成，记录帧的实际尺寸与编号"""
+        self.header['height'][slot] = height or self.frame_shape[0]
+        self.header['width'][slot] = width or self.frame_shape[1]
+        self.header['frame_id'][slot] = frame_id
+        self.header['timestamp'][slot] = time.time() if timestamp is None else timestamp
+
+    def write(self, frame: np.ndarray, frame_id: int, readers: int = 1, timeout: float = None) -> Optional[int]:
+        """
+        把一帧复制进槽位（全流程中唯一的一次复制），返回槽位号
+        frame 可以是 img_cvread 或 VideoCapture 得到的 BGR 数组
+        """
+        height, width = frame.shape[:2]
+        if height > self.frame_shape[0] or width > self.frame_shape[1]:
+            raise ValueError(f"帧尺寸 {frame.shape} 超出槽位尺寸 {self.frame_shape}")
+        slot = self.acquire_wait(readers, timeout)
+        if slot is None:
+            return None
+        self.frames[slot, :height, :width] = frame
+        self.commit(slot, frame_id, height, width)
+        return slot
+
+    def capture(self, cap, frame_id: int, readers: int = 1, timeout: float = None) -> Tuple[str, Optional[int]]:
+        """
+        直接把 VideoCapture 的下一帧解码进槽位，不经过中间数组
+        视频分辨率与 frame_shape 一致时解码结果直接落在槽位中
+        Returns:
+            (状态, 槽位号)：状态为 CAPTURE_OK / CAPTURE_END / CAPTURE_TIMEOUT，只有 CAPTURE_OK 时槽位号有效
+        """
+        slot = self.acquire_wait(readers, timeout)
+        if slot is None:
+            return CAPTURE_TIMEOUT, None
+        target = self.frames[slot]
+        ok, frame = cap.read(target)
+        if not ok:
+            self.release(slot, readers)
+            return CAPTURE_END, None
+        if not np.shares_memory(frame, target):
+            # 分辨率与槽位不一致时 OpenCV 会另行分配，退回一次复制
+            height, width = frame.shape[:2]
+            self.frames[slot, :height, :width] = frame
+            self.commit(slot, frame_id, height, width)
+        else:
+            self.commit(slot, frame_id)
+        return CAPTURE_OK, slot
+
+    # --------- 读取 ----------
+    def view(self, slot: int) -> np.ndarray:
+        """槽位中帧的零拷贝视图（只在 release 之前有效）"""
+        h = int(self.header['height'][slot])
+        w = int(self.header['width'][slot])
+        return self.frames[slot, :h, :w]
+
+    def frame_id(self, slot: int) -> int:
+        return int(self.header['frame_id'][slot])
+
+    def retain(self, slot: int, count: int = 1):
+        """增加读者（例如检测阶段把帧继续交给 OCR 阶段）"""
+        with self.lock:
+            self.header['refcount'][slot] += count
+
+    def release(self, slot: int, count: int = 1):
+        """读者用完后释放，引用计数归零时槽位可被复用；释放次数多于读者数时抛出 ValueError"""
+        with self.lock:
+            refcount = self.header['refcount'][slot] - count
+            if refcount < 0:
+                raise ValueError(f"槽位 {slot} 重复释放（引用计数 {self.header['refcount'][slot]}，释放 {count}）")
+            self.header['refcount'][slot] = refcount
+
+    def in_use(self) -> int:
+        return int((self.header['refcount'] > 0).sum())
+
+    def close(self):
+        """断开连接；创建者同时删除共享内存"""
+        del self.header
+        del self.frames
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
+
+
+def _consume(ring: FrameRing, slot_queue):
+    """示例读者：统计每帧亮度后释放槽位"""
+    frames, brightness = 0, 0.0
+    while True:
+        slot = slot_queue.get()
+        if slot is None:
+            break
+        frame = ring.view(slot)
+        brightness += float(frame.mean())
+        frames += 1
+        del frame
+        ring.release(slot)
+    print(f"读者进程处理 {frames} 帧，平均亮度 {brightness / max(frames, 1):.1f}")
+    ring.close()
+
+
+if __name__ == '__main__':
+    import cv2
+
+    cap = cv2.VideoCapture("TestFiles/1.mp4")
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    ring = FrameRing(slots=8, frame_shape=(height, width, 3))
+    ctx = mp.get_context('spawn')
+    slot_queue = ctx.Queue()
+    consumer = ctx.Process(target=_consume, args=(ring, slot_queue))
+    consumer.start()
+
+    start = time.perf_counter()
+    frame_id = 0
+    while True:
+        status, slot = ring.capture(cap, frame_id, timeout=1.0)
+        if status == CAPTURE_END:
+            break
+        if status == CAPTURE_TIMEOUT:
+            continue  # 读者还没释放槽位，本帧尚未读取，重试
+        slot_queue.put(slot)
+        frame_id += 1
+    slot_queue.put(None)
+    consumer.join()
+    elapsed = time.perf_counter() - start
+    print(f"共传递 {frame_id} 帧，耗时 {elapsed:.2f}s ({frame_id / max(elapsed, 1e-9):.1f} 帧/秒)")
+    cap.release()
+    ring.close()
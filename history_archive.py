@@ -0,0 +1,299 @@
+# encoding:utf-8
+"""
+停车历史分区归档
+功能：
+1. 按天或按月将停车历史拆分为独立的分区文件（JSON Lines，只追加写）
+2. 维护一个很小的分区索引（记录数、总时长、时间范围），统计无需加载历史
+3. 启动时只加载最新分区，其余分区在查询覆盖其时间范围时才懒加载
+4. 分区粒度在创建时写入元数据，之后不能以其他粒度打开（否则日、月分区键混在一起无法按时间排序）
+"""
+
+import json
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+INDEX_FILE = "index.json"
+META_FILE = "archive.json"
+
+# 分区粒度: 分区键的格式
+PARTITION_FORMATS = {
+    'day': '%Y-%m-%d',
+    'month': '%Y-%m',
+}
+
+
+def _matches(key: str, fmt: str) -> bool:
+    try:
+        datetime.strptime(key, fmt)
+        return True
+    except ValueError:
+        return False
+
+
+class HistoryArchive:
+    """按时间分区的停车历史归档"""
+
+    def __init__(self, archive_dir: str, partition_by: str = 'month', record_factory=None):
+        """
+        Args:
+            archive_dir: 分区文件所在目录
+            partition_by: 分区粒度，'day' 或 'month'
+            record_factory: 将字典还原为记录对象的函数，例如 ParkingRecord.from_dict
+        """
+        if partition_by not in PARTITION_FORMATS:
+            raise ValueError(f"不支持的分区粒度: {partition_by}")
+        self.archive_dir = archive_dir
+        self.partition_by = partition_by
+        self.record_factory = record_factory
+        self.index = {}        # {分区键: {'count', 'total_duration', 'total_fee', 'start', 'end'}}
+        self._partitions = {}  # 已加载的分区: {分区键: [记录, ...]}
+        self._meta_saved = self._check_meta()
+        self.load_index()
+        if not self._meta_saved:
+            self._check_legacy_keys()
+
+    # --------- 分区键 ----------
+    def partition_key(self, dt: datetime) -> str:
+        """返回时间点所属的分区键"""
+        return dt.strftime(PARTITION_FORMATS[self.partition_by])
+
+    def partition_keys(self) -> List[str]:
+        """按时间升序返回所有分区键"""
+        return sorted(self.index)
+
+    def latest_key(self) -> Optional[str]:
+        keys = self.partition_keys()
+        return keys[-1] if keys else None
+
+    def is_closed(self, key: str, now: datetime = None) -> bool:
+        """分区是否已经结束（不会再有新记录写入）"""
+        if now is None:
+            now = datetime.now()
+        return key < self.partition_key(now)
+
+    def partition_stamp(self, key: str) -> Tuple:
+        """
+        分区内容的版本戳：文件的修改时间与大小，加上索引中的记录数与费用合计
+        追加、重新计费或其他进程改写分区后都会变化，可用作缓存键
+        """
+        try:
+            st = os.stat(self._partition_path(key))
+            file_stamp = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            file_stamp = (None, None)
+        meta = self.index.get(key, {})
+        return file_stamp + (meta.get('count', 0), round(meta.get('total_fee', 0.0), 6))
+
+    def _partition_path(self, key: str) -> str:
+        return os.path.join(self.archive_dir, f"{key}.jsonl")
+
+    # --------- 元数据 ----------
+    def _check_meta(self) -> bool:
+        """归档的分区粒度与创建时不同则拒绝打开；返回元数据文件是否已存在"""
+        path = os.path.join(self.archive_dir, META_FILE)
+        if not os.path.exists(path):
+            return False
+        with open(path, 'r', encoding='utf-8') as f:
+            stored = json.load(f).get('partition_by')
+        if stored != self.partition_by:
+            raise ValueError(f"历史归档 {self.archive_dir} 按 {stored} 分区创建，不能以 {self.partition_by} 打开")
+        return True
+
+    def _check_legacy_keys(self):
+        """早期归档没有元数据，按已有分区键的格式推断粒度"""
+        modes = {mode for mode, fmt in PARTITION_FORMATS.items()
+                 for key in self.index if _matches(key, fmt)}
+        if len(modes) > 1:
+            raise ValueError(f"历史归档 {self.archive_dir} 中混有按日和按月的分区")
+        if modes and modes != {self.partition_by}:
+            raise ValueError(f"历史归档 {self.archive_dir} 按 {modes.pop()} 分区创建，不能以 {self.partition_by} 打开")
+
+    def _save_meta(self):
+        path = os.path.join(self.archive_dir, META_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'partition_by': self.partition_by}, f)
+        os.replace(tmp_path, path)
+        self._meta_saved = True
+
+    # --------- 索引 ----------
+    def load_index(self):
+        """加载分区索引"""
+        path = os.path.join(self.archive_dir, INDEX_FILE)
+        self.index = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.index = json.load(f)
+            except Exception as e:
+                print(f"加载历史索引失败: {e}")
+                self.rebuild_index()
+
+    def save_index(self):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        if not self._meta_saved:
+            self._save_meta()
+        path = os.path.join(self.archive_dir, INDEX_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def rebuild_index(self):
+        """索引损坏时，扫描全部分区文件重建索引"""
+        self.index = {}
+        if not os.path.isdir(self.archive_dir):
+            return
+        for filename in os.listdir(self.archive_dir):
+            if not filename.endswith('.jsonl'):
+                continue
+            key = filename[:-len('.jsonl')]
+            if not _matches(key, PARTITION_FORMATS[self.partition_by]):
+                print(f"跳过与分区粒度 {self.partition_by} 不符的文件: {filename}")
+                continue
+            for record in self.read_records(key):
+                self._update_index(key, record)
+        self.save_index()
+
+    def _update_index(self, key: str, record: Dict):
+        entry = self.index.setdefault(key, {
+            'count': 0,
+            'total_duration': 0.0,
+            'total_fee': 0.0,
+            'start': record['entry_time'],
+            'end': record['exit_time'] or record['entry_time'],
+        })
+        entry['count'] += 1
+        entry['total_duration'] += record['duration_seconds'] or 0.0
+        entry['total_fee'] = entry.get('total_fee', 0.0) + (record.get('fee') or 0.0)
+        entry['start'] = min(entry['start'], record['entry_time'])
+        entry['end'] = max(entry['end'], record['exit_time'] or record['entry_time'])
+
+    # --------- 读写 ----------
+    def read_records(self, key: str) -> List[Dict]:
+        """读取单个分区的原始字典记录（不缓存、不构造记录对象）"""
+        path = self._partition_path(key)
+        if not os.path.exists(path):
+            return []
+        records = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+        return records
+
+    def load_partition(self, key: str) -> List:
+        """加载（并缓存）单个分区的全部记录"""
+        if key not in self._partitions:
+            records = self.read_records(key)
+            if self.record_factory:
+                records = [self.record_factory(record) for record in records]
+            self._partitions[key] = records
+        return self._partitions[key]
+
+    def append(self, record):
+        """追加一条已完成的停车记录，按驶出时间归入分区"""
+        data = record.to_dict() if hasattr(record, 'to_dict') else record
+        key = self.partition_key(datetime.fromisoformat(data['exit_time'] or data['entry_time']))
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        with open(self._partition_path(key), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(data, ensure_ascii=False) + "\n")
+
+        self._update_index(key, data)
+        self.save_index()
+
+        if key in self._partitions:
+            self._partitions[key].append(record)
+        return key
+
+    def import_records(self, records: List) -> int:
+        """
+        批量导入记录（例如从旧格式文件迁移）：按分区分组，每个分区整体改写一次，索引只写一次
+        已在分区中的记录（车牌、进入时间、驶出时间都相同）会被跳过，中途崩溃后重新导入不会产生重复
+        返回实际新增的记录数
+        """
+        groups = {}
+        for record in records:
+            data = record.to_dict() if hasattr(record, 'to_dict') else record
+            key = self.partition_key(datetime.fromisoformat(data['exit_time'] or data['entry_time']))
+            groups.setdefault(key, []).append(data)
+
+        added = 0
+        for key, new_records in groups.items():
+            existing = self.read_records(key)
+            seen = {(r['plate_number'], r['entry_time'], r['exit_time']) for r in existing}
+            fresh = []
+            for data in new_records:
+                identity = (data['plate_number'], data['entry_time'], data['exit_time'])
+                if identity not in seen:
+                    seen.add(identity)
+                    fresh.append(data)
+            if fresh:
+                self._write_partition(key, existing + fresh)
+                added += len(fresh)
+        self.save_index()
+        return added
+
+    def _write_partition(self, key: str, records: List[Dict]):
+        """原子地改写一个分区文件并重算该分区的索引（不写索引文件）"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = self._partition_path(key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, path)
+
+        self.index.pop(key, None)
+        for record in records:
+            self._update_index(key, record)
+        self._partitions.pop(key, None)
+
+    def rewrite_partition(self, key: str, records: List[Dict]):
+        """用新的字典记录整体替换一个分区（例如重新计费后），并更新索引"""
+        self._write_partition(key, records)
+        self.save_index()
+
+    def records_between(self, start: datetime = None, end: datetime = None) -> List:
+        """
+        返回驶出时间落在 [start, end] 内的记录，只加载与该时间范围重叠的分区
+        """
+        start_str = start.isoformat() if start else None
+        end_str = end.isoformat() if end else None
+        result = []
+        for key in self.partition_keys():
+            entry = self.index[key]
+            if start_str and entry['end'] < start_str:
+                continue
+            if end_str and entry['start'] > end_str:
+                continue
+            for record in self.load_partition(key):
+                exit_time = record.exit_time or record.entry_time
+                if start and exit_time < start:
+                    continue
+                if end and exit_time > end:
+                    continue
+                result.append(record)
+        return result
+
+    def total_count(self) -> int:
+        return sum(entry['count'] for entry in self.index.values())
+
+    def total_duration(self) -> float:
+        return sum(entry['total_duration'] for entry in self.index.values())
+
+    def total_fee(self) -> float:
+        return sum(entry.get('total_fee', 0.0) for entry in self.index.values())
+
+    def clear(self):
+        """删除全部分区文件与索引"""
+        for key in list(self.index):
+            path = self._partition_path(key)
+            if os.path.exists(path):
+                os.remove(path)
+        self.index = {}
+        self._partitions = {}
+        self.save_index()
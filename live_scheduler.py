@@ -0,0 +1,426 @@
+# encoding:utf-8
+"""
+实时检测的自适应调度与降载
+车辆集中到达时每帧都做完整检测和 OCR，排队越积越长，抬杆决策的延迟随之失控。
+调度器根据帧队列深度和各阶段延迟（指数滑动平均）在质量档位之间切换：
+1. 档位由 (检测步长, imgsz) 组成，压力大时隔帧检测、缩小输入尺寸
+2. 不在闸口区域的车牌（低优先级）推迟 OCR，空闲时再补做
+3. 积压清空并持续一段时间后逐级恢复到满质量
+4. 超过最大端到端延迟仍未检测的帧直接丢弃，闸口车牌的 OCR 从不推迟
+每个摄像头一份配置，可从 JSON 文件加载:
+    {"gate_in": {"source": "rtsp://...", "max_latency_ms": 400, "gate_roi": [0.2, 0.5, 0.8, 1.0]}}
+用法:
+    scheduler = AdaptiveScheduler(CameraProfile('gate_in'))
+    scheduler.update(frame_queue.qsize())
+    if scheduler.should_detect(frame_index, captured_at):
+        with scheduler.timed('detect', scheduler.imgsz):
+            results = model(frame, imgsz=scheduler.imgsz)
+"""
+
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Sequence, Tuple
+
+from pipeline_metrics import metrics
+
+# 质量档位 (检测步长, imgsz)，从满质量到最低质量
+DEFAULT_LEVELS = ((1, 640), (2, 640), (2, 480), (3, 416), (4, 320))
+
+
+class CameraProfile:
+    """单个摄像头的调度配置"""
+
+    def __init__(self,
+                 camera_id: str,
+                 source=0,
+                 max_latency_ms: float = 500.0,
+                 target_latency_ms: float = 250.0,
+                 levels: Sequence[Tuple[int, int]] = DEFAULT_LEVELS,
+                 gate_roi: Tuple[float, float, float, float] = (0.0, 0.0, 1.0, 1.0),
+                 max_queue: int = 8,
+                 recover_seconds: float = 3.0,
+                 cooldown_seconds: float = 1.0,
+                 ewma_alpha: float = 0.2):
+        """
+        Args:
+            camera_id: 摄像头名称
+            source: cv2.VideoCapture 的输入（设备号、文件或 RTSP 地址）
+            max_latency_ms: 从采集到抬杆决策的最大端到端延迟，超过的帧直接丢弃
+            target_latency_ms: 期望延迟，估计延迟超过它时降档
+            levels: 质量档位 [(检测步长, imgsz), ...]，第一个为满质量
+            gate_roi: 闸口区域（归一化 x1, y1, x2, y2），中心落在其中的车牌为高优先级
+            max_queue: 帧队列深度超过该值时无论延迟如何都降档
+            recover_seconds: 压力解除后持续多久升一档
+            cooldown_seconds: 两次降档之间的最短间隔，避免一次突发直接降到底
+            ewma_alpha: 阶段延迟滑动平均系数
+        """
+        self.camera_id = camera_id
+        self.source = source
+        self.max_latency_ms = max_latency_ms
+        self.target_latency_ms = target_latency_ms
+        self.levels = [tuple(level) for level in levels]
+        self.gate_roi = tuple(gate_roi)
+        self.max_queue = max_queue
+        self.recover_seconds = recover_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.ewma_alpha = ewma_alpha
+
+    def to_dict(self) -> Dict:
+        return {
+            'source': self.source,
+            'max_latency_ms': self.max_latency_ms,
+            'target_latency_ms': self.target_latency_ms,
+            'levels': [list(level) for level in self.levels],
+            'gate_roi': list(self.gate_roi),
+            'max_queue': self.max_queue,
+            'recover_seconds': self.recover_seconds,
+            'cooldown_seconds': self.cooldown_seconds,
+            'ewma_alpha': self.ewma_alpha,
+        }
+
+    @classmethod
+    def from_dict(cls, camera_id: str, data: Dict) -> 'CameraProfile':
+        return cls(camera_id, **data)
+
+
+def load_profiles(path: str) -> Dict[str, CameraProfile]:
+    """从 JSON 文件加载 {摄像头名称: 配置}"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {camera_id: CameraProfile.from_dict(camera_id, cfg) for camera_id, cfg in data.items()}
+
+
+class _Timer:
+    def __init__(self, scheduler, stage, imgsz):
+        self.scheduler = scheduler
+        self.stage = stage
+        self.imgsz = imgsz
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.scheduler.observe(self.stage, time.perf_counter() - self.start, self.imgsz)
+        return False
+
+
+class AdaptiveScheduler:
+    """按队列深度与阶段延迟调整检测质量、推迟低优先级 OCR"""
+
+    def __init__(self, profile: CameraProfile, presence=None):
+        """
+        Args:
+            profile: 摄像头配置
+            presence: PresenceFilter，提供时画面相对关键帧没有变化的帧不再检测（计入 stats['unchanged']）
+        """
+        self.profile = profile
+        self.presence = presence
+        self.level = 0
+        self._latency = {}  # {阶段名 或 'detect@imgsz': 秒（滑动平均）}
+        self._deferred = OrderedDict()  # {track_id: (截图, 车牌框)}，同一目标只保留最新截图
+        self._last_change = 0.0
+        self._calm_since = None
+        self.stats = {'frames': 0, 'detected': 0, 'strided': 0, 'shed': 0,
+                      'ocr_now': 0, 'ocr_deferred': 0, 'ocr_backfilled': 0, 'level_changes': 0, 'unchanged': 0}
+
+    # --------- 当前档位 ----------
+    @property
+    def stride(self) -> int:
+        return self.profile.levels[self.level][0]
+
+    @property
+    def imgsz(self) -> int:
+        return self.profile.levels[self.level][1]
+
+    # --------- 延迟统计 ----------
+    def observe(self, stage: str, seconds: float, imgsz: int = None):
+        """记录一次阶段耗时；检测耗时按 imgsz 分开统计"""
+        key = f"{stage}@{imgsz}" if imgsz else stage
+        previous = self._latency.get(key)
+        alpha = self.profile.ewma_alpha
+        self._latency[key] = seconds if previous is None else previous + alpha * (seconds - previous)
+        if metrics.enabled:
+            metrics.observe(f"{self.profile.camera_id}.{stage}", seconds)
+
+    def timed(self, stage: str, imgsz: int = None) -> _Timer:
+        """with scheduler.timed('detect', scheduler.imgsz): ..."""
+        return _Timer(self, stage, imgsz)
+
+    def detect_seconds(self, imgsz: int = None) -> float:
+        """某个 imgsz 下的检测耗时估计；没测过时按像素数从已测档位换算"""
+        imgsz = imgsz or self.imgsz
+        key = f"detect@{imgsz}"
+        if key in self._latency:
+            return self._latency[key]
+        for other_key, seconds in self._latency.items():
+            if other_key.startswith('detect@'):
+                return seconds * (imgsz / int(other_key.split('@')[1])) ** 2
+        return 0.0
+
+    def estimated_latency(self, queue_depth: int) -> float:
+        """新到一帧从采集到抬杆决策的估计延迟（秒）：排在前面的帧 + 本帧检测 + 一次 OCR"""
+        detect = self.detect_seconds()
+        # 隔帧检测时，排队的帧里只有 1/stride 需要真正检测
+        queued = queue_depth / self.stride * detect
+        return queued + detect + self._latency.get('ocr', 0.0)
+
+    # --------- 档位调整 ----------
+    def update(self, queue_depth: int, now: float = None) -> int:
+        """根据当前帧队列深度调整档位，返回新档位（0 为满质量）"""
+        now = time.monotonic() if now is None else now
+        profile = self.profile
+        latency_ms = self.estimated_latency(queue_depth) * 1000
+        overloaded = queue_depth > profile.max_queue or latency_ms > profile.target_latency_ms
+        if overloaded:
+            self._calm_since = None
+            if self.level < len(profile.levels) - 1 and now - self._last_change >= profile.cooldown_seconds:
+                self._set_level(self.level + 1, now)
+            return self.level
+
+        # 只有队列清空、且升一档后的检测耗时仍在目标一半以内，才开始计时恢复
+        better = max(self.level - 1, 0)
+        headroom = self.detect_seconds(profile.levels[better][1]) * 1000 < profile.target_latency_ms / 2
+        if queue_depth == 0 and headroom:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif self.level > 0 and now - self._calm_since >= profile.recover_seconds:
+                self._set_level(self.level - 1, now)
+                self._calm_since = now
+        else:
+            self._calm_since = None
+        return self.level
+
+    def _set_level(self, level: int, now: float):
+        self.level = level
+        self._last_change = now
+        self.stats['level_changes'] += 1
+        stride, imgsz = self.profile.levels[level]
+        print(f"[{self.profile.camera_id}] 切换到档位 {level}: 每 {stride} 帧检测一次, imgsz={imgsz}")
+
+    # --------- 帧调度 ----------
+    def should_detect(self, frame_index: int, captured_at: float, now: float = None, frame=None) -> bool:
+        """
+        是否对这一帧做检测
+        captured_at 为采集时刻（time.monotonic()）；检测完成时已超过最大延迟的帧直接丢弃
+        frame 为当前帧，配置了 presence 时用于判断画面是否有变化
+        stats 中 detected / strided / shed / unchanged 互不重叠，相加等于 frames
+        """
+        now = time.monotonic() if now is None else now
+        self.stats['frames'] += 1
+        age_ms = (now - captured_at + self.detect_seconds()) * 1000
+        if age_ms > self.profile.max_latency_ms:
+            self.stats['shed'] += 1
+            return False
+        if frame_index % self.stride:
+            self.stats['strided'] += 1
+            return False
+        if self.presence is not None and frame is not None and not self.presence.should_detect(frame):
+            self.stats['unchanged'] += 1
+            return False
+        self.stats['detected'] += 1
+        return True
+
+    # --------- OCR 调度 ----------
+    def is_gate_plate(self, box: Sequence[float], frame_shape) -> bool:
+        """车牌框中心是否落在闸口区域"""
+        height, width = frame_shape[:2]
+        cx = (box[0] + box[2]) / 2 / width
+        cy = (box[1] + box[3]) / 2 / height
+        x1, y1, x2, y2 = self.profile.gate_roi
+        return x1 <= cx <= x2 and y1 <= cy <= y2
+
+    def ocr_now(self, track_id, crop, box, frame_shape, frame_ref=None) -> bool:
+        """
+        是否立即识别该车牌
+        闸口车牌总是立即识别；其余车牌在满质量档位下立即识别，否则推迟到空闲时补做
+        frame_ref: 截图所属帧的标识（如 (帧号, 采集时间)），补做时原样交回
+        """
+        if self.level == 0 or self.is_gate_plate(box, frame_shape):
+            self._deferred.pop(track_id, None)
+            self.stats['ocr_now'] += 1
+            return True
+        self._deferred[track_id] = (crop, box, frame_ref)
+        self._deferred.move_to_end(track_id)
+        self.stats['ocr_deferred'] += 1
+        return False
+
+    def take_deferred(self, queue_depth: int, budget_seconds: float = None) -> List[Tuple]:
+        """
+        空闲时取出推迟的 OCR 任务 [(track_id, 截图, 车牌框, frame_ref), ...]
+        只有满质量档位且队列为空时才补做，数量受时间预算限制
+        """
+        if self.level > 0 or queue_depth > 0 or not self._deferred:
+            return []
+        if budget_seconds is None:
+            budget_seconds = self.profile.target_latency_ms / 2000
+        ocr_seconds = self._latency.get('ocr', 0.0)
+        count = len(self._deferred) if ocr_seconds <= 0 else max(1, int(budget_seconds / ocr_seconds))
+        tasks = []
+        while self._deferred and len(tasks) < count:
+            track_id, (crop, box, frame_ref) = self._deferred.popitem(last=False)
+            tasks.append((track_id, crop, box, frame_ref))
+        self.stats['ocr_backfilled'] += len(tasks)
+        return tasks
+
+    def deferred_count(self) -> int:
+        return len(self._deferred)
+
+
+def _capture_loop(profile: CameraProfile, frame_queue, stop_event):
+    """采集线程：帧队列满时丢弃最旧的帧，保证调度器看到的总是最新画面"""
+    import cv2
+    cap = cv2.VideoCapture(profile.source)
+    index = 0
+    while not stop_event.is_set():
+        ok, frame = cap.read()
+        if not ok:
+            break
+        try:
+            frame_queue.put_nowait((index, time.monotonic(), frame))
+        except queue.Full:
+            try:
+                frame_queue.get_nowait()
+            except queue.Empty:
+                pass
+            frame_queue.put_nowait((index, time.monotonic(), frame))
+        index += 1
+    cap.release()
+    frame_queue.put(None)
+
+
+def _valid_confs(result, valid):
+    confs = result.boxes.conf
+    confs = confs.cpu().numpy() if hasattr(confs, 'cpu') else confs
+    return confs[valid]
+
+
+# 多个摄像头线程共用一个 ParkingBackend
+_backend_lock = threading.Lock()
+
+
+def run_camera(profile: CameraProfile, model, ocr_func, backend=None, result_log=None, presence=None,
+               debouncer=None):
+    """
+    单个摄像头的实时识别循环
+    ocr_func(crop) -> (车牌号, 置信度)；backend 为 ParkingBackend 时闸口车牌直接进出场，
+    同一车牌的连续识别先经 debouncer（PlateDebouncer，默认 30 秒间隔）合并，进出场时间取帧的采集时刻
+    result_log 为 ResultLogWriter 时记录每个检测帧的框与识别结果，可离线回放
+    presence 为 PresenceFilter 时，画面相对关键帧没有变化的帧不再检测
+    """
+    import detect_tools as tools
+    from datetime import datetime
+
+    from parking_backend import PlateDebouncer
+
+    if backend is not None and debouncer is None:
+        debouncer = PlateDebouncer()
+    scheduler = AdaptiveScheduler(profile, presence)
+    frame_queue = queue.Queue(maxsize=profile.max_queue * 2)
+    stop_event = threading.Event()
+    threading.Thread(target=_capture_loop, args=(profile, frame_queue, stop_event), daemon=True).start()
+
+    def recognize(track_id, crop, box, frame_shape, wall_time):
+        with scheduler.timed('ocr'):
+            text, conf = ocr_func(crop)
+        if not text:
+            return text, conf
+        if backend is not None and scheduler.is_gate_plate(box, frame_shape):
+            with _backend_lock:
+                result = debouncer.submit(backend, text, datetime.fromtimestamp(wall_time))
+            if result is not None:
+                print(f"[{profile.camera_id}] {result['message']}")
+        else:
+            print(f"[{profile.camera_id}] 车牌 {text} ({conf:.2f})")
+        return text, conf
+
+    try:
+        while True:
+            item = frame_queue.get()
+            if item is None:
+                break
+            frame_index, captured_at, frame = item
+            scheduler.update(frame_queue.qsize())
+            if not scheduler.should_detect(frame_index, captured_at, frame=frame):
+                continue
+            imgsz = scheduler.imgsz
+            with scheduler.timed('detect', imgsz):
+                result = model(frame, imgsz=imgsz, verbose=False)[0]
+            crops, boxes, valid = tools.crop_plates(frame, result.boxes.xyxy)
+            # captured_at 是 monotonic 时钟，换算成墙上时间作为进出场时间与日志时间
+            wall_time = time.time() - (time.monotonic() - captured_at)
+            texts, confs = [], []
+            for crop, box in zip(crops[valid], boxes[valid]):
+                # 以车牌中心所在的 64 像素网格近似同一目标
+                track_id = (int(box[0] + box[2]) // 128, int(box[1] + box[3]) // 128)
+                text, conf = None, None
+                if scheduler.ocr_now(track_id, crop, box, frame.shape, (frame_index, wall_time)):
+                    text, conf = recognize(track_id, crop, box, frame.shape, wall_time)
+                texts.append(text or '')
+                confs.append(conf or 0)
+            if result_log is not None:
+                result_log.append(frame_index, wall_time, boxes[valid], _valid_confs(result, valid), texts, confs)
+            for track_id, crop, box, (source_index, source_time) in scheduler.take_deferred(frame_queue.qsize()):
+                text, conf = recognize(track_id, crop, box, frame.shape, source_time)
+                if result_log is not None:
+                    # 补做的 OCR 记在截图所属的原帧上，带 FLAG_BACKFILL 标志，按帧遍历时不会重复计帧
+                    result_log.append(source_index, source_time, box[None], None, [text or ''], [conf or 0],
+                                      backfill=True)
+    finally:
+        stop_event.set()
+        if result_log is not None:
+            result_log.close()
+    print(f"[{profile.camera_id}] {scheduler.stats}")
+    return scheduler.stats
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+
+    from ocr_executor import create_ocr_func
+    from parking_backend import ParkingBackend, PlateDebouncer
+    from perf_profiles import add_profile_argument, apply_profile
+
+    parser = argparse.ArgumentParser(description="多摄像头自适应实时识别")
+    parser.add_argument('--cameras', default=None, help='摄像头配置 JSON，缺省时用 TestFiles/1.mp4')
+    parser.add_argument('--model', default='models/best.pt')
+    parser.add_argument('--ocr', default='hub')
+    parser.add_argument('--log-dir', default=None, help='结果日志目录，每个摄像头一个子目录（见 result_log.py）')
+    parser.add_argument('--presence', action='store_true', help='画面无变化的帧跳过检测（见 presence_filter.py）')
+    parser.add_argument('--data-file', default='runs/live/parking_data.json',
+                        help='停车后台状态文件，默认不写仓库根目录的 parking_data.json')
+    parser.add_argument('--dedup-seconds', type=float, default=30.0,
+                        help='同一车牌消失超过该秒数后再出现才算新的进出场')
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    perf = apply_profile(args.profile)
+
+    profiles = load_profiles(args.cameras) if args.cameras else {'demo': CameraProfile('demo', 'TestFiles/1.mp4')}
+    os.makedirs(os.path.dirname(args.data_file) or '.', exist_ok=True)
+    backend = ParkingBackend(args.data_file)
+    debouncer = PlateDebouncer(args.dedup_seconds)
+    threads = []
+    for profile in profiles.values():
+        if perf.static_shape and perf.imgsz:
+            # 静态形状的 ONNX 只接受固定尺寸，档位只保留检测步长
+            profile.levels = list(dict.fromkeys((stride, perf.imgsz) for stride, _ in profile.levels))
+        # 每个摄像头一个模型实例与 OCR 实例，互不抢占
+        result_log = None
+        if args.log_dir:
+            from result_log import ResultLogWriter
+            result_log = ResultLogWriter(os.path.join(args.log_dir, profile.camera_id), source=str(profile.source))
+        presence = None
+        if args.presence:
+            from presence_filter import PresenceFilter
+            presence = PresenceFilter()
+        thread = threading.Thread(target=run_camera, args=(profile, perf.load_model(args.model),
+                                                           create_ocr_func(args.ocr, perf.ocr_threads),
+                                                           backend, result_log, presence, debouncer))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
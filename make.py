@@ -1,6 +1,7 @@
 import shutil
 import cv2
 import os
+from ccpd import build_index
 def txt_translate(path, txt_path):
     print(path)
     print(txt_path)
@@ -34,6 +35,21 @@ def txt_translate(path, txt_path):
         # 绿牌是第0类，蓝牌是第1类
         with open(txtfile, "w") as f:
             f.write(str(0) + " " + str(cx) + " " + str(cy) + " " + str(width) + " " + str(height))
+def txt_translate_index(index, split, txt_path):
+    """
+    从 CCPD 索引写 YOLO 标签：尺寸与框都已在索引中，不再逐张解码图片
+    """
+    subset = index.subset(split=split)
+    os.makedirs(txt_path, exist_ok=True)
+    labels = subset.yolo_labels()
+    for path, (cx, cy, width, height) in zip(subset.path, labels):
+        txtfile = os.path.join(txt_path, os.path.splitext(os.path.basename(path))[0] + ".txt")
+        # 绿牌是第0类，蓝牌是第1类
+        with open(txtfile, "w") as f:
+            f.write(str(0) + " " + str(cx) + " " + str(cy) + " " + str(width) + " " + str(height))
+    print(f"{split}: 写入 {len(subset)} 个标签到 {txt_path}")
+
+
 if __name__ == '__main__':
     # det图片存储地址
     trainDir = r"D:/Code/py/yolo/CCPD2020/ccpd_green/train/"
@@ -43,6 +59,8 @@ if __name__ == '__main__':
     train_txt_path = r"D:/Code/py/yolo/CCPD2020/ccpd_green/train_labels/"
     val_txt_path = r"D:/Code/py/yolo/CCPD2020/ccpd_green/val_labels/"
     test_txt_path = r"D:/Code/py/yolo/CCPD2020/ccpd_green/test_labels/"
-    txt_translate(trainDir, train_txt_path)
-    txt_translate(validDir, val_txt_path)
-    txt_translate(testDir, test_txt_path)
\ No newline at end of file
+    # 一次并行解析全部文件名建立索引，标签、OCR 截图与评估真值都从索引读取
+    index = build_index([trainDir, validDir, testDir], r"D:/Code/py/yolo/CCPD2020/ccpd_green/ccpd_index.npz")
+    txt_translate_index(index, "train", train_txt_path)
+    txt_translate_index(index, "val", val_txt_path)
+    txt_translate_index(index, "test", test_txt_path)
\ No newline at end of file
@@ -4,10 +4,28 @@ import detect_tools as tools
 import paddlehub as hub
 from PIL import ImageFont, Image
 from paddleocr import PaddleOCR
+from perf_profiles import apply_profile
+from presence_filter import PresenceFilter
 
+# 性能配置档由环境变量 PLATE_PERF_PROFILE 选择
+profile = apply_profile()
 yolo_model_path = r'models\best.pt'
-model = YOLO(yolo_model_path, task='detect')
+model = profile.load_model(yolo_model_path)
 
-
-
-reslut = model("TestFiles/1.mp4",show=True)
\ No newline at end of file
+# 画面相对关键帧没有变化时跳过检测，沿用上一次的检测框
+gate = PresenceFilter()
+cap = cv2.VideoCapture("TestFiles/1.mp4")
+boxes = []
+while True:
+    ok, frame = cap.read()
+    if not ok:
+        break
+    if gate.should_detect(frame):
+        reslut = model(frame, verbose=False, **profile.predict_kwargs())[0]
+        boxes = reslut.boxes.xyxy.int().tolist()
+    cv2.imshow("YOLOv8 Detection", tools.draw_boxes(frame, boxes))
+    if cv2.waitKey(1) & 0xFF == ord('q'):
+        break
+cap.release()
+cv2.destroyAllWindows()
+print(f"检测 {gate.stats['detect']}/{gate.stats['frames']} 帧，跳过 {gate.skip_ratio:.1%}")
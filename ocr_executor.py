@@ -0,0 +1,296 @@
+# encoding:utf-8
+"""
+多进程 OCR 执行器
+功能：
+1. 常驻 N 个工作进程，每个进程只加载一次 OCR 模型
+2. 车牌截图通过共享内存槽位传给工作进程，不对 numpy 数组做 pickle
+3. 结果按提交顺序返回
+4. 工作进程崩溃后自动重启，并重新提交它尚未完成的请求；
+   只有崩溃时正在识别的那一个请求计入重试次数，排在它后面的请求原样重新提交
+5. 工作进程在加载模型阶段就退出（例如 OCR 引擎无法创建）时不会无限重启：
+   同一工作进程连续启动失败超过 max_start_failures 次后，map 抛出 RuntimeError 并附上进程的错误信息
+用法:
+    with OcrExecutor(num_workers=8, engine='hub') as executor:
+        results = executor.map(crops)   # [(车牌号, 置信度), ...]
+"""
+
+import multiprocessing as mp
+import os
+import queue
+from itertools import count
+from multiprocessing import shared_memory
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+# 每个共享内存槽位能容纳的最大截图尺寸，超出时退回普通队列传输
+DEFAULT_MAX_CROP_SHAPE = (160, 480, 3)
+
+# 工作进程共享整数 current 的特殊取值
+_LOADING = -2  # 正在加载模型
+_IDLE = -1     # 空闲
+
+
+def _limit_process_threads(threads: int):
+    """在导入 paddle 之前设置 OMP/MKL 线程数；只在 OCR 工作进程里调用，不改动父进程（检测模型）的设置"""
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'CPU_NUM'):
+        os.environ[var] = str(threads)
+
+
+def create_ocr_func(engine, threads: int = None) -> Callable:
+    """
+    创建 OCR 函数: crop -> (车牌号, 置信度)
+    engine: 'paddleocr'（PaddleOCR）、'hub'（PaddleHub ch_pp-ocrv3），
+            或一个可 pickle 的无参工厂函数（返回自定义的 OCR 函数）
+    threads: OCR 的 CPU 线程数；进程内调用时只传给 PaddleOCR 的 cpu_threads，
+             不改写进程级的 OMP 环境变量（OcrExecutor 的工作进程会另外设置）
+    """
+    if callable(engine):
+        return engine()
+
+    if engine == 'paddleocr':
+        from paddleocr import PaddleOCR
+        extra = {'cpu_threads': threads} if threads else {}
+        ocr = PaddleOCR(use_angle_cls=True, lang='ch', **extra)
+
+        def recognize(crop):
+            result = ocr.ocr(crop, cls=True)
+            if result and result[0] and len(result[0]) > 0:
+                license_name, conf = result[0][0][1]
+                return license_name.replace('·', ''), conf
+            return None, None
+        return recognize
+
+    if engine == 'hub':
+        import paddlehub as hub
+        ocr = hub.Module(name="ch_pp-ocrv3")
+
+        def recognize(crop):
+            result = ocr.recognize_text(images=[crop])
+            if result and result[0]['data']:
+                return result[0]['data'][0]['text'], result[0]['data'][0]['confidence']
+            return None, None
+        return recognize
+
+    raise ValueError(f"不支持的OCR引擎: {engine}")
+
+
+def _worker_main(worker_idx, engine, shm_name, slot_bytes, task_queue, result_queue, threads=None, current=None):
+    """
+    工作进程：加载一次模型，循环处理共享内存中的截图
+    current: 共享整数，记录正在识别的 task_id（_LOADING 表示正在加载模型，_IDLE 表示空闲），
+             进程崩溃后父进程据此区分启动失败与识别某个请求时崩溃
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    if threads:
+        _limit_process_threads(threads)
+    try:
+        recognize = create_ocr_func(engine, threads)
+    except Exception as e:
+        # 把错误信息交给父进程，由父进程决定是否继续重启
+        shm.close()
+        result_queue.put((None, worker_idx, f"{type(e).__name__}: {e}"))
+        raise
+    if current is not None:
+        current.value = _IDLE
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            task_id, slot, shape, payload = task
+            if current is not None:
+                current.value = task_id
+            if payload is None:
+                crop = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+            else:
+                crop = payload
+            try:
+                text, conf = recognize(crop)
+            except Exception as e:
+                print(f"OCR工作进程 {worker_idx} 识别出错: {e}")
+                text, conf = None, None
+            del crop
+            result_queue.put((task_id, text, conf))
+            if current is not None:
+                current.value = _IDLE
+    finally:
+        shm.close()
+
+
+class _Worker:
+    def __init__(self, idx: int, slots: int, slot_bytes: int):
+        self.idx = idx
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self.free_slots = list(range(slots))
+        self.process = None
+        self.task_queue = None
+        self.current = None  # 共享整数：正在识别的 task_id
+        self.pending = {}  # {task_id: 任务元组}，用于崩溃后重新提交
+        self.start_failures = 0  # 连续启动失败次数
+        self.error = None  # 最近一次启动失败的错误信息
+
+
+class OcrExecutor:
+    """多进程分片 OCR 执行器"""
+
+    def __init__(self, num_workers: int = None, engine: str = 'hub', slots_per_worker: int = 4,
+                 max_crop_shape: Tuple[int, int, int] = DEFAULT_MAX_CROP_SHAPE, max_retries: int = 2,
+                 poll_seconds: float = 1.0, threads: int = None, max_start_failures: int = 3):
+        """
+        Args:
+            num_workers: 工作进程数，默认等于 CPU 核数；0 表示在当前进程内串行识别
+            engine: OCR 引擎，'paddleocr'、'hub' 或工厂函数，见 create_ocr_func
+            slots_per_worker: 每个工作进程同时在途的截图数
+            max_crop_shape: 共享内存槽位可容纳的最大截图尺寸 (高, 宽, 通道)
+            max_retries: 同一请求导致进程崩溃后最多重试的次数，超过后返回 (None, None)
+            poll_seconds: 等待结果时检查工作进程存活的间隔
+            threads: 每个工作进程的 OCR 线程数，默认不限制
+            max_start_failures: 同一工作进程连续启动失败（加载模型阶段退出）的最大次数，超过后不再重启
+        """
+        self.num_workers = os.cpu_count() if num_workers is None else num_workers
+        self.engine = engine
+        self.slots_per_worker = slots_per_worker
+        self.slot_bytes = int(np.prod(max_crop_shape))
+        self.max_retries = max_retries
+        self.poll_seconds = poll_seconds
+        self.threads = threads
+        self.max_start_failures = max_start_failures
+        self.restarts = 0
+        self._ids = count()
+        self._inline = None
+        self._workers = []
+        self._attempts = {}  # {task_id: 已尝试次数}
+
+        if self.num_workers == 0:
+            self._inline = create_ocr_func(engine, threads)
+            return
+        # spawn 在 Windows/Linux 上行为一致，且不会把父进程里的模型复制进子进程
+        self._ctx = mp.get_context('spawn')
+        self._result_queue = self._ctx.Queue()
+        for idx in range(self.num_workers):
+            worker = _Worker(idx, slots_per_worker, self.slot_bytes)
+            self._workers.append(worker)
+            self._start(worker)
+
+    def _start(self, worker: _Worker):
+        worker.task_queue = self._ctx.Queue()
+        worker.current = self._ctx.Value('q', _LOADING, lock=False)
+        worker.process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker.idx, self.engine, worker.shm.name, self.slot_bytes, worker.task_queue, self._result_queue,
+                  self.threads, worker.current),
+            daemon=True,
+        )
+        worker.process.start()
+
+    def _restart_dead_workers(self, results: dict):
+        for worker in self._workers:
+            if worker.process.is_alive():
+                continue
+            crashed_on = worker.current.value
+            if crashed_on == _LOADING:
+                # 还没加载完模型就退出，重启多半同样失败，连续失败超过上限后放弃
+                worker.start_failures += 1
+                if worker.start_failures > self.max_start_failures:
+                    self._collect_errors()
+                    raise RuntimeError(f"OCR工作进程 {worker.idx} 连续启动失败 {worker.start_failures} 次 "
+                                       f"(exitcode={worker.process.exitcode}): {worker.error or '未知错误'}")
+            else:
+                worker.start_failures = 0
+            print(f"OCR工作进程 {worker.idx} 已退出 (exitcode={worker.process.exitcode})，正在重启")
+            self.restarts += 1
+            self._start(worker)
+            # 截图仍在共享内存槽位中，直接重新提交；只有崩溃时正在识别的请求计入重试次数
+            for task_id, task in sorted(worker.pending.items()):
+                if task_id == crashed_on:
+                    self._attempts[task_id] += 1
+                if self._attempts[task_id] > self.max_retries:
+                    self._finish(worker, task_id, task[1])
+                    results[task_id] = (None, None)
+                else:
+                    worker.task_queue.put(task)
+
+    def _collect_errors(self):
+        """读出结果队列中工作进程上报的启动错误（放弃执行前调用，其余结果一并丢弃）"""
+        while True:
+            try:
+                task_id, idx, message = self._result_queue.get(timeout=0.1)
+            except queue.Empty:
+                return
+            if task_id is None:
+                self._workers[idx].error = message
+
+    def _finish(self, worker: _Worker, task_id: int, slot: int):
+        worker.pending.pop(task_id, None)
+        self._attempts.pop(task_id, None)
+        worker.free_slots.append(slot)
+
+    def _submit(self, worker: _Worker, crop: np.ndarray) -> int:
+        task_id = next(self._ids)
+        crop = np.ascontiguousarray(crop, dtype=np.uint8)
+        slot = worker.free_slots.pop()
+        if crop.nbytes <= self.slot_bytes:
+            view = np.ndarray(crop.shape, dtype=np.uint8, buffer=worker.shm.buf, offset=slot * self.slot_bytes)
+            view[...] = crop
+            del view
+            task = (task_id, slot, crop.shape, None)
+        else:
+            # 超出槽位大小的截图退回队列传输，但仍占用一个在途名额
+            task = (task_id, slot, crop.shape, crop)
+        worker.pending[task_id] = task
+        self._attempts[task_id] = 0
+        worker.task_queue.put(task)
+        return task_id
+
+    def map(self, crops: List[np.ndarray]) -> List[Tuple[Optional[str], Optional[float]]]:
+        """识别一批截图，按输入顺序返回 [(车牌号, 置信度), ...]"""
+        if self._inline is not None:
+            return [self._inline(crop) for crop in crops]
+
+        order = []          # 输入序号 -> task_id
+        results = {}        # task_id -> (车牌号, 置信度)
+        owner = {}          # task_id -> worker
+        next_input = 0
+        while len(results) < len(crops):
+            # 尽量让每个工作进程的槽位都处于在途状态
+            for worker in self._workers:
+                while next_input < len(crops) and worker.free_slots:
+                    task_id = self._submit(worker, crops[next_input])
+                    order.append(task_id)
+                    owner[task_id] = worker
+                    next_input += 1
+            self._restart_dead_workers(results)
+            try:
+                task_id, text, conf = self._result_queue.get(timeout=self.poll_seconds)
+            except queue.Empty:
+                continue
+            if task_id is None:
+                # 工作进程启动失败上报的错误信息: (None, 进程序号, 错误)
+                self._workers[text].error = conf
+                continue
+            worker = owner.get(task_id)
+            if worker is None or task_id not in worker.pending:
+                continue  # 崩溃前已返回、重启后又重复返回的结果
+            self._finish(worker, task_id, worker.pending[task_id][1])
+            results[task_id] = (text, conf)
+        return [results[task_id] for task_id in order]
+
+    def close(self):
+        for worker in self._workers:
+            if worker.process.is_alive():
+                worker.task_queue.put(None)
+        for worker in self._workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.shm.close()
+            worker.shm.unlink()
+        self._workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,130 @@
+# encoding:utf-8
+"""
+车牌 OCR 结果记忆
+同一辆车停在摄像头前时，连续帧中车牌框的位置和截图几乎不变，可以直接复用上次的识别结果。
+但闸口处下一辆车会停在同一个位置，位置相同说明不了是同一辆车；只差一个字符的两块车牌，
+感知哈希（dHash）只差几位，而同一截图叠加轻微噪声反而差几十位，哈希距离无法区分两者。
+因此记忆按两条规则复用：
+1. 跟踪：每帧调用 begin_frame(boxes)，与上一帧框重叠的沿用同一条目，没有再出现的框立即作废
+2. 内容：截图缩放为 24x4 的格子均值并做亮度/对比度归一化，任一格子的变化超过 max_change 就重新识别；
+   换一个字符会让对应格子变化 1 以上，传感器噪声只有 0.05 左右
+"""
+
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+
+def box_iou(a: Sequence[float], b: Sequence[float]) -> float:
+    """两个 [x1, y1, x2, y2] 框的交并比"""
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def crop_signature(crop: np.ndarray, cols: int = 24, rows: int = 4) -> np.ndarray:
+    """截图的格子均值签名（减均值、除标准差，对整体亮度与对比度变化不敏感）"""
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    cells = cv2.resize(gray.astype(np.float32), (cols, rows), interpolation=cv2.INTER_AREA)
+    return (cells - cells.mean()) / (cells.std() + 1e-6)
+
+
+def signature_distance(a: np.ndarray, b: np.ndarray) -> float:
+    """两个签名中变化最大的格子的差值"""
+    return float(np.abs(a - b).max())
+
+
+class OcrMemo:
+    """按车牌框跟踪与截图内容记忆 OCR 结果"""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 10.0, iou_threshold: float = 0.5,
+                 max_change: float = 0.25, min_confidence: float = 0.8):
+        """
+        Args:
+            max_entries: 最多记住的车牌数，超出时淘汰最久未使用的
+            ttl_seconds: 条目有效期（秒）；调用方没有逐帧调用 begin_frame 时的兜底
+            iou_threshold: 车牌框与上一帧位置的最小交并比
+            max_change: 截图签名允许的最大格子变化，见 crop_signature
+            min_confidence: 只记住置信度不低于该值的结果
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.iou_threshold = iou_threshold
+        self.max_change = max_change
+        self.min_confidence = min_confidence
+        self._entries = OrderedDict()  # {条目编号: [box, 签名, text, conf, 写入时间]}
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _expire(self, now: float):
+        """淘汰过期条目，并把条目数限制在 max_entries 内（最久未使用的先淘汰）"""
+        expired = [key for key, entry in self._entries.items() if now - entry[4] > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def begin_frame(self, boxes):
+        """
+        新的一帧开始：与本帧任一车牌框都不重叠的条目立即作废
+        车辆离开后框会消失，下一辆车即使停在同一位置也不会沿用上一辆车的结果
+        """
+        boxes = [list(box) for box in boxes]
+        for key in list(self._entries):
+            if not any(box_iou(box, self._entries[key][0]) >= self.iou_threshold for box in boxes):
+                del self._entries[key]
+
+    def _match(self, box, signature: np.ndarray) -> Optional[int]:
+        for key in reversed(self._entries):
+            entry = self._entries[key]
+            if (box_iou(box, entry[0]) >= self.iou_threshold
+                    and signature_distance(signature, entry[1]) <= self.max_change):
+                return key
+        return None
+
+    def lookup(self, crop: np.ndarray, box, now: float = None) -> Optional[Tuple[str, float]]:
+        """返回记忆中的 (车牌号, 置信度)，截图有变化或已过期时返回 None"""
+        if now is None:
+            now = time.monotonic()
+        self._expire(now)
+        key = self._match(box, crop_signature(crop))
+        if key is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        entry = self._entries[key]
+        entry[0] = list(box)  # 跟随车辆的微小移动
+        return entry[2], entry[3]
+
+    def store(self, crop: np.ndarray, box, text: str, conf: float, now: float = None):
+        """记住一次识别结果（低置信度结果不记），同一位置的旧条目被替换"""
+        if now is None:
+            now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if box_iou(box, entry[0]) >= self.iou_threshold]:
+            del self._entries[key]
+        if not text or conf is None or conf < self.min_confidence:
+            return
+        self._entries[self._next_id] = [list(box), crop_signature(crop), text, float(conf), now]
+        self._next_id += 1
+        self._expire(now)
+
+    def recognize(self, crop: np.ndarray, box, ocr_func: Callable, now: float = None):
+        """
+        先查记忆，未命中时调用 ocr_func(crop) -> (车牌号, 置信度) 并记住结果
+        """
+        cached = self.lookup(crop, box, now)
+        if cached is not None:
+            return cached
+        text, conf = ocr_func(crop)
+        self.store(crop, box, text, conf, now)
+        return text, conf
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,229 @@
+# encoding:utf-8
+"""
+停车数据分析
+功能：
+1. 占用率曲线：进出事件排序后累加（扫描线），按时间桶采样
+2. 每小时到达车辆数与高峰时段
+3. 停车时长分布直方图
+4. 回头客统计（同一车牌的多次停车）
+所有计算都基于 NumPy 列数组；各分区的列数组与聚合结果按分区版本戳缓存，
+跨年查询只需合并缓存，不会逐条遍历记录。
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# 停车时长直方图的默认分桶（分钟）
+DEFAULT_DWELL_EDGES_MINUTES = (0, 15, 30, 60, 120, 240, 480, 1440, 10080)
+
+
+def to_epoch_seconds(values) -> np.ndarray:
+    """ISO 时间字符串列表 -> int64 秒（一次性向量化解析）"""
+    if len(values) == 0:
+        return np.empty(0, dtype=np.int64)
+    return np.array(values, dtype='datetime64[us]').astype('datetime64[s]').astype(np.int64)
+
+
+def _epoch(dt: datetime) -> int:
+    return int(np.datetime64(dt, 's').astype(np.int64))
+
+
+class PartitionColumns:
+    """单个分区的列式数据及其可累加的聚合结果"""
+
+    def __init__(self, records: List[Dict], dwell_edges: np.ndarray):
+        self.entry = to_epoch_seconds([r['entry_time'] for r in records])
+        self.exit = to_epoch_seconds([r['exit_time'] or r['entry_time'] for r in records])
+        self.plates = np.array([r['plate_number'] for r in records], dtype=object)
+        self.dwell_edges = dwell_edges
+        self._summary = None
+
+    def __len__(self):
+        return len(self.entry)
+
+    def summary(self) -> Dict:
+        """整个分区的聚合结果（分区已结束时可以长期缓存）"""
+        if self._summary is None:
+            self._summary = _aggregate(self.entry, self.exit, self.plates, self.dwell_edges)
+        return self._summary
+
+
+def _aggregate(entry: np.ndarray, exit_: np.ndarray, plates: np.ndarray, dwell_edges: np.ndarray) -> Dict:
+    """到达小时分布、停车时长分布、每个车牌的停车次数"""
+    hours = (entry % 86400) // 3600
+    arrivals = np.bincount(hours, minlength=24)
+    dwell_minutes = (exit_ - entry) / 60.0
+    dwell_hist, _ = np.histogram(dwell_minutes, bins=dwell_edges)
+    if len(plates):
+        unique_plates, visits = np.unique(plates.astype(str), return_counts=True)
+    else:
+        unique_plates, visits = np.empty(0, dtype=str), np.empty(0, dtype=np.int64)
+    return {
+        'arrivals': arrivals,
+        'dwell_hist': dwell_hist,
+        'dwell_total': float(dwell_minutes.sum()),
+        'plates': unique_plates,
+        'visits': visits,
+    }
+
+
+class ParkingAnalytics:
+    """基于分区归档的停车分析查询引擎"""
+
+    def __init__(self, backend, dwell_edges_minutes=DEFAULT_DWELL_EDGES_MINUTES):
+        """
+        Args:
+            backend: ParkingBackend 实例（使用其 history 归档与在场车辆）
+            dwell_edges_minutes: 停车时长直方图分桶边界（分钟），最后一桶之外的时长归入最后一桶
+        """
+        self.backend = backend
+        self.archive = backend.history
+        edges = np.asarray(dwell_edges_minutes, dtype=np.float64)
+        self.dwell_edges = np.append(edges, np.inf)
+        self._cache = {}  # 分区列数据: {分区键: (版本戳, PartitionColumns)}
+
+    def _columns(self, key: str) -> PartitionColumns:
+        # 以分区文件的修改时间/大小与索引中的记录数/费用合计为版本戳，
+        # 迟到的追加或重新计费改写分区后缓存自动失效，不依赖当前时间判断分区是否已结束
+        stamp = self.archive.partition_stamp(key)
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        columns = PartitionColumns(self.archive.read_records(key), self.dwell_edges)
+        self._cache[key] = (stamp, columns)
+        return columns
+
+    def invalidate(self, key: str = None):
+        """分区被改写后清除缓存"""
+        if key is None:
+            self._cache = {}
+        else:
+            self._cache.pop(key, None)
+
+    def query(self, start: datetime = None, end: datetime = None, bin_seconds: int = 3600) -> Dict:
+        """
+        统计 [start, end] 内的停车情况
+        Args:
+            start / end: 查询时间范围，默认覆盖全部历史
+            bin_seconds: 占用率曲线的采样间隔（秒）
+        Returns:
+            dict: 占用率曲线、高峰、到达分布、停车时长分布、回头客
+        """
+        start_s = _epoch(start) if start else None
+        end_s = _epoch(end) if end else None
+        start_iso = start.isoformat() if start else None
+        end_iso = end.isoformat() if end else None
+
+        entries, exits = [], []
+        arrivals = np.zeros(24, dtype=np.int64)
+        dwell_hist = np.zeros(len(self.dwell_edges) - 1, dtype=np.int64)
+        dwell_total = 0.0
+        completed = 0
+        plate_parts, visit_parts = [], []
+
+        for key in self.archive.partition_keys():
+            meta = self.archive.index[key]
+            # 分区内没有与查询范围重叠的停车区间
+            if start_iso and meta['end'] < start_iso:
+                continue
+            if end_iso and meta['start'] > end_iso:
+                continue
+            columns = self._columns(key)
+            if not len(columns):
+                continue
+
+            # 占用率：与查询范围重叠的停车区间全部参与扫描
+            entries.append(columns.entry)
+            exits.append(columns.exit)
+
+            # 其余指标：按驶出时间归属，分区完全落在查询范围内时直接用缓存聚合
+            fully_covered = (start_iso is None or meta['start'] >= start_iso) and \
+                            (end_iso is None or meta['end'] <= end_iso)
+            if fully_covered:
+                part = columns.summary()
+                count = len(columns)
+            else:
+                mask = np.ones(len(columns), dtype=bool)
+                if start_s is not None:
+                    mask &= columns.exit >= start_s
+                if end_s is not None:
+                    mask &= columns.exit <= end_s
+                count = int(mask.sum())
+                if not count:
+                    continue
+                part = _aggregate(columns.entry[mask], columns.exit[mask], columns.plates[mask], self.dwell_edges)
+            arrivals += part['arrivals']
+            dwell_hist += part['dwell_hist']
+            dwell_total += part['dwell_total']
+            completed += count
+            plate_parts.append(part['plates'])
+            visit_parts.append(part['visits'])
+
+        # 在场车辆：只有进入时间，驶出时间视为无穷远
+        current_entries = to_epoch_seconds([t.isoformat() for t in self.backend.current_vehicles.values()])
+        entries.append(current_entries)
+        exits.append(np.full(len(current_entries), np.iinfo(np.int64).max, dtype=np.int64))
+
+        occupancy = self._occupancy(np.concatenate(entries), np.concatenate(exits), start_s, end_s, bin_seconds)
+
+        if plate_parts:
+            plates = np.concatenate(plate_parts)
+            visits = np.concatenate(visit_parts)
+            _, inverse = np.unique(plates, return_inverse=True)
+            visits = np.bincount(inverse, weights=visits).astype(np.int64)
+        else:
+            visits = np.empty(0, dtype=np.int64)
+
+        peak_hours = np.argsort(-arrivals, kind='stable')[:3]
+        return {
+            'completed_parkings': completed,
+            'occupancy': occupancy,
+            'arrivals_by_hour': arrivals.tolist(),
+            'peak_hours': [int(h) for h in peak_hours if arrivals[h] > 0],
+            'dwell_histogram': {
+                'edges_minutes': [float(e) for e in self.dwell_edges[:-1]],
+                'counts': dwell_hist.tolist(),
+            },
+            'average_dwell_minutes': dwell_total / completed if completed else 0.0,
+            'unique_visitors': int(len(visits)),
+            'repeat_visitors': int((visits >= 2).sum()),
+        }
+
+    @staticmethod
+    def _occupancy(entry: np.ndarray, exit_: np.ndarray, start_s: Optional[int], end_s: Optional[int],
+                   bin_seconds: int) -> Dict:
+        """扫描线占用率：+1/-1 事件按时间排序后累加，再在桶边界处采样"""
+        if not len(entry):
+            return {'times': [], 'counts': [], 'peak': 0, 'peak_time': None}
+        times = np.concatenate([entry, exit_])
+        deltas = np.concatenate([np.ones(len(entry), dtype=np.int64), -np.ones(len(exit_), dtype=np.int64)])
+        # 同一时刻先处理驶出再处理进入
+        order = np.lexsort((deltas, times))
+        times = times[order]
+        level = np.cumsum(deltas[order])
+
+        finite = times[times < np.iinfo(np.int64).max]
+        lo = start_s if start_s is not None else int(finite.min())
+        hi = end_s if end_s is not None else int(finite.max())
+        samples = np.arange(lo - lo % bin_seconds, hi + 1, bin_seconds, dtype=np.int64)
+        idx = np.searchsorted(times, samples, side='right') - 1
+        counts = np.where(idx >= 0, level[np.maximum(idx, 0)], 0)
+
+        # 区间内的峰值：窗口起点的占用加上窗口内的所有事件
+        lo_idx = np.searchsorted(times, lo, side='right')
+        hi_idx = np.searchsorted(times, hi, side='right')
+        window = level[lo_idx:hi_idx]
+        base = int(level[lo_idx - 1]) if lo_idx > 0 else 0
+        if len(window) and window.max() > base:
+            peak_pos = int(window.argmax())
+            peak, peak_time = int(window[peak_pos]), int(times[lo_idx + peak_pos])
+        else:
+            peak, peak_time = base, lo
+        return {
+            'times': [str(t) for t in samples.astype('datetime64[s]')],
+            'counts': counts.tolist(),
+            'peak': peak,
+            'peak_time': str(np.datetime64(peak_time, 's')),
+        }
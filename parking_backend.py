@@ -6,19 +6,31 @@
 2. 奇数次识别=进入，偶数次识别=驶出
 3. 计算停车时长
 4. 生成停车记录
+5. 停车历史按天/按月分区归档，启动时只加载实时状态与最新分区
+6. 驶出时按计费规则计算停车费，费率调整后可批量重新计费
+7. PlateDebouncer 把同一车辆的连续识别合并为一次闸口事件，再交给奇偶判断
 """
 
 import json
 import os
+import shutil
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 
+import numpy as np
+
+from history_archive import HistoryArchive
+from parking_tariff import Tariff, rebill_records
+from pipeline_metrics import metrics
+
 class ParkingRecord:
     """单条停车记录"""
-    def __init__(self, plate_number: str, entry_time: datetime, exit_time: datetime = None):
+    def __init__(self, plate_number: str, entry_time: datetime, exit_time: datetime = None, fee: float = None):
         self.plate_number = plate_number
         self.entry_time = entry_time
         self.exit_time = exit_time
+        self.fee = fee
         self.duration = None
         if exit_time:
             self.duration = exit_time - entry_time
@@ -29,9 +41,17 @@ class ParkingRecord:
             'entry_time': self.entry_time.isoformat(),
             'exit_time': self.exit_time.isoformat() if self.exit_time else None,
             'duration_seconds': self.duration.total_seconds() if self.duration else None,
-            'duration_formatted': self.format_duration() if self.duration else None
+            'duration_formatted': self.format_duration() if self.duration else None,
+            'fee': self.fee
         }
 
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ParkingRecord':
+        """由 to_dict 的结果还原记录"""
+        entry_time = datetime.fromisoformat(data['entry_time'])
+        exit_time = datetime.fromisoformat(data['exit_time']) if data['exit_time'] else None
+        return cls(data['plate_number'], entry_time, exit_time, data.get('fee'))
+
     def format_duration(self):
         """格式化停车时长"""
         if not self.duration:
@@ -44,18 +64,97 @@ class ParkingRecord:
         
         return f"{hours}小时{minutes}分钟{seconds}秒"
 
+class PlateDebouncer:
+    """
+    闸口识别去抖：进出场按识别次数的奇偶判断，同一辆车被连续识别多次会在进场、出场之间来回翻转。
+    同一车牌首次出现时触发一次，之后只有消失超过 gap_seconds 再出现才会再次触发，
+    与 ResultLog.plate_events 的合并规则一致（相邻两次出现间隔不超过 gap_seconds 视为同一次经过闸口）。
+    用法:
+        debouncer = PlateDebouncer(30)
+        result = debouncer.submit(backend, plate, frame_time)   # 被合并时返回 None
+    """
+
+    def __init__(self, gap_seconds: float = 30.0, max_plates: int = 4096):
+        self.gap_seconds = gap_seconds
+        self.max_plates = max_plates
+        self._last_seen = {}  # {车牌号: 最近一次出现的时间}
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.merged = 0
+
+    def accept(self, plate_number: str, seen_at: datetime = None) -> bool:
+        """记录一次识别，返回是否应当作为新的闸口事件"""
+        if seen_at is None:
+            seen_at = datetime.now()
+        plate_number = plate_number.strip()
+        with self._lock:
+            last = self._last_seen.get(plate_number)
+            is_new = last is None or (seen_at - last).total_seconds() > self.gap_seconds
+            if last is None or seen_at > last:
+                self._last_seen[plate_number] = seen_at
+            if len(self._last_seen) > self.max_plates:
+                self._prune(seen_at)
+            if is_new:
+                self.accepted += 1
+            else:
+                self.merged += 1
+        return is_new
+
+    def _prune(self, now: datetime):
+        """丢掉已经消失超过 gap_seconds 的车牌，它们再出现时本来就会触发"""
+        cutoff = now - timedelta(seconds=self.gap_seconds)
+        for plate in [p for p, t in self._last_seen.items() if t < cutoff]:
+            del self._last_seen[plate]
+
+    def submit(self, backend: 'ParkingBackend', plate_number: str, seen_at: datetime = None) -> Optional[Dict]:
+        """通过去抖后调用 backend.process_plate_recognition，被合并的重复识别返回 None"""
+        if seen_at is None:
+            seen_at = datetime.now()
+        if not self.accept(plate_number, seen_at):
+            return None
+        return backend.process_plate_recognition(plate_number, seen_at)
+
+
 class ParkingBackend:
     """停车场管理后端"""
     
-    def __init__(self, data_file="parking_data.json"):
+    def __init__(self, data_file="parking_data.json", history_dir=None, partition_by='month',
+                 tariff: Tariff = None):
+        """
+        Args:
+            data_file: 实时状态文件（在场车辆、识别次数）
+            history_dir: 历史分区目录，默认为 data_file 同名的 _history 目录
+            partition_by: 历史分区粒度，'day' 或 'month'
+            tariff: 计费规则，默认使用 Tariff()
+        """
         self.data_file = data_file
-        self.current_vehicles = {}  # 当前在场车辆: {车牌号: 进入次数}
-        self.parking_history = []   # 完整停车历史记录
+        self.tariff = tariff if tariff is not None else Tariff()
+        if history_dir is None:
+            history_dir = os.path.splitext(data_file)[0] + "_history"
+        self.history = HistoryArchive(history_dir, partition_by, record_factory=ParkingRecord.from_dict)
+        self.current_vehicles = {}  # 当前在场车辆: {车牌号: 进入时间}
         self.recognition_count = {} # 每个车牌的识别次数: {车牌号: 次数}
+        self._listeners = []        # 进出场事件回调: callback(result)
         self.load_data()
 
+    def add_listener(self, callback):
+        """注册进出场事件回调，每次识别处理完成后以结果字典调用"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    @property
+    def parking_history(self) -> List[ParkingRecord]:
+        """全部停车记录（按分区时间升序，逐个懒加载全部分区）；只需最近记录时用 get_parking_history(limit)"""
+        records = []
+        for key in self.history.partition_keys():
+            records.extend(self.history.load_partition(key))
+        return records
+
     def load_data(self):
-        """从文件加载数据"""
+        """从文件加载实时状态，历史记录按分区懒加载"""
         if os.path.exists(self.data_file):
             try:
                 with open(self.data_file, 'r', encoding='utf-8') as f:
@@ -69,21 +168,26 @@ class ParkingBackend:
                     
                     self.recognition_count = data.get('recognition_count', {})
                     
-                    # 加载历史记录
-                    history_data = data.get('parking_history', [])
-                    self.parking_history = []
-                    for record in history_data:
-                        entry_time = datetime.fromisoformat(record['entry_time'])
-                        exit_time = datetime.fromisoformat(record['exit_time']) if record['exit_time'] else None
-                        parking_record = ParkingRecord(record['plate_number'], entry_time, exit_time)
-                        self.parking_history.append(parking_record)
+                    # 旧格式文件中内嵌的历史记录，一次性迁移到分区归档：
+                    # 先备份旧文件，再批量导入（重复导入会跳过已有记录），最后原子地写回不含历史的新格式，
+                    # 写回成功即迁移完成；中途崩溃时旧文件仍含历史，下次启动重新导入也不会产生重复
+                    history_data = data.get('parking_history')
+                    if history_data:
+                        backup = self.data_file + ".legacy"
+                        if not os.path.exists(backup):
+                            shutil.copy2(self.data_file, backup)
+                        added = self.history.import_records(history_data)
+                        self.save_data()
+                        print(f"已将 {added} 条历史记录迁移到 {self.history.archive_dir}（旧文件备份为 {backup}）")
                         
             except Exception as e:
                 print(f"加载数据失败: {e}")
-                self.reset_data()
+                self.current_vehicles = {}
+                self.recognition_count = {}
 
+    @metrics.timed('persist')
     def save_data(self):
-        """保存数据到文件"""
+        """保存实时状态到文件（历史记录在驶出时已追加到分区）"""
         try:
             # 转换当前车辆的datetime对象为字符串
             current_vehicles_serializable = {}
@@ -92,19 +196,21 @@ class ParkingBackend:
             
             data = {
                 'current_vehicles': current_vehicles_serializable,
-                'recognition_count': self.recognition_count,
-                'parking_history': [record.to_dict() for record in self.parking_history]
+                'recognition_count': self.recognition_count
             }
-            with open(self.data_file, 'w', encoding='utf-8') as f:
+            # 先写临时文件再替换，崩溃时不会留下写了一半的状态文件
+            tmp_path = self.data_file + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.data_file)
         except Exception as e:
             print(f"保存数据失败: {e}")
 
     def reset_data(self):
         """重置所有数据"""
         self.current_vehicles = {}
-        self.parking_history = []
         self.recognition_count = {}
+        self.history.clear()
 
     def process_plate_recognition(self, plate_number: str, current_time: datetime = None) -> Dict:
         """
@@ -137,6 +243,11 @@ class ParkingBackend:
             result = self._handle_vehicle_exit(plate_number, current_time)
         
         self.save_data()
+        for callback in list(self._listeners):
+            try:
+                callback(result)
+            except Exception as e:
+                print(f"事件回调出错: {e}")
         return result
 
     def _handle_vehicle_entry(self, plate_number: str, entry_time: datetime) -> Dict:
@@ -172,9 +283,10 @@ class ParkingBackend:
         entry_time = self.current_vehicles[plate_number]
         duration = exit_time - entry_time
         
-        # 创建停车记录
-        parking_record = ParkingRecord(plate_number, entry_time, exit_time)
-        self.parking_history.append(parking_record)
+        # 创建停车记录并计费
+        fee = self.tariff.compute_fee(entry_time, exit_time)
+        parking_record = ParkingRecord(plate_number, entry_time, exit_time, fee)
+        self.history.append(parking_record)
         
         # 从当前车辆列表中移除
         del self.current_vehicles[plate_number]
@@ -186,8 +298,9 @@ class ParkingBackend:
             'exit_time': exit_time.strftime('%Y-%m-%d %H:%M:%S'),
             'duration': parking_record.format_duration(),
             'duration_seconds': duration.total_seconds(),
+            'fee': fee,
             'recognition_count': self.recognition_count[plate_number],
-            'message': f'车牌 {plate_number} 于 {exit_time.strftime("%H:%M:%S")} 驶出停车场，停车时长: {parking_record.format_duration()}'
+            'message': f'车牌 {plate_number} 于 {exit_time.strftime("%H:%M:%S")} 驶出停车场，停车时长: {parking_record.format_duration()}，应缴费用: {fee:.2f}元'
         }
         
         print(f"🚙 [{result['message']}]")
@@ -208,26 +321,41 @@ class ParkingBackend:
         
         return vehicles
 
-    def get_parking_history(self, limit: int = None) -> List[Dict]:
-        """获取停车历史记录"""
-        history = [record.to_dict() for record in self.parking_history]
-        
-        # 按时间倒序排列
-        history.sort(key=lambda x: x['exit_time'] or x['entry_time'], reverse=True)
-        
+    def get_parking_history(self, limit: int = None, start_time: datetime = None,
+                            end_time: datetime = None, offset: int = 0) -> List[Dict]:
+        """
+        获取停车历史记录（按时间倒序）
+        Args:
+            limit: 最多返回的条数，从最新分区开始加载，够数即停止
+            start_time / end_time: 驶出时间范围，只加载与该范围重叠的分区
+            offset: 跳过最新的若干条，用于分页
+        """
+        if start_time or end_time:
+            records = self.history.records_between(start_time, end_time)
+        else:
+            records = []
+            for key in reversed(self.history.partition_keys()):
+                records.extend(self.history.load_partition(key))
+                if limit and len(records) >= offset + limit:
+                    break
+
+        # 先对记录对象排序、分页，只把当前页转换为字典
+        records.sort(key=lambda r: r.exit_time or r.entry_time, reverse=True)
         if limit:
-            history = history[:limit]
-            
+            records = records[offset:offset + limit]
+        elif offset:
+            records = records[offset:]
+        history = [record.to_dict() for record in records]
+
         return history
 
     def get_statistics(self) -> Dict:
-        """获取统计信息"""
-        total_records = len(self.parking_history)
+        """获取统计信息（来自分区索引，无需加载历史记录）"""
+        total_records = self.history.total_count()
         current_vehicles_count = len(self.current_vehicles)
         
         if total_records > 0:
-            total_duration = sum(record.duration.total_seconds() for record in self.parking_history if record.duration)
-            avg_duration = total_duration / total_records if total_records > 0 else 0
+            avg_duration = self.history.total_duration() / total_records
         else:
             avg_duration = 0
         
@@ -235,7 +363,52 @@ class ParkingBackend:
             'total_completed_parkings': total_records,
             'current_vehicles_count': current_vehicles_count,
             'average_parking_duration': self._format_duration_seconds(avg_duration),
-            'total_recognitions': sum(self.recognition_count.values())
+            'total_recognitions': sum(self.recognition_count.values()),
+            'total_fee': round(self.history.total_fee(), 2)
+        }
+
+    def rebill_history(self, tariff: Tariff = None, start_time: datetime = None,
+                       end_time: datetime = None) -> Dict:
+        """
+        按新的计费规则对历史记录批量重新计费（分区内向量化计算后整体改写）
+        Args:
+            tariff: 新的计费规则，提供时同时替换当前规则
+            start_time / end_time: 只重新计费驶出时间落在 [start_time, end_time] 内的记录，
+                同一分区中范围外的记录保持原费用不变
+        Returns:
+            dict: 改写的分区数、重新计费的记录数与这些记录的费用合计
+        """
+        if tariff is not None:
+            self.tariff = tariff
+        start_key = self.history.partition_key(start_time) if start_time else None
+        end_key = self.history.partition_key(end_time) if end_time else None
+
+        partitions, sessions, total_fee = 0, 0, 0.0
+        for key in self.history.partition_keys():
+            if (start_key and key < start_key) or (end_key and key > end_key):
+                continue
+            records = self.history.read_records(key)
+            exits = np.array([r['exit_time'] or r['entry_time'] for r in records], dtype='datetime64[us]')
+            selected = np.ones(len(records), dtype=bool)
+            if start_time:
+                selected &= exits >= np.datetime64(start_time, 'us')
+            if end_time:
+                selected &= exits <= np.datetime64(end_time, 'us')
+            indices = np.flatnonzero(selected)
+            if len(indices) == 0:
+                continue
+            fees = rebill_records([records[i] for i in indices], self.tariff)
+            for i, fee in zip(indices.tolist(), fees.tolist()):
+                records[i]['fee'] = fee
+            self.history.rewrite_partition(key, records)
+            partitions += 1
+            sessions += len(indices)
+            total_fee += float(fees.sum())
+
+        return {
+            'partitions': partitions,
+            'sessions': sessions,
+            'total_fee': round(total_fee, 2)
         }
 
     def _format_duration_seconds(self, seconds: float) -> str:
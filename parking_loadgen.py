@@ -0,0 +1,478 @@
+# encoding:utf-8
+"""
+ParkingBackend 的可复现负载生成与回放
+用于评估百万级事件、数万辆在场车辆下后台的表现（硬件选型），而不是只跑 __main__ 里的四个事件：
+1. 到达：按小时权重（早晚高峰）的非齐次泊松过程；停留时长：短停（对数正态）与通勤（约 9 小时）的混合
+2. 车牌来自固定规模的车队，同一车辆会多次来访；车位满时新到车辆被拒
+3. 多个闸口，每个闸口可以有不同的 OCR 误差：漏识别、错一个字符（形近字）、短时间内重复识别
+4. 按加速时间（或尽可能快）回放到后台，统计每秒事件数、内存增长、落盘延迟分位数
+5. 一致性：后台状态与按同样规则计算的影子模型对比，重新从磁盘加载后再对比一次；
+   另外给出与真实在场车辆的偏差（OCR 误差导致的幽灵车辆与丢失车辆）
+同一个 seed 生成完全相同的事件流（报告中附带事件流摘要，可直接比对）。
+用法:
+    python parking_loadgen.py --days 30 --daily-arrivals 20000 --fleet 60000 --capacity 30000 --gates 4
+    python parking_loadgen.py --seed 1 --max-events 200000 --speedup 3600 --out loadgen_report.json
+"""
+
+import hashlib
+import heapq
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import numpy as np
+
+from ccpd import ADS, ALPHABETS, PROVINCES
+
+# 每小时到达量的相对权重（0 点到 23 点），早晚两个高峰
+HOURLY_WEIGHTS = (0.2, 0.1, 0.1, 0.1, 0.2, 0.5, 1.5, 4.0, 6.0, 4.5, 3.0, 2.5,
+                  2.8, 2.8, 2.5, 2.5, 3.0, 4.0, 5.0, 3.5, 2.0, 1.2, 0.8, 0.4)
+
+# OCR 常见的形近字混淆
+CONFUSIONS = {'0': 'D', 'D': '0', '8': 'B', 'B': '8', '1': '7', '7': '1', '5': 'S', 'S': '5',
+              '2': 'Z', 'Z': '2', '6': 'G', 'G': '6', 'Q': '0', 'U': 'V', 'V': 'U'}
+
+
+class GateProfile:
+    """单个闸口的 OCR 误差率"""
+
+    def __init__(self, name: str, misread: float = 0.01, miss: float = 0.005, duplicate: float = 0.01):
+        self.name = name
+        self.misread = misread        # 读错一个字符
+        self.miss = miss              # 完全没读到
+        self.duplicate = duplicate    # 几秒内同一车牌又被读到一次
+
+    def to_dict(self):
+        return {'name': self.name, 'misread': self.misread, 'miss': self.miss, 'duplicate': self.duplicate}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'GateProfile':
+        return cls(data['name'], data.get('misread', 0.01), data.get('miss', 0.005), data.get('duplicate', 0.01))
+
+
+def make_fleet(rng, size: int) -> List[str]:
+    """生成 size 个互不相同的车牌号（省份 + 字母 + 5 位字母数字）"""
+    plates = set()
+    provinces = np.array(PROVINCES[:31])
+    letters = np.array(ALPHABETS[:24])
+    symbols = np.array(ADS[:34])
+    while len(plates) < size:
+        n = size - len(plates)
+        tails = symbols[rng.integers(0, len(symbols), (n, 5))]
+        heads = np.char.add(provinces[rng.integers(0, len(provinces), n)], letters[rng.integers(0, len(letters), n)])
+        plates.update(np.char.add(heads, np.array([''.join(t) for t in tails])).tolist())
+    return sorted(plates)[:size]
+
+
+class TrafficGenerator:
+    """合成进出场流量：先生成真实的停车区间，再经过各闸口的 OCR 误差得到识别事件流"""
+
+    def __init__(self,
+                 seed: int = 0,
+                 start: datetime = datetime(2024, 1, 1),
+                 days: int = 7,
+                 daily_arrivals: int = 5000,
+                 fleet_size: int = 20000,
+                 capacity: int = 10000,
+                 commuter_share: float = 0.35,
+                 gates: List[GateProfile] = None):
+        self.seed = seed
+        self.start = start
+        self.days = days
+        self.daily_arrivals = daily_arrivals
+        self.fleet_size = fleet_size
+        self.capacity = capacity
+        self.commuter_share = commuter_share
+        self.gates = gates or [GateProfile('gate_0'), GateProfile('gate_1')]
+        self.stats = {}
+
+    def _arrivals(self, rng) -> np.ndarray:
+        """到达时刻（相对 start 的秒数），每个小时内的到达数服从泊松分布"""
+        weights = np.tile(np.asarray(HOURLY_WEIGHTS, dtype=np.float64), self.days)
+        rates = self.daily_arrivals * weights / sum(HOURLY_WEIGHTS)
+        counts = rng.poisson(rates)
+        hour_starts = np.repeat(np.arange(len(counts)) * 3600.0, counts)
+        return np.sort(hour_starts + rng.uniform(0, 3600, len(hour_starts)))
+
+    def _dwell(self, rng, n: int) -> np.ndarray:
+        """停留秒数：通勤（中位 9 小时）与短停（中位 45 分钟）混合，限制在 2 分钟到 3 天"""
+        commuter = rng.random(n) < self.commuter_share
+        minutes = np.where(commuter, rng.lognormal(np.log(540), 0.25, n), rng.lognormal(np.log(45), 0.9, n))
+        return np.clip(minutes, 2, 3 * 1440) * 60
+
+    def sessions(self, rng) -> Dict[str, np.ndarray]:
+        """
+        真实的停车区间：车辆在场时不会再次到达，车位满时到达被拒
+        Returns:
+            {'plate': 车牌下标, 'entry': 秒, 'exit': 秒（超出模拟时长的为 inf）, 'gate_in', 'gate_out'}
+        """
+        fleet = self.fleet_size
+        arrivals = self._arrivals(rng)
+        dwell = self._dwell(rng, len(arrivals))
+        picks = rng.random(len(arrivals))
+        horizon = self.days * 86400.0
+
+        free = list(range(fleet))  # 不在场的车辆，交换删除保证 O(1)
+        parked = []                # (驶出时刻, 车辆下标) 小根堆
+        plates, entries, exits = [], [], []
+        rejected_full = rejected_fleet = 0
+        for t, d, p in zip(arrivals.tolist(), dwell.tolist(), picks.tolist()):
+            while parked and parked[0][0] <= t:
+                free.append(heapq.heappop(parked)[1])
+            if len(parked) >= self.capacity:
+                rejected_full += 1
+                continue
+            if not free:
+                rejected_fleet += 1
+                continue
+            k = int(p * len(free))
+            free[k], free[-1] = free[-1], free[k]
+            vehicle = free.pop()
+            heapq.heappush(parked, (t + d, vehicle))
+            plates.append(vehicle)
+            entries.append(t)
+            exits.append(t + d if t + d < horizon else np.inf)
+
+        n = len(plates)
+        self.stats.update({'arrivals': int(len(arrivals)), 'sessions': n,
+                           'rejected_full': rejected_full, 'rejected_fleet': rejected_fleet})
+        return {
+            'plate': np.array(plates, dtype=np.int64),
+            'entry': np.array(entries, dtype=np.float64),
+            'exit': np.array(exits, dtype=np.float64),
+            'gate_in': rng.integers(0, len(self.gates), n),
+            'gate_out': rng.integers(0, len(self.gates), n),
+        }
+
+    def generate(self) -> Dict:
+        """
+        Returns:
+            {'events': [(秒, 闸口下标, 识别出的车牌号, 真实车牌号), ...] 按时间排序,
+             'fleet': 车牌号列表, 'truth_on_site': 模拟结束时真实在场的车牌集合, 'digest': 事件流摘要}
+        """
+        rng = np.random.default_rng(self.seed)
+        fleet = make_fleet(rng, self.fleet_size)
+        s = self.sessions(rng)
+
+        finished = np.isfinite(s['exit'])
+        times = np.concatenate([s['entry'], s['exit'][finished]])
+        vehicles = np.concatenate([s['plate'], s['plate'][finished]])
+        gates = np.concatenate([s['gate_in'], s['gate_out'][finished]])
+        order = np.argsort(times, kind='stable')
+        times, vehicles, gates = times[order], vehicles[order], gates[order]
+
+        # 各闸口的误差率按事件展开，一次性抽样
+        misread_p = np.array([g.misread for g in self.gates])[gates]
+        miss_p = np.array([g.miss for g in self.gates])[gates]
+        dup_p = np.array([g.duplicate for g in self.gates])[gates]
+        u_miss, u_misread, u_dup = rng.random((3, len(times)))
+        positions = rng.integers(2, 7, len(times))
+        dup_delay = rng.uniform(1, 8, len(times))
+
+        events = []
+        counts = {'missed': 0, 'misread': 0, 'duplicated': 0}
+        for i in range(len(times)):
+            truth = fleet[vehicles[i]]
+            if u_miss[i] < miss_p[i]:
+                counts['missed'] += 1
+                continue
+            text = truth
+            if u_misread[i] < misread_p[i]:
+                text = self._misread(truth, int(positions[i]))
+                counts['misread'] += text != truth
+            t, gate = float(times[i]), int(gates[i])
+            events.append((t, gate, text, truth))
+            if u_dup[i] < dup_p[i]:
+                counts['duplicated'] += 1
+                events.append((t + float(dup_delay[i]), gate, text, truth))
+        events.sort(key=lambda e: e[0])
+
+        self.stats.update(counts)
+        self.stats['events'] = len(events)
+        digest = hashlib.blake2b(digest_size=16)
+        for t, gate, text, _ in events:
+            digest.update(f"{t:.3f}|{gate}|{text}\n".encode('utf-8'))
+        truth_on_site = {fleet[v] for v in s['plate'][~finished].tolist()}
+        return {'events': events, 'fleet': fleet, 'truth_on_site': truth_on_site, 'digest': digest.hexdigest()}
+
+    @staticmethod
+    def _misread(plate: str, position: int) -> str:
+        """把第 position 位换成形近字；该位没有形近字时换成下一位"""
+        for pos in list(range(position, len(plate))) + list(range(2, position)):
+            if plate[pos] in CONFUSIONS:
+                return plate[:pos] + CONFUSIONS[plate[pos]] + plate[pos + 1:]
+        return plate
+
+    def to_dict(self):
+        return {'seed': self.seed, 'start': self.start.isoformat(), 'days': self.days,
+                'daily_arrivals': self.daily_arrivals, 'fleet_size': self.fleet_size, 'capacity': self.capacity,
+                'commuter_share': self.commuter_share, 'gates': [g.to_dict() for g in self.gates]}
+
+
+class ShadowModel:
+    """按 ParkingBackend 的规则（同一车牌奇数次为进入、偶数次为驶出）独立计算期望状态"""
+
+    def __init__(self):
+        self.counts = {}
+        self.on_site = {}
+        self.completed = 0
+        self.total_duration = 0.0
+        self.orphan_exits = 0
+
+    def apply(self, plate: str, t: datetime):
+        count = self.counts.get(plate, 0) + 1
+        self.counts[plate] = count
+        if count % 2 == 1:
+            self.on_site[plate] = t
+        elif plate in self.on_site:
+            self.total_duration += (t - self.on_site.pop(plate)).total_seconds()
+            self.completed += 1
+        else:
+            self.orphan_exits += 1
+
+
+def rss_mb() -> float:
+    """
+    当前进程常驻内存（MB）：优先用 psutil（Windows 也可用），其次读 /proc（Linux），
+    再退回 resource 的峰值常驻内存（其他 Unix）；都不可用时返回 nan
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2 ** 20
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, AttributeError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 上 ru_maxrss 的单位是字节，其他 Unix 是 KB
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+
+def _percentiles(samples: List[float]) -> Dict:
+    if not samples:
+        return {'count': 0}
+    values = np.array(samples) * 1000
+    return {'count': len(values), 'mean_ms': float(values.mean()), 'p50_ms': float(np.percentile(values, 50)),
+            'p95_ms': float(np.percentile(values, 95)), 'p99_ms': float(np.percentile(values, 99)),
+            'max_ms': float(values.max())}
+
+
+def check_consistency(backend, shadow: ShadowModel) -> Dict:
+    """后台状态与影子模型逐项对比，返回不一致的项目（为空表示一致）"""
+    problems = {}
+    if set(backend.current_vehicles) != set(shadow.on_site):
+        problems['on_site'] = {'backend_only': len(set(backend.current_vehicles) - set(shadow.on_site)),
+                               'shadow_only': len(set(shadow.on_site) - set(backend.current_vehicles))}
+    else:
+        wrong_entry = sum(1 for p, t in shadow.on_site.items()
+                          if backend.current_vehicles[p].replace(microsecond=0) != t.replace(microsecond=0))
+        if wrong_entry:
+            problems['entry_times'] = wrong_entry
+    if backend.history.total_count() != shadow.completed:
+        problems['completed'] = {'backend': backend.history.total_count(), 'shadow': shadow.completed}
+    if abs(backend.history.total_duration() - shadow.total_duration) > 1.0 * max(shadow.completed, 1):
+        problems['total_duration'] = {'backend': backend.history.total_duration(), 'shadow': shadow.total_duration}
+    if backend.recognition_count != shadow.counts:
+        problems['recognition_count'] = {'backend': sum(backend.recognition_count.values()),
+                                         'shadow': sum(shadow.counts.values())}
+    return problems
+
+
+class LoadHarness:
+    """把生成的事件流按加速时间回放到一个全新的 ParkingBackend"""
+
+    def __init__(self, generator: TrafficGenerator, workdir: str = None, speedup: float = 0.0,
+                 max_events: int = None, sample_every: int = 10000, partition_by: str = 'month'):
+        """
+        Args:
+            workdir: 后台数据目录，默认使用临时目录并在结束后删除
+            speedup: 模拟时间 / 墙上时间 的倍数，0 表示不等待、尽可能快
+            max_events: 只回放前若干个事件
+            sample_every: 每隔多少个事件采样一次吞吐与内存
+        """
+        self.generator = generator
+        self.workdir = workdir
+        self.speedup = speedup
+        self.max_events = max_events
+        self.sample_every = sample_every
+        self.partition_by = partition_by
+
+    def run(self) -> Dict:
+        from parking_backend import ParkingBackend
+
+        gen_start = time.perf_counter()
+        traffic = self.generator.generate()
+        generate_seconds = time.perf_counter() - gen_start
+        events = traffic['events'][:self.max_events] if self.max_events else traffic['events']
+
+        keep = self.workdir is not None
+        workdir = self.workdir or tempfile.mkdtemp(prefix="parking_loadgen_")
+        os.makedirs(workdir, exist_ok=True)
+        data_file = os.path.join(workdir, "parking_data.json")
+        try:
+            backend = ParkingBackend(data_file, partition_by=self.partition_by)
+            backend.reset_data()
+            persist, archive = [], []
+            self._instrument(backend, persist, archive)
+            # 后台每个事件都会打印一行，百万级回放时只会拖慢测量
+            backend_print = _silence_backend()
+
+            shadow = ShadowModel()
+            gates = self.generator.gates
+            per_gate = np.zeros(len(gates), dtype=np.int64)
+            samples = []
+            rss_start = rss_mb()
+            base = self.generator.start
+            wall_start = time.perf_counter()
+            window_start, window_index = wall_start, 0
+            for i, (t, gate, text, _) in enumerate(events):
+                if self.speedup:
+                    ahead = t / self.speedup - (time.perf_counter() - wall_start)
+                    if ahead > 0:
+                        time.sleep(ahead)
+                when = base + timedelta(seconds=t)
+                backend.process_plate_recognition(text, when)
+                shadow.apply(text, when)
+                per_gate[gate] += 1
+                if (i + 1) % self.sample_every == 0 or i + 1 == len(events):
+                    now = time.perf_counter()
+                    samples.append({'events': i + 1, 'sim_time': when.isoformat(),
+                                    'events_per_s': (i + 1 - window_index) / max(now - window_start, 1e-9),
+                                    'rss_mb': round(rss_mb(), 1), 'on_site': len(backend.current_vehicles),
+                                    'history': backend.history.total_count()})
+                    window_start, window_index = now, i + 1
+                    print(f"[{i + 1}/{len(events)}] {samples[-1]['events_per_s']:.0f} 事件/秒, "
+                          f"在场 {samples[-1]['on_site']}, 内存 {samples[-1]['rss_mb']:.0f}MB")
+            elapsed = time.perf_counter() - wall_start
+            _restore_backend(backend_print)
+
+            live_problems = check_consistency(backend, shadow)
+            reload_start = time.perf_counter()
+            reloaded = ParkingBackend(data_file, partition_by=self.partition_by)
+            reload_seconds = time.perf_counter() - reload_start
+            reload_problems = check_consistency(reloaded, shadow)
+
+            truth = traffic['truth_on_site']
+            on_site = set(backend.current_vehicles)
+            return {
+                'config': self.generator.to_dict(),
+                'digest': traffic['digest'],
+                'traffic': dict(self.generator.stats),
+                'generate_seconds': generate_seconds,
+                'replayed_events': len(events),
+                'events_per_gate': {g.name: int(c) for g, c in zip(gates, per_gate)},
+                'elapsed_seconds': elapsed,
+                'events_per_s': len(events) / max(elapsed, 1e-9),
+                'speedup': self.speedup or None,
+                'memory': {'start_mb': round(rss_start, 1), 'end_mb': round(rss_mb(), 1),
+                           'growth_mb': round(rss_mb() - rss_start, 1)},
+                'persist_latency': _percentiles(persist),
+                'archive_append_latency': _percentiles(archive),
+                'reload_ms': reload_seconds * 1000,
+                'consistency': {
+                    'live': live_problems or 'ok',
+                    'after_reload': reload_problems or 'ok',
+                    'orphan_exits': shadow.orphan_exits,
+                },
+                # 只有回放完整事件流时，与真实在场车辆的对比才有意义
+                'vs_ground_truth': None if len(events) != len(traffic['events']) else {
+                    'on_site': len(on_site), 'truth_on_site': len(truth),
+                    'phantom': len(on_site - truth), 'missing': len(truth - on_site),
+                },
+                'samples': samples,
+            }
+        finally:
+            if not keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    @staticmethod
+    def _instrument(backend, persist: List[float], archive: List[float]):
+        """在实例上包装 save_data 与归档追加，记录每次落盘耗时"""
+        save_data = backend.save_data
+        append = backend.history.append
+
+        def timed_save():
+            start = time.perf_counter()
+            save_data()
+            persist.append(time.perf_counter() - start)
+
+        def timed_append(record):
+            start = time.perf_counter()
+            append(record)
+            archive.append(time.perf_counter() - start)
+
+        backend.save_data = timed_save
+        backend.history.append = timed_append
+
+
+def _silence_backend():
+    import parking_backend
+    original = parking_backend.__dict__.get('print')
+    parking_backend.print = lambda *args, **kwargs: None
+    return original
+
+
+def _restore_backend(original):
+    import parking_backend
+    if original is None:
+        del parking_backend.print
+    else:
+        parking_backend.print = original
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="ParkingBackend 负载生成与回放")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--daily-arrivals', type=int, default=5000)
+    parser.add_argument('--fleet', type=int, default=20000, help='车队规模（不同车牌数）')
+    parser.add_argument('--capacity', type=int, default=10000, help='车位数')
+    parser.add_argument('--commuter-share', type=float, default=0.35)
+    parser.add_argument('--gates', type=int, default=2, help='闸口数量（误差率相同）')
+    parser.add_argument('--gate-config', default=None, help='闸口配置 JSON: [{"name", "misread", "miss", "duplicate"}]')
+    parser.add_argument('--misread', type=float, default=0.01)
+    parser.add_argument('--miss', type=float, default=0.005)
+    parser.add_argument('--duplicate', type=float, default=0.01)
+    parser.add_argument('--speedup', type=float, default=0.0, help='加速倍数，0 为尽可能快')
+    parser.add_argument('--max-events', type=int, default=None)
+    parser.add_argument('--sample-every', type=int, default=10000)
+    parser.add_argument('--partition-by', default='month', choices=['day', 'month'])
+    parser.add_argument('--workdir', default=None, help='保留后台数据的目录（默认临时目录，结束后删除）')
+    parser.add_argument('--out', default='loadgen_report.json')
+    args = parser.parse_args()
+
+    if args.gate_config:
+        with open(args.gate_config, 'r', encoding='utf-8') as f:
+            gates = [GateProfile.from_dict(g) for g in json.load(f)]
+    else:
+        gates = [GateProfile(f'gate_{i}', args.misread, args.miss, args.duplicate) for i in range(args.gates)]
+    generator = TrafficGenerator(args.seed, days=args.days, daily_arrivals=args.daily_arrivals,
+                                 fleet_size=args.fleet, capacity=args.capacity,
+                                 commuter_share=args.commuter_share, gates=gates)
+    report = LoadHarness(generator, args.workdir, args.speedup, args.max_events, args.sample_every,
+                         args.partition_by).run()
+    report['timestamp'] = datetime.now().isoformat()
+    summary = {k: report[k] for k in ('digest', 'replayed_events', 'events_per_s', 'memory',
+                                      'persist_latency', 'consistency', 'vs_ground_truth')}
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"报告已写入 {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+# encoding:utf-8
+"""
+停车计费
+功能：
+1. 免费时长：停车时长不超过免费时长不收费
+2. 按小时或阶梯费率计费（不足一个计费单位按一个单位计）
+3. 每 24 小时封顶
+4. 夜间时段单独费率
+5. 向量化批量计费：费率调整后对历史记录重新计费，不逐条循环
+"""
+
+from datetime import datetime
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from parking_analytics import to_epoch_seconds
+
+DAY_SECONDS = 86400
+
+
+class Tariff:
+    """计费规则"""
+
+    def __init__(self,
+                 free_minutes: int = 15,
+                 rate_steps: Sequence[Tuple[int, float]] = ((0, 5.0),),
+                 unit_minutes: int = 60,
+                 daily_cap: float = None,
+                 night_hours: Tuple[int, int] = None,
+                 night_rate: float = 0.0):
+        """
+        Args:
+            free_minutes: 免费时长（分钟）
+            rate_steps: 阶梯费率 [(起始分钟, 每小时费用), ...]，只有一档即按小时计费。
+                        例如 ((0, 5.0), (120, 3.0)) 表示前2小时5元/小时，之后3元/小时
+            unit_minutes: 计费单位（分钟），不足一个单位按一个单位计
+            daily_cap: 每24小时封顶金额，None 表示不封顶
+            night_hours: 夜间时段 (开始小时, 结束小时)，可跨零点，例如 (22, 7)
+            night_rate: 夜间每小时费用，夜间时长不参与阶梯计费
+        """
+        steps = sorted(rate_steps)
+        if not steps or steps[0][0] != 0:
+            raise ValueError("阶梯费率必须从第0分钟开始")
+        self.free_minutes = free_minutes
+        self.rate_steps = steps
+        self.unit_minutes = unit_minutes
+        self.daily_cap = daily_cap
+        self.night_hours = night_hours
+        self.night_rate = night_rate
+
+        self._step_starts = np.array([s[0] for s in steps], dtype=np.float64)
+        self._step_ends = np.append(self._step_starts[1:], np.inf)
+        self._step_rates = np.array([s[1] for s in steps], dtype=np.float64) / 60.0  # 每分钟费用
+
+    def to_dict(self) -> Dict:
+        return {
+            'free_minutes': self.free_minutes,
+            'rate_steps': [list(step) for step in self.rate_steps],
+            'unit_minutes': self.unit_minutes,
+            'daily_cap': self.daily_cap,
+            'night_hours': list(self.night_hours) if self.night_hours else None,
+            'night_rate': self.night_rate,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Tariff':
+        night_hours = data.get('night_hours')
+        return cls(
+            free_minutes=data.get('free_minutes', 15),
+            rate_steps=[tuple(step) for step in data.get('rate_steps', [(0, 5.0)])],
+            unit_minutes=data.get('unit_minutes', 60),
+            daily_cap=data.get('daily_cap'),
+            night_hours=tuple(night_hours) if night_hours else None,
+            night_rate=data.get('night_rate', 0.0),
+        )
+
+    # --------- 向量化计费 ----------
+    def _round_up(self, minutes: np.ndarray) -> np.ndarray:
+        return np.ceil(minutes / self.unit_minutes) * self.unit_minutes
+
+    def _step_fee(self, minutes: np.ndarray) -> np.ndarray:
+        """白天时长按阶梯费率计费"""
+        minutes = self._round_up(minutes)[:, None]
+        in_step = np.clip(minutes - self._step_starts, 0, self._step_ends - self._step_starts)
+        return in_step @ self._step_rates
+
+    def _night_seconds_before(self, t: np.ndarray) -> np.ndarray:
+        """从纪元零点到 t 之间的夜间秒数（用于求任意区间的夜间时长）"""
+        start, end = self.night_hours[0] * 3600, self.night_hours[1] * 3600
+        days, sec = np.divmod(t, DAY_SECONDS)
+        if start < end:
+            night_len = end - start
+            partial = np.clip(sec - start, 0, night_len)
+        else:
+            night_len = DAY_SECONDS - start + end
+            partial = np.minimum(sec, end) + np.maximum(sec - start, 0)
+        return days * night_len + partial
+
+    def _period_fee(self, total_minutes: np.ndarray, night_minutes: np.ndarray) -> np.ndarray:
+        fee = self._step_fee(total_minutes - night_minutes)
+        if self.night_hours:
+            fee = fee + self._round_up(night_minutes) * (self.night_rate / 60.0)
+        if self.daily_cap is not None:
+            fee = np.minimum(fee, self.daily_cap)
+        return fee
+
+    def compute_fees(self, entry_seconds: np.ndarray, exit_seconds: np.ndarray) -> np.ndarray:
+        """
+        批量计费，每个24小时周期（从进入时间起算）单独封顶，阶梯费率也按周期重新起算
+        Args:
+            entry_seconds / exit_seconds: 进入、驶出时间（int64 秒，本地时间）
+        Returns:
+            np.ndarray: 每条记录的费用（元，保留两位小数）
+        """
+        entry_seconds = np.asarray(entry_seconds, dtype=np.int64)
+        exit_seconds = np.asarray(exit_seconds, dtype=np.int64)
+        duration = np.maximum(exit_seconds - entry_seconds, 0)
+
+        # 完整的24小时周期：夜间时长恒定，费用只需计算一次
+        full_days, remainder = np.divmod(duration, DAY_SECONDS)
+        if self.night_hours:
+            one_day_night = self._night_seconds_before(np.array([DAY_SECONDS], dtype=np.int64)) / 60.0
+            tail_start = entry_seconds + full_days * DAY_SECONDS
+            tail_night = (self._night_seconds_before(exit_seconds) - self._night_seconds_before(tail_start)) / 60.0
+        else:
+            one_day_night = np.zeros(1)
+            tail_night = np.zeros(len(duration))
+        day_fee = self._period_fee(np.array([1440.0]), one_day_night)[0]
+        tail_fee = np.where(remainder > 0, self._period_fee(remainder / 60.0, tail_night), 0.0)
+
+        fees = full_days * day_fee + tail_fee
+        fees = np.where(duration <= self.free_minutes * 60, 0.0, fees)
+        return np.round(fees, 2)
+
+    def compute_fee(self, entry_time: datetime, exit_time: datetime) -> float:
+        """单条记录计费"""
+        fees = self.compute_fees(to_epoch_seconds([entry_time.isoformat()]),
+                                 to_epoch_seconds([exit_time.isoformat()]))
+        return float(fees[0])
+
+
+def rebill_records(records: List[Dict], tariff: Tariff) -> np.ndarray:
+    """对一批 to_dict 格式的记录按新费率重新计费，返回费用数组"""
+    entry = to_epoch_seconds([r['entry_time'] for r in records])
+    exit_ = to_epoch_seconds([r['exit_time'] or r['entry_time'] for r in records])
+    return tariff.compute_fees(entry, exit_)
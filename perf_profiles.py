@@ -0,0 +1,276 @@
+# encoding:utf-8
+"""
+推理性能配置档
+所有推理入口原来都是 model(img) 默认设置：torch 与 OpenCV 各自按核数开线程池，在共用的 CPU 机器上互相抢占；
+输入尺寸随图片变化，每次都重新走一遍图优化；首个请求还要承担模型初始化的开销。
+配置档把这些设置集中成几个命名方案：
+1. torch 算子内 / 算子间线程数（torch.set_num_threads）、OpenCV 线程数、OCR 工作进程数及每个 OCR 进程的线程数
+2. 固定输入尺寸；model_format 为 onnx / onnx-int8 时按该尺寸导出静态形状的 ONNX，图只构建一次
+3. 加载后用该尺寸的空白图预热若干次
+4. 进程 CPU 亲和性（只在支持 os.sched_setaffinity 的平台上生效）
+半精度只在有 CUDA 时启用；纯 CPU 上 torch 的 FP16 卷积反而更慢，CPU 上对应的是 onnx-int8。
+选择方式：命令行 --profile（见 add_profile_argument），或环境变量 PLATE_PERF_PROFILE；
+值可以是内置名称，也可以是 JSON 文件 {"名称": {...}} 或 {"name": ..., ...}。
+用法:
+    profile = apply_profile('gate-low-latency')
+    model = profile.load_model('models/best.pt')      # 按配置加载并预热
+    results = model(frame, **profile.predict_kwargs())
+"""
+
+import json
+import os
+import shutil
+from typing import Dict, List, Optional
+
+ENV_VAR = 'PLATE_PERF_PROFILE'
+
+
+def _available_cores() -> List[int]:
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_cores(spec) -> Optional[List[int]]:
+    """'0-3,6' / [0, 1, 2] / 'first:4' / 'last:4' -> 核编号列表；None 表示不限制"""
+    if spec is None or isinstance(spec, list):
+        return spec
+    cores = _available_cores()
+    if spec.startswith('first:'):
+        return cores[:int(spec.split(':', 1)[1])]
+    if spec.startswith('last:'):
+        return cores[-int(spec.split(':', 1)[1]):]
+    result = []
+    for part in spec.split(','):
+        if '-' in part:
+            lo, hi = part.split('-', 1)
+            result.extend(range(int(lo), int(hi) + 1))
+        elif part.strip():
+            result.append(int(part))
+    return result
+
+
+class PerfProfile:
+    """一组推理性能设置；值为 None 的项保持库的默认行为"""
+
+    def __init__(self,
+                 name: str,
+                 torch_threads: int = None,
+                 torch_interop_threads: int = None,
+                 opencv_threads: int = None,
+                 ocr_workers: int = None,
+                 ocr_threads: int = None,
+                 imgsz: int = None,
+                 batch: int = 1,
+                 model_format: str = 'pt',
+                 half: bool = False,
+                 warmup: int = 0,
+                 cpu_affinity=None,
+                 description: str = ''):
+        """
+        Args:
+            ocr_workers: OcrExecutor 工作进程数（0 为进程内识别）
+            ocr_threads: 每个 OCR 进程的线程数（OMP/MKL 线程与 PaddleOCR cpu_threads）
+            imgsz: 固定的检测输入尺寸；None 时使用模型默认
+            batch: 批量入口（watch_ingest、evaluate、tiled_inference）的检测批大小
+            model_format: 'pt'、'onnx'（静态形状 FP32，批大小固定为 1）或 'onnx-int8'
+            half: 有 CUDA 时用 FP16 推理
+            warmup: 加载后的预热次数
+            cpu_affinity: 核编号列表或 '0-3' / 'first:4' 形式的字符串
+        """
+        self.name = name
+        self.torch_threads = torch_threads
+        self.torch_interop_threads = torch_interop_threads
+        self.opencv_threads = opencv_threads
+        self.ocr_workers = ocr_workers
+        self.ocr_threads = ocr_threads
+        self.imgsz = imgsz
+        self.batch = batch
+        self.model_format = model_format
+        self.half = half
+        self.warmup = warmup
+        self.cpu_affinity = cpu_affinity
+        self.description = description
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'torch_threads': self.torch_threads,
+            'torch_interop_threads': self.torch_interop_threads,
+            'opencv_threads': self.opencv_threads,
+            'ocr_workers': self.ocr_workers,
+            'ocr_threads': self.ocr_threads,
+            'imgsz': self.imgsz,
+            'batch': self.batch,
+            'model_format': self.model_format,
+            'half': self.half,
+            'warmup': self.warmup,
+            'cpu_affinity': self.cpu_affinity,
+            'description': self.description,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'PerfProfile':
+        return cls(**{k: v for k, v in data.items() if k in cls('').to_dict()})
+
+    # --------- 进程级设置 ----------
+    def apply(self) -> 'PerfProfile':
+        """
+        设置线程数与 CPU 亲和性
+        本进程 torch 的线程数由 torch.set_num_threads 设置，无论 torch 是否已经导入都有效；
+        OMP/MKL 环境变量只对之后启动的子进程（以及尚未导入 torch 的本进程）生效。
+        single.py、demo.py 等脚本在模块顶部就导入了 ultralytics，对它们来说环境变量不起作用。
+        """
+        if self.torch_threads:
+            for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+                os.environ[var] = str(self.torch_threads)
+        cores = parse_cores(self.cpu_affinity)
+        if cores and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cores)
+        if self.opencv_threads is not None:
+            import cv2
+            cv2.setNumThreads(self.opencv_threads)
+        if self.torch_threads or self.torch_interop_threads:
+            try:
+                import torch
+            except ImportError:
+                return self
+            if self.torch_threads:
+                torch.set_num_threads(self.torch_threads)
+            if self.torch_interop_threads:
+                try:
+                    torch.set_num_interop_threads(self.torch_interop_threads)
+                except RuntimeError:
+                    # 已经执行过并行算子后不能再修改，保持原值
+                    pass
+        return self
+
+    # --------- 模型 ----------
+    @property
+    def static_shape(self) -> bool:
+        """导出的 ONNX 为静态形状：输入必须是 imgsz x imgsz、批大小为 1"""
+        return self.model_format != 'pt'
+
+    def _use_half(self) -> bool:
+        if not self.half:
+            return False
+        try:
+            import torch
+            return torch.cuda.is_available()
+        except ImportError:
+            return False
+
+    def predict_kwargs(self) -> Dict:
+        """传给 model(...) 的参数；默认配置档返回空字典，行为与不传完全一致"""
+        kwargs = {}
+        if self.imgsz:
+            kwargs['imgsz'] = self.imgsz
+        if self._use_half():
+            kwargs['half'] = True
+        return kwargs
+
+    def load_model(self, model_path: str, warmup: bool = True):
+        """
+        按 model_format 加载检测模型并预热
+        onnx 按 imgsz 导出静态形状（文件名带尺寸），与 evaluate.load_model 的动态形状导出互不覆盖
+        """
+        from ultralytics import YOLO
+        if self.model_format == 'pt' or not model_path.endswith('.pt'):
+            model = YOLO(model_path, task='detect')
+        else:
+            imgsz = self.imgsz or 640
+            stem = f"{os.path.splitext(model_path)[0]}_{imgsz}"
+            onnx_path = stem + ".onnx"
+            if not os.path.exists(onnx_path):
+                # 导出文件名跟随权重文件名，先复制一份带尺寸的权重，避免覆盖已有的动态形状 ONNX
+                shutil.copyfile(model_path, stem + ".pt")
+                try:
+                    YOLO(stem + ".pt", task='detect').export(format='onnx', imgsz=imgsz, dynamic=False, simplify=True)
+                finally:
+                    os.remove(stem + ".pt")
+            if self.model_format == 'onnx-int8':
+                int8_path = stem + "_int8.onnx"
+                if not os.path.exists(int8_path):
+                    from onnxruntime.quantization import QuantType, quantize_dynamic
+                    quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QUInt8)
+                onnx_path = int8_path
+            elif self.model_format != 'onnx':
+                raise ValueError(f"不支持的模型格式: {self.model_format}")
+            model = YOLO(onnx_path, task='detect')
+        if warmup:
+            self.warm_up(model)
+        return model
+
+    def warm_up(self, model):
+        """用固定尺寸的空白图跑 warmup 次，首个真实请求不再承担初始化开销"""
+        if not self.warmup:
+            return
+        import numpy as np
+        size = self.imgsz or 640
+        blank = np.zeros((size, size, 3), dtype=np.uint8)
+        for _ in range(self.warmup):
+            model(blank, verbose=False, **self.predict_kwargs())
+
+    def ocr_executor(self, engine='hub', num_workers: int = None):
+        """按配置创建 OcrExecutor；num_workers 显式给出时优先"""
+        from ocr_executor import OcrExecutor
+        workers = num_workers if num_workers is not None else self.ocr_workers
+        return OcrExecutor(num_workers=workers, engine=engine, threads=self.ocr_threads)
+
+
+def _builtin_profiles() -> Dict[str, PerfProfile]:
+    cores = len(_available_cores())
+    return {
+        # 不做任何设置，与引入配置档之前的行为一致
+        'default': PerfProfile('default', description='库默认设置'),
+        # 闸口抬杆：单帧、低延迟；检测占前 4 个核，OCR 单进程，避免与其他服务抢核
+        'gate-low-latency': PerfProfile(
+            'gate-low-latency',
+            torch_threads=min(4, cores), torch_interop_threads=1, opencv_threads=1,
+            ocr_workers=1, ocr_threads=2, imgsz=480, batch=1, model_format='onnx',
+            warmup=3, cpu_affinity=f'first:{min(4, cores)}',
+            description='单帧低延迟，固定 480 输入，静态 ONNX'),
+        # 离线批量：检测批量大、每个进程线程少，靠多进程 OCR 吃满全部核
+        # PyTorch 权重可接受任意批大小；固定 imgsz 让各批的输入形状一致
+        'bulk-throughput': PerfProfile(
+            'bulk-throughput',
+            torch_threads=max(1, cores // 2), torch_interop_threads=1, opencv_threads=2,
+            ocr_workers=max(1, cores // 4), ocr_threads=1, imgsz=640, batch=16, model_format='pt',
+            warmup=1, description='批量吞吐，固定 640 输入，批大小 16'),
+    }
+
+
+PROFILES = _builtin_profiles()
+
+
+def load_profiles(path: str) -> Dict[str, PerfProfile]:
+    """从 JSON 加载配置档：{"名称": {...}} 或单个 {"name": ..., ...}"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if 'name' in data:
+        data = {data['name']: data}
+    return {name: PerfProfile.from_dict({**cfg, 'name': name}) for name, cfg in data.items()}
+
+
+def get_profile(spec: str = None) -> PerfProfile:
+    """按名称或 JSON 文件取配置档；spec 为空时读取环境变量 PLATE_PERF_PROFILE，都没有则为 default"""
+    spec = spec or os.environ.get(ENV_VAR) or 'default'
+    if spec in PROFILES:
+        return PROFILES[spec]
+    if os.path.exists(spec):
+        profiles = load_profiles(spec)
+        return next(iter(profiles.values()))
+    raise ValueError(f"未知的性能配置档: {spec}（可选 {', '.join(PROFILES)} 或 JSON 文件）")
+
+
+def apply_profile(spec: str = None) -> PerfProfile:
+    """取配置档并立即应用进程级设置，各入口在加载模型之前调用"""
+    profile = get_profile(spec).apply()
+    if profile.name != 'default':
+        print(f"性能配置档: {profile.name}（{profile.description}）")
+    return profile
+
+
+def add_profile_argument(parser):
+    parser.add_argument('--profile', default=os.environ.get(ENV_VAR),
+                        help=f"性能配置档: {', '.join(PROFILES)} 或 JSON 文件（也可用环境变量 {ENV_VAR}）")
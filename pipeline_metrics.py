@@ -0,0 +1,219 @@
+# encoding:utf-8
+"""
+识别流程性能埋点
+功能：
+1. 分阶段计时：with metrics.stage('ocr'): ... 或 @metrics.timed('yolo')
+2. 每个阶段的延迟直方图与 p50/p95/p99
+3. 计数器：帧数、车牌数、OCR 失败次数等
+4. 输出：控制台汇总、Prometheus 文本格式文件或 HTTP 端点
+默认关闭，关闭时计时器是一个共享的空上下文，几乎没有开销。
+设置环境变量 PLATE_METRICS=1 或调用 metrics.enable() 开启。
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict
+
+# Prometheus 直方图分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 计算分位数时保留的最近样本数
+RESERVOIR_SIZE = 10000
+
+
+class _NullTimer:
+    """关闭埋点时使用的空计时器"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class StageHistogram:
+    """单个阶段的延迟统计"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=RESERVOIR_SIZE)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.samples.append(seconds)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        pos = min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))
+        return ordered[pos]
+
+
+class _StageTimer:
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    """埋点注册表"""
+
+    def __init__(self, enabled: bool = False, prefix: str = "plate_pipeline"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.histograms = {}  # {阶段名: StageHistogram}
+        self.counters = {}    # {计数器名: 数值}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+
+    # --------- 埋点接口 ----------
+    def stage(self, name: str):
+        """阶段计时上下文管理器"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self, name)
+
+    def timed(self, name: str):
+        """阶段计时装饰器"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _StageTimer(self, name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = StageHistogram()
+            histogram.observe(seconds)
+
+    def count(self, name: str, value: int = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    # --------- 输出 ----------
+    def summary(self) -> Dict:
+        """各阶段的次数、平均值与分位数（毫秒），以及计数器"""
+        with self._lock:
+            stages = {}
+            for name, h in self.histograms.items():
+                stages[name] = {
+                    'count': h.count,
+                    'mean_ms': h.total / h.count * 1000 if h.count else 0.0,
+                    'p50_ms': h.percentile(50) * 1000,
+                    'p95_ms': h.percentile(95) * 1000,
+                    'p99_ms': h.percentile(99) * 1000,
+                }
+            return {'stages': stages, 'counters': dict(self.counters)}
+
+    def report(self):
+        """打印汇总"""
+        if not self.enabled:
+            return
+        summary = self.summary()
+        print("=== 性能统计 ===")
+        for name, s in summary['stages'].items():
+            print(f"{name:<12} 次数:{s['count']:<6} 平均:{s['mean_ms']:.1f}ms "
+                  f"p50:{s['p50_ms']:.1f}ms p95:{s['p95_ms']:.1f}ms p99:{s['p99_ms']:.1f}ms")
+        for name, value in summary['counters'].items():
+            print(f"{name:<12} {value}")
+
+    def prometheus_text(self) -> str:
+        """Prometheus 文本格式"""
+        lines = []
+        with self._lock:
+            metric = f"{self.prefix}_stage_seconds"
+            if self.histograms:
+                lines.append(f"# HELP {metric} Latency of each pipeline stage.")
+                lines.append(f"# TYPE {metric} histogram")
+            for name, h in self.histograms.items():
+                cumulative = 0
+                for bound, n in zip(h.buckets, h.bucket_counts):
+                    cumulative += n
+                    lines.append(f'{metric}_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{stage="{name}",le="+Inf"}} {h.count}')
+                lines.append(f'{metric}_sum{{stage="{name}"}} {h.total}')
+                lines.append(f'{metric}_count{{stage="{name}"}} {h.count}')
+            for name, value in self.counters.items():
+                counter = f"{self.prefix}_{name}_total"
+                lines.append(f"# TYPE {counter} counter")
+                lines.append(f"{counter} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str = "metrics.prom"):
+        """写入 Prometheus 文本文件（可配合 node_exporter textfile collector）"""
+        if not self.enabled:
+            return
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def serve_prometheus(self, port: int = 9108, host: str = "0.0.0.0"):
+        """在后台线程中提供 /metrics 端点"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = HTTPServer((host, port), Handler)
+        thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        thread.start()
+        return self._server
+
+
+# 全局注册表，各入口脚本共用
+metrics = MetricsRegistry(enabled=os.environ.get('PLATE_METRICS', '') not in ('', '0'))
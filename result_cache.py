@@ -0,0 +1,139 @@
+# encoding:utf-8
+"""
+检测结果缓存
+功能：
+1. 文件级精确哈希：内容相同的图片（即使路径不同）直接复用检测与识别结果
+2. 车牌截图精确哈希：内容完全相同的车牌截图直接复用 OCR 结果
+3. LRU 淘汰，可选持久化到磁盘（JSON）
+不使用感知哈希（dHash）：闸口处不同车辆停在同一位置时整帧 dHash 只差一两位，
+只差一个字符的两块车牌也是如此，按汉明距离命中会把别的车牌号复用到新图片上
+缓存的结果格式: {'boxes': [[x1, y1, x2, y2], ...], 'texts': [...], 'confs': [...]}
+"""
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """文件内容的精确哈希"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class LRUCache:
+    """容量受限的 LRU 缓存，可选 JSON 持久化"""
+
+    def __init__(self, capacity: int = 1024, persist_path: str = None):
+        self.capacity = capacity
+        self.persist_path = persist_path
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if persist_path:
+            self.load()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def keys(self):
+        return list(self._data)
+
+    def get(self, key, default=None):
+        if key in self._data:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.capacity:
+            self._data.popitem(last=False)
+
+    def load(self):
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, 'r', encoding='utf-8') as f:
+                items = json.load(f)
+            for key, value in items[-self.capacity:]:
+                self._data[key] = value
+        except Exception as e:
+            print(f"加载结果缓存失败: {e}")
+
+    def save(self):
+        if not self.persist_path:
+            return
+        os.makedirs(os.path.dirname(self.persist_path) or '.', exist_ok=True)
+        tmp_path = self.persist_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(list(self._data.items()), f, ensure_ascii=False)
+        os.replace(tmp_path, self.persist_path)
+
+
+class DetectionCache:
+    """文件、车牌截图两级结果缓存"""
+
+    def __init__(self, capacity: int = 4096, persist_path: str = None):
+        """
+        Args:
+            capacity: 最大条目数
+            persist_path: 持久化文件路径
+        """
+        self.results = LRUCache(capacity, persist_path)
+        # 文件路径 -> (大小, 修改时间, 摘要)，路径未变化时无需重新读文件算哈希
+        self._digests = {}
+
+    def _file_key(self, path: str) -> str:
+        stat = os.stat(path)
+        cached = self._digests.get(path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime:
+            return cached[2]
+        key = "file:" + file_digest(path)
+        self._digests[path] = (stat.st_size, stat.st_mtime, key)
+        return key
+
+    # --------- 文件级 ----------
+    def get_file(self, path: str) -> Optional[Dict]:
+        return self.results.get(self._file_key(path))
+
+    def put_file(self, path: str, result: Dict):
+        self.results.put(self._file_key(path), result)
+
+    # --------- 车牌截图 ----------
+    @staticmethod
+    def _crop_key(crop: np.ndarray) -> str:
+        h = hashlib.blake2b(np.ascontiguousarray(crop).tobytes(), digest_size=16)
+        h.update(str(crop.shape).encode())
+        return "crop:" + h.hexdigest()
+
+    def get_crop(self, crop: np.ndarray):
+        """返回缓存的 (车牌号, 置信度)，未命中返回 None"""
+        value = self.results.get(self._crop_key(crop))
+        return tuple(value) if value is not None else None
+
+    def put_crop(self, crop: np.ndarray, text: str, conf: float):
+        self.results.put(self._crop_key(crop), [text, float(conf)])
+
+    def save(self):
+        self.results.save()
+
+    def stats(self) -> Dict:
+        return {
+            'hits': self.results.hits,
+            'misses': self.results.misses,
+            'entries': len(self.results),
+        }
@@ -0,0 +1,341 @@
+# encoding:utf-8
+"""
+检测结果的紧凑二进制日志
+results.boxes.xyxy 与 OCR 结果以前打印完就丢弃了，计费或进出场规则一改，只能把几小时的视频重新跑一遍 YOLO。
+结果日志把每一帧的检测与识别结果追加为定长记录：
+1. 帧表 frames: 帧号 int64、时间戳 float64、本帧车牌在车牌表中的起始行与数量、标志位
+   （FLAG_BACKFILL：事后补做的 OCR 结果，帧号与时间沿用原帧，按帧遍历时跳过）
+2. 车牌表 plates: 框 int16x4（像素坐标）、检测置信度 float16、OCR 置信度 float16、车牌号（UTF-8，16 字节）
+3. 每攒够 chunk_frames 帧写出一个分块（两个 .npy 文件），读取时按内存映射打开，不解析、不复制
+4. manifest.json 记录各分块的帧数、时间范围，重新打开同一目录会在末尾继续追加
+回放时按时间顺序把车牌识别事件送入 ParkingBackend，同一车牌连续出现的多帧按去重间隔合并为一次，
+数小时视频的停车记录可以在几秒内按新规则重新生成。入口、出口等多个摄像头的日志先按时间合并成一条流再回放，
+逐个回放会打乱奇偶次数的进出场配对。
+用法:
+    with ResultLogWriter('runs/log/gate_in', source='gate_in') as log:
+        log.append(frame_index, time.time(), result.boxes.xyxy, result.boxes.conf, texts, confs)
+    ResultLog('runs/log/gate_in').replay(ParkingBackend('replay.json'), min_ocr_conf=0.8, dedup_seconds=30)
+    replay_logs(['runs/log/gate_in', 'runs/log/gate_out'], ParkingBackend('replay.json'))
+    python result_log.py replay runs/log --data-file runs/replay/parking_data.json   # 目录下每个摄像头一个子目录
+"""
+
+import json
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+TEXT_BYTES = 16  # 省份汉字 3 字节 + 7/8 位字母数字
+FRAME_DTYPE = np.dtype([('frame', '<i8'), ('timestamp', '<f8'), ('first', '<u4'), ('count', '<u2'),
+                        ('flags', 'u1')])
+FLAG_BACKFILL = 1
+PLATE_DTYPE = np.dtype([('box', '<i2', (4,)), ('det_conf', '<f2'), ('ocr_conf', '<f2'),
+                        ('text', f'S{TEXT_BYTES}')])
+
+
+def _as_numpy(array) -> np.ndarray:
+    """兼容 torch 张量与列表"""
+    if array is None:
+        return None
+    if hasattr(array, 'cpu'):
+        array = array.cpu().numpy()
+    return np.asarray(array)
+
+
+def _encode_text(text: str) -> bytes:
+    """UTF-8 编码，超长时按字符截断，保证不会截出半个汉字"""
+    data = (text or '').encode('utf-8')
+    while len(data) > TEXT_BYTES:
+        text = text[:-1]
+        data = text.encode('utf-8')
+    return data
+
+
+def _atomic_save(path: str, array: np.ndarray):
+    tmp_path = path + ".tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+class ResultLogWriter:
+    """按分块追加写入结果日志"""
+
+    def __init__(self, out_dir: str, chunk_frames: int = 8192, flush_seconds: float = 30.0, source: str = ''):
+        """
+        Args:
+            chunk_frames: 每个分块的帧数
+            flush_seconds: 距离上次写盘超过该时间也会写出分块，进程崩溃最多丢失这段时间的结果
+            source: 来源说明（摄像头编号、视频文件名），写入 manifest
+        """
+        self.out_dir = out_dir
+        self.chunk_frames = chunk_frames
+        self.flush_seconds = flush_seconds
+        self.manifest_path = os.path.join(out_dir, 'manifest.json')
+        os.makedirs(out_dir, exist_ok=True)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {'version': 2, 'source': source, 'chunks': []}
+        self._frames = []
+        self._plates = []
+        self._last_flush = time.monotonic()
+
+    def append(self, frame: int, timestamp: float, boxes, det_confs=None,
+               texts: Sequence[str] = None, ocr_confs=None, backfill: bool = False):
+        """
+        追加一帧的结果
+        Args:
+            boxes: (N, 4) xyxy，可直接传入 results.boxes.xyxy
+            det_confs: (N,) 检测置信度，可直接传入 results.boxes.conf
+            texts / ocr_confs: 每个框的车牌号与 OCR 置信度，未识别的为空字符串 / 0
+            backfill: 事后补做的 OCR 结果；frame / timestamp 传原帧的值，记录带 FLAG_BACKFILL
+        """
+        boxes = _as_numpy(boxes)
+        n = 0 if boxes is None else len(boxes)
+        plates = np.zeros(n, dtype=PLATE_DTYPE)
+        if n:
+            plates['box'] = np.clip(np.rint(boxes.reshape(n, 4)), -32768, 32767)
+            if det_confs is not None:
+                plates['det_conf'] = _as_numpy(det_confs)
+            if texts is not None:
+                plates['text'] = [_encode_text(t) for t in texts]
+            if ocr_confs is not None:
+                plates['ocr_conf'] = [c or 0 for c in ocr_confs]
+            self._plates.append(plates)
+        self._frames.append((frame, timestamp, n, FLAG_BACKFILL if backfill else 0))
+        if len(self._frames) >= self.chunk_frames or time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        """把缓冲区写成一个新分块并更新 manifest"""
+        self._last_flush = time.monotonic()
+        if not self._frames:
+            return
+        frames = np.zeros(len(self._frames), dtype=FRAME_DTYPE)
+        frames['frame'], frames['timestamp'], frames['count'], frames['flags'] = zip(*self._frames)
+        counts = frames['count'].astype(np.int64)
+        frames['first'] = np.cumsum(counts) - counts
+        plates = np.concatenate(self._plates) if self._plates else np.zeros(0, dtype=PLATE_DTYPE)
+
+        name = f"chunk_{len(self.manifest['chunks']):05d}"
+        _atomic_save(os.path.join(self.out_dir, name + ".plates.npy"), plates)
+        _atomic_save(os.path.join(self.out_dir, name + ".frames.npy"), frames)
+        self.manifest['chunks'].append({
+            'name': name,
+            'frames': len(frames),
+            'backfill': int((frames['flags'] & FLAG_BACKFILL).astype(bool).sum()),
+            'plates': len(plates),
+            'first_frame': int(frames['frame'][0]),
+            'last_frame': int(frames['frame'][-1]),
+            'start': float(frames['timestamp'].min()),
+            'end': float(frames['timestamp'].max()),
+        })
+        # manifest 最后写：只有它登记过的分块才会被读取，写到一半的分块不会被看到
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+        self._frames = []
+        self._plates = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ResultLog:
+    """以内存映射方式读取结果日志"""
+
+    def __init__(self, log_dir: str):
+        with open(os.path.join(log_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.chunks = []
+        for info in self.manifest['chunks']:
+            frames = np.load(os.path.join(log_dir, info['name'] + ".frames.npy"), mmap_mode='r')
+            plates = np.load(os.path.join(log_dir, info['name'] + ".plates.npy"), mmap_mode='r')
+            self.chunks.append((info, frames, plates))
+
+    def __len__(self):
+        """帧数（不含补做 OCR 的记录）"""
+        return sum(info['frames'] - info.get('backfill', 0) for info in self.manifest['chunks'])
+
+    @property
+    def plate_count(self) -> int:
+        return sum(info['plates'] for info in self.manifest['chunks'])
+
+    def frames(self, start: float = None, end: float = None):
+        """逐帧产出 (帧号, 时间戳, 车牌记录数组)；时间范围之外的分块整块跳过，补做 OCR 的记录不算帧"""
+        for info, frames, plates in self._chunks_between(start, end):
+            backfill = _backfill_mask(frames)
+            for row, is_backfill in zip(frames, backfill):
+                if is_backfill:
+                    continue
+                if (start is not None and row['timestamp'] < start) or (end is not None and row['timestamp'] > end):
+                    continue
+                yield int(row['frame']), float(row['timestamp']), plates[row['first']:row['first'] + row['count']]
+
+    def _chunks_between(self, start, end):
+        for info, frames, plates in self.chunks:
+            if (start is not None and info['end'] < start) or (end is not None and info['start'] > end):
+                continue
+            yield info, frames, plates
+
+    def sightings(self, min_ocr_conf: float = 0.0, start: float = None, end: float = None) -> Dict[str, np.ndarray]:
+        """
+        所有识别出车牌号的记录，按时间排序（向量化展开，不逐帧循环）
+        Returns:
+            {'timestamp': float64, 'frame': int64, 'text': 字符串数组, 'ocr_conf': float32, 'box': (N, 4) int16}
+        """
+        parts = []
+        for _, frames, plates in self._chunks_between(start, end):
+            counts = frames['count'].astype(np.int64)
+            timestamps = np.repeat(frames['timestamp'], counts)
+            frame_ids = np.repeat(frames['frame'], counts)
+            keep = (plates['text'] != b'') & (plates['ocr_conf'].astype(np.float32) >= min_ocr_conf)
+            if start is not None:
+                keep &= timestamps >= start
+            if end is not None:
+                keep &= timestamps <= end
+            selected = plates[keep]
+            parts.append((timestamps[keep], frame_ids[keep], selected['text'],
+                          selected['ocr_conf'].astype(np.float32), np.asarray(selected['box'])))
+        if not parts:
+            return {'timestamp': np.empty(0), 'frame': np.empty(0, dtype=np.int64), 'text': np.empty(0, dtype=str),
+                    'ocr_conf': np.empty(0, dtype=np.float32), 'box': np.empty((0, 4), dtype=np.int16)}
+        timestamps, frame_ids, texts, confs, boxes = (np.concatenate(column) for column in zip(*parts))
+        order = np.argsort(timestamps, kind='stable')
+        return {
+            'timestamp': timestamps[order],
+            'frame': frame_ids[order],
+            'text': np.char.decode(texts[order], 'utf-8'),
+            'ocr_conf': confs[order],
+            'box': boxes[order],
+        }
+
+    def plate_events(self, min_ocr_conf: float = 0.8, dedup_seconds: float = 30.0,
+                     start: float = None, end: float = None) -> List[tuple]:
+        """
+        把逐帧识别合并为车牌事件：同一车牌两次出现间隔不超过 dedup_seconds 视为同一次经过闸口
+        Returns:
+            [(时间戳, 车牌号), ...]，按时间排序，时间取每次经过的第一帧
+        """
+        return _events_from_sightings(self.sightings(min_ocr_conf, start, end), dedup_seconds)
+
+    def replay(self, backend, min_ocr_conf: float = 0.8, dedup_seconds: float = 30.0,
+               start: float = None, end: float = None) -> int:
+        """按时间顺序把车牌事件送入 ParkingBackend，返回事件数；多个摄像头的日志用 replay_logs"""
+        return _replay_events(backend, self.plate_events(min_ocr_conf, dedup_seconds, start, end))
+
+
+def _backfill_mask(frames: np.ndarray) -> np.ndarray:
+    """早期（version 1）分块没有 flags 列"""
+    if 'flags' not in frames.dtype.names:
+        return np.zeros(len(frames), dtype=bool)
+    return (frames['flags'] & FLAG_BACKFILL).astype(bool)
+
+
+def _events_from_sightings(s: Dict[str, np.ndarray], dedup_seconds: float) -> List[tuple]:
+    if not len(s['text']):
+        return []
+    # 按 (车牌, 时间) 排序后与前一行比较：换车牌或间隔过大即为新事件
+    order = np.lexsort((s['timestamp'], s['text']))
+    texts = s['text'][order]
+    timestamps = s['timestamp'][order]
+    new_event = np.ones(len(order), dtype=bool)
+    new_event[1:] = (texts[1:] != texts[:-1]) | (np.diff(timestamps) > dedup_seconds)
+    event_times = timestamps[new_event]
+    event_texts = texts[new_event]
+    by_time = np.argsort(event_times, kind='stable')
+    return [(float(t), str(p)) for t, p in zip(event_times[by_time], event_texts[by_time])]
+
+
+def _replay_events(backend, events: List[tuple]) -> int:
+    for timestamp, text in events:
+        backend.process_plate_recognition(text, datetime.fromtimestamp(timestamp))
+    return len(events)
+
+
+def expand_log_dirs(paths: Sequence[str]) -> List[str]:
+    """日志目录列表；没有 manifest.json 的目录展开为其下各个摄像头子目录（live_scheduler --log-dir 的布局）"""
+    result = []
+    for path in paths:
+        if os.path.exists(os.path.join(path, 'manifest.json')):
+            result.append(path)
+            continue
+        subdirs = sorted(os.path.join(path, name) for name in os.listdir(path)
+                         if os.path.exists(os.path.join(path, name, 'manifest.json')))
+        if not subdirs:
+            raise FileNotFoundError(f"{path} 下没有结果日志")
+        result.extend(subdirs)
+    return result
+
+
+def merged_plate_events(logs: Sequence[ResultLog], min_ocr_conf: float = 0.8, dedup_seconds: float = 30.0,
+                        start: float = None, end: float = None) -> List[tuple]:
+    """
+    多个摄像头日志的车牌事件：先把各日志的识别记录按时间合并，再统一按 dedup_seconds 合并成事件，
+    与实时识别时各摄像头共用一个 PlateDebouncer 的规则一致
+    """
+    parts = [log.sightings(min_ocr_conf, start, end) for log in logs]
+    merged = {key: np.concatenate([part[key] for part in parts]) for key in ('timestamp', 'text')}
+    return _events_from_sightings(merged, dedup_seconds)
+
+
+def replay_logs(log_dirs: Sequence[str], backend, min_ocr_conf: float = 0.8, dedup_seconds: float = 30.0,
+                start: float = None, end: float = None) -> int:
+    """把多个日志按时间合并成一条事件流送入 ParkingBackend，返回事件数"""
+    logs = [ResultLog(path) for path in expand_log_dirs(log_dirs)]
+    return _replay_events(backend, merged_plate_events(logs, min_ocr_conf, dedup_seconds, start, end))
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="检测结果日志：查看与回放")
+    sub = parser.add_subparsers(dest='command', required=True)
+    info_parser = sub.add_parser('info', help='日志概况')
+    info_parser.add_argument('logs', nargs='+', help='日志目录，或包含各摄像头子目录的上级目录')
+    replay_parser = sub.add_parser('replay', help='按时间合并多个日志后回放到停车后台并输出统计')
+    replay_parser.add_argument('logs', nargs='+', help='日志目录，或包含各摄像头子目录的上级目录')
+    replay_parser.add_argument('--data-file', default='runs/replay/parking_data.json',
+                               help='回放用的后台状态文件（会先清空）')
+    replay_parser.add_argument('--min-ocr-conf', type=float, default=0.8)
+    replay_parser.add_argument('--dedup-seconds', type=float, default=30.0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    log_dirs = expand_log_dirs(args.logs)
+    logs = [ResultLog(path) for path in log_dirs]
+    if args.command == 'info':
+        for path, log in zip(log_dirs, logs):
+            chunks = log.manifest['chunks']
+            span = (chunks[-1]['end'] - chunks[0]['start']) if chunks else 0.0
+            print(f"{path}: 来源 {log.manifest.get('source') or '-'}, 分块 {len(chunks)}, 帧 {len(log)}, "
+                  f"车牌记录 {log.plate_count}, 时间跨度 {span / 3600:.2f} 小时")
+        return
+
+    from parking_analytics import ParkingAnalytics
+    from parking_backend import ParkingBackend
+
+    os.makedirs(os.path.dirname(args.data_file) or '.', exist_ok=True)
+    backend = ParkingBackend(args.data_file)
+    backend.reset_data()
+    count = _replay_events(backend, merged_plate_events(logs, args.min_ocr_conf, args.dedup_seconds))
+    elapsed = time.perf_counter() - start
+    print(f"回放 {len(logs)} 个日志、{sum(len(log) for log in logs)} 帧 -> {count} 个车牌事件，用时 {elapsed:.2f}s")
+    print(json.dumps(backend.get_statistics(), ensure_ascii=False, indent=2, default=str))
+    report = ParkingAnalytics(backend).query()
+    report.pop('occupancy', None)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
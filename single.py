@@ -7,33 +7,36 @@ from PIL import ImageFont, Image
 from paddleocr import PaddleOCR
 import numpy as np
 import re
+from pipeline_metrics import metrics
+from perf_profiles import apply_profile
 
 
 if __name__ == "__main__":
     # 需要检测的图片地址
     img_path = "D:/Code/py/yolo/datasets/PlateData/images/test/01-90_265-231&522_405&574-405&571_235&574_231&523_403&522-0_0_3_1_28_29_30_30-134-56.jpg"
-    now_img = tools.img_cvread(img_path)
+    with metrics.stage('decode'):
+        now_img = tools.img_cvread(img_path)
+    metrics.count('frames')
 
     fontC = ImageFont.truetype("Font/platech.ttf", 50, 0)
     # 加载ocr模型
     ocr = PaddleOCR(lang="ch")
-    # YOLO模型路径
+    # YOLO模型路径；性能配置档由环境变量 PLATE_PERF_PROFILE 选择
+    profile = apply_profile()
     yolo_model_path = r'models/best.pt'
-    model = YOLO(yolo_model_path, task='detect')
+    model = profile.load_model(yolo_model_path)
 
     # 检测
-    results = model(img_path)[0]
-    location_list = results.boxes.xyxy.tolist()
+    with metrics.stage('yolo'):
+        results = model(img_path, **profile.predict_kwargs())[0]
+    # 截取车牌并标准化宽高（框先裁剪到图像范围内）
+    with metrics.stage('crop'):
+        crops, boxes, valid = tools.crop_plates(now_img, results.boxes.xyxy)
+    license_imgs = crops[valid]
+    location_list = boxes[valid].tolist()
     if len(location_list) >= 1:
-        location_list = [list(map(int, e)) for e in location_list]
-        license_imgs = []
-        for each in location_list:
-            x1, y1, x2, y2 = each
-            cropImg = now_img[y1:y2, x1:x2]
-
-            # 对车牌进行缩放，标准化宽高
-            cropImg = cv2.resize(cropImg, (240, 80), interpolation=cv2.INTER_LINEAR)
-            license_imgs.append(cropImg)
+        for cropImg in license_imgs:
+            metrics.count('plates')
             cv2.imshow('crop_plate', cropImg)
             cv2.waitKey(500)
 
@@ -42,8 +45,11 @@ if __name__ == "__main__":
         conf_list = []
 
         ocr = hub.Module(name="ch_pp-ocrv3")
-        result = ocr.recognize_text(images=[cropImg])
+        with metrics.stage('ocr'):
+            result = ocr.recognize_text(images=[cropImg])
         print(result)
+        if not result or not result[0]['data']:
+            metrics.count('ocr_failures')
         for each in result:
             text = each['data'][0]['text']  # ✅ 注意这里是 [0]
             conf = each['data'][0]['confidence']
@@ -54,8 +60,9 @@ if __name__ == "__main__":
             lisence_res.append(text)
             conf_list.append(conf)
         # 在图片上绘制识别结果
-        for i, (text, box) in enumerate(zip(lisence_res, location_list)):
-            now_img = tools.drawRectBox(now_img, box, text, fontC)
+        with metrics.stage('annotate'):
+            for i, (text, box) in enumerate(zip(lisence_res, location_list)):
+                now_img = tools.drawRectBox(now_img, box, text, fontC)
 
 
 
@@ -63,4 +70,6 @@ if __name__ == "__main__":
     now_img = cv2.resize(now_img, dsize=None, fx=0.5, fy=0.5, interpolation=cv2.INTER_LINEAR)
     cv2.imshow("YOLOv8 Detection", now_img)
     cv2.waitKey(0)
-    cv2.destroyAllWindows()
\ No newline at end of file
+    cv2.destroyAllWindows()
+    metrics.report()
+    metrics.write_prometheus()
\ No newline at end of file
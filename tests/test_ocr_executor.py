@@ -0,0 +1,47 @@
+# encoding:utf-8
+import os
+
+import numpy as np
+import pytest
+
+from ocr_executor import OcrExecutor
+
+POISON = 255
+
+
+def _recognize(crop):
+    """截图左上角像素为 POISON 时让工作进程直接崩溃，其余返回像素值"""
+    value = int(crop[0, 0, 0])
+    if value == POISON:
+        os._exit(1)
+    return str(value), 1.0
+
+
+def poison_engine():
+    return _recognize
+
+
+def _crop(value):
+    return np.full((8, 24, 3), value, np.uint8)
+
+
+def test_crash_only_charges_the_crashing_crop():
+    crops = [_crop(1), _crop(POISON), _crop(3), _crop(4)]
+    with OcrExecutor(num_workers=1, engine=poison_engine, slots_per_worker=4, poll_seconds=0.2) as executor:
+        results = executor.map(crops)
+        assert results == [('1', 1.0), (None, None), ('3', 1.0), ('4', 1.0)]
+        assert executor.restarts == executor.max_retries + 1
+        # 重启后的进程继续正常工作
+        assert executor.map([_crop(5)]) == [('5', 1.0)]
+
+
+def broken_engine():
+    raise RuntimeError("模型文件不存在")
+
+
+def test_worker_that_cannot_start_is_not_respawned_forever():
+    with OcrExecutor(num_workers=1, engine=broken_engine, slots_per_worker=2, poll_seconds=0.2,
+                     max_start_failures=2) as executor:
+        with pytest.raises(RuntimeError, match="模型文件不存在"):
+            executor.map([_crop(1), _crop(2)])
+        assert executor.restarts == 2
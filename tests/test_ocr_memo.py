@@ -0,0 +1,55 @@
+# encoding:utf-8
+import cv2
+import numpy as np
+
+from ocr_memo import OcrMemo, crop_signature, signature_distance
+
+BOX = [100, 200, 340, 280]
+
+
+def plate(text, noise=0.0, seed=0):
+    """合成 240x80 的蓝底白字车牌截图"""
+    img = np.full((80, 240, 3), (160, 60, 20), np.uint8)
+    cv2.putText(img, text, (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 1.9, (255, 255, 255), 4)
+    if noise:
+        img = np.clip(img + np.random.default_rng(seed).normal(0, noise, img.shape), 0, 255).astype(np.uint8)
+    return img
+
+
+def test_signature_separates_neighbouring_plates_from_noise():
+    base = crop_signature(plate('A12345'))
+    memo = OcrMemo()
+    noisy = [signature_distance(base, crop_signature(plate('A12345', noise=20, seed=s))) for s in range(5)]
+    others = [signature_distance(base, crop_signature(plate(text, noise=10, seed=1)))
+              for text in ('A12346', 'A12845', 'B12345', 'A12344')]
+    assert max(noisy) < memo.max_change / 2
+    assert min(others) > memo.max_change * 2
+
+
+def test_same_car_reuses_result():
+    memo = OcrMemo()
+    memo.begin_frame([BOX])
+    memo.store(plate('A12345'), BOX, 'A12345', 0.95, now=0)
+    memo.begin_frame([BOX])
+    assert memo.lookup(plate('A12345', noise=10, seed=1), BOX, now=1) == ('A12345', 0.95)
+
+
+def test_next_car_in_same_box_is_not_reused():
+    memo = OcrMemo()
+    memo.begin_frame([BOX])
+    memo.store(plate('A12345'), BOX, 'A12345', 0.95, now=0)
+    # 下一辆车紧接着停在同一位置，中间没有空帧
+    memo.begin_frame([BOX])
+    calls = []
+    text, _ = memo.recognize(plate('A12346', noise=10, seed=2), BOX,
+                             lambda crop: calls.append(1) or ('A12346', 0.9), now=1)
+    assert text == 'A12346' and calls == [1]
+
+
+def test_entry_expires_when_box_disappears():
+    memo = OcrMemo()
+    memo.begin_frame([BOX])
+    memo.store(plate('A12345'), BOX, 'A12345', 0.95, now=0)
+    memo.begin_frame([])
+    memo.begin_frame([BOX])
+    assert memo.lookup(plate('A12345'), BOX, now=0.1) is None
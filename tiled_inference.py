@@ -0,0 +1,237 @@
+# coding:utf-8
+"""
+高分辨率画面分块检测
+4K 全景摄像头缩放到 imgsz=640 后车牌只剩几个像素，会被漏检。
+这里把大图切成相互重叠的分块，按批送入检测器，再把各分块的框映射回原图做全局 NMS。
+功能：
+1. 分块尺寸、重叠比例可配置
+2. 分块按 batch 推理
+3. 帧差判断无运动的分块直接跳过，沿用该分块上一次的结果
+4. 可选再跑一次整图缩放推理，兼顾跨分块的大车牌；所有分块都静止时整图推理也跳过，直接沿用上一帧的合并结果
+用法:
+    detector = TiledDetector(YOLO('models/best.pt'), tile_size=640, overlap=0.2)
+    boxes, scores = detector.detect(frame)
+"""
+
+import argparse
+import time
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+
+def make_tiles(frame_shape, tile_size: int = 640, overlap: float = 0.2) -> np.ndarray:
+    """
+    计算覆盖整幅画面的分块 (x1, y1, x2, y2)，最后一行/列贴齐画面边缘
+    """
+    height, width = frame_shape[:2]
+    stride = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        points = list(range(0, length - tile_size, stride))
+        points.append(length - tile_size)
+        return points
+
+    tiles = [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+             for y in starts(height) for x in starts(width)]
+    return np.array(tiles, dtype=np.int32)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float = 0.5,
+        containment_threshold: float = 0.85) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    全局 NMS，返回保留的 (boxes, scores)
+    除交并比外，大部分面积互相包含的框（分块边缘被截断的半个车牌与完整车牌）
+    会合并为它们的外接框，避免只留下被截断的那一半
+    """
+    if len(boxes) == 0:
+        return np.empty((0, 4), np.float32), np.empty(0, np.float32)
+    x1, y1, x2, y2 = boxes.T
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    # 同分时面积大的优先
+    order = np.lexsort((-areas, -scores))
+    kept_boxes, kept_scores = [], []
+    while len(order):
+        i = order[0]
+        rest = order[1:]
+        iw = np.maximum(0, np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]))
+        ih = np.maximum(0, np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]))
+        inter = iw * ih
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+        contained = inter / np.maximum(np.minimum(areas[i], areas[rest]), 1e-9)
+        merged = rest[contained > containment_threshold]
+        box = boxes[i].copy()
+        if len(merged):
+            box[:2] = np.minimum(box[:2], boxes[merged, :2].min(axis=0))
+            box[2:] = np.maximum(box[2:], boxes[merged, 2:].max(axis=0))
+        kept_boxes.append(box)
+        kept_scores.append(scores[i])
+        order = rest[(iou <= iou_threshold) & (contained <= containment_threshold)]
+    return np.array(kept_boxes, dtype=np.float32), np.array(kept_scores, dtype=np.float32)
+
+
+class MotionGate:
+    """按分块做低分辨率帧差，判断哪些分块有运动"""
+
+    def __init__(self, scale: float = 0.25, pixel_threshold: int = 25, area_ratio: float = 0.002):
+        """
+        Args:
+            scale: 帧差前的缩放比例
+            pixel_threshold: 灰度差超过该值的像素视为变化
+            area_ratio: 分块内变化像素比例超过该值视为有运动
+        """
+        self.scale = scale
+        self.pixel_threshold = pixel_threshold
+        self.area_ratio = area_ratio
+        self._previous = None
+
+    def active_tiles(self, frame: np.ndarray, tiles: np.ndarray) -> np.ndarray:
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        previous, self._previous = self._previous, gray
+        if previous is None or previous.shape != gray.shape:
+            return np.ones(len(tiles), dtype=bool)
+        changed = (cv2.absdiff(gray, previous) > self.pixel_threshold).astype(np.uint8)
+        # 积分图：任意分块内的变化像素数 O(1) 得到
+        integral = cv2.integral(changed)
+        t = np.round(tiles * self.scale).astype(np.int32)
+        t[:, 0::2] = np.clip(t[:, 0::2], 0, gray.shape[1])
+        t[:, 1::2] = np.clip(t[:, 1::2], 0, gray.shape[0])
+        counts = (integral[t[:, 3], t[:, 2]] - integral[t[:, 1], t[:, 2]]
+                  - integral[t[:, 3], t[:, 0]] + integral[t[:, 1], t[:, 0]])
+        areas = np.maximum((t[:, 2] - t[:, 0]) * (t[:, 3] - t[:, 1]), 1)
+        return counts / areas > self.area_ratio
+
+
+class TiledDetector:
+    """分块检测器"""
+
+    def __init__(self, model, tile_size: int = 640, overlap: float = 0.2, batch_size: int = 8,
+                 conf: float = 0.25, iou: float = 0.5, skip_static: bool = True,
+                 full_frame: bool = True, motion_gate: MotionGate = None):
+        """
+        Args:
+            model: ultralytics YOLO 模型
+            tile_size: 分块边长（同时作为推理 imgsz，分块不再缩放）
+            overlap: 相邻分块的重叠比例，应大于车牌在画面中的最大宽度占分块的比例
+            batch_size: 每批推理的分块数
+            conf / iou: 置信度阈值与全局 NMS 阈值
+            skip_static: 跳过无运动的分块，沿用该分块上一次的检测结果
+            full_frame: 额外做一次整图缩放到 tile_size 的推理，检测跨分块的大车牌（只在有分块需要推理的帧上执行）
+            motion_gate: 自定义的运动判断器
+        """
+        self.model = model
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.conf = conf
+        self.iou = iou
+        self.skip_static = skip_static
+        self.full_frame = full_frame
+        self.motion_gate = motion_gate or MotionGate()
+        self._tiles = None
+        self._frame_shape = None
+        self._tile_results = {}  # {分块下标: (boxes, scores)}，原图坐标
+        self._merged = None  # 上一帧合并（NMS）后的 (boxes, scores)
+        self.stats = {'frames': 0, 'tiles_total': 0, 'tiles_run': 0, 'full_frame_run': 0}
+
+    def _predict(self, images: List[np.ndarray]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        outputs = []
+        for start in range(0, len(images), self.batch_size):
+            batch = images[start:start + self.batch_size]
+            for result in self.model(batch, imgsz=self.tile_size, conf=self.conf, verbose=False):
+                outputs.append((result.boxes.xyxy.cpu().numpy(), result.boxes.conf.cpu().numpy()))
+        return outputs
+
+    def detect(self, frame: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        检测一帧
+        Returns:
+            boxes: 原图坐标 (N, 4) float32
+            scores: 置信度 (N,)
+        """
+        if self._tiles is None or self._frame_shape != frame.shape[:2]:
+            self._frame_shape = frame.shape[:2]
+            self._tiles = make_tiles(frame.shape, self.tile_size, self.overlap)
+            self._tile_results = {}
+            self._merged = None
+
+        tiles = self._tiles
+        if self.skip_static:
+            active = self.motion_gate.active_tiles(frame, tiles)
+        else:
+            active = np.ones(len(tiles), dtype=bool)
+        # 没有缓存结果的分块必须跑一次
+        for i in range(len(tiles)):
+            if i not in self._tile_results:
+                active[i] = True
+        run = np.flatnonzero(active)
+        self.stats['frames'] += 1
+        self.stats['tiles_total'] += len(tiles)
+        self.stats['tiles_run'] += len(run)
+        # 整幅画面都静止：分块结果与整图结果都不会变，直接沿用上一帧的合并结果
+        if len(run) == 0 and self._merged is not None:
+            return self._merged
+
+        crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in tiles[run]]
+        for i, (boxes, scores) in zip(run, self._predict(crops)):
+            boxes[:, 0::2] += tiles[i, 0]
+            boxes[:, 1::2] += tiles[i, 1]
+            self._tile_results[i] = (boxes, scores)
+
+        all_boxes = [self._tile_results[i][0] for i in range(len(tiles))]
+        all_scores = [self._tile_results[i][1] for i in range(len(tiles))]
+        if self.full_frame and len(tiles) > 1:
+            boxes, scores = self._predict([frame])[0]
+            all_boxes.append(boxes)
+            all_scores.append(scores)
+            self.stats['full_frame_run'] += 1
+
+        boxes = np.concatenate(all_boxes).astype(np.float32) if all_boxes else np.empty((0, 4), np.float32)
+        scores = np.concatenate(all_scores) if all_scores else np.empty(0, np.float32)
+        boxes, scores = nms(boxes, scores, self.iou)
+        self._merged = (boxes, scores)
+        return boxes, scores
+
+
+if __name__ == '__main__':
+    import detect_tools as tools
+    from perf_profiles import add_profile_argument, apply_profile
+
+    parser = argparse.ArgumentParser(description="高分辨率视频分块检测")
+    parser.add_argument('--source', default='TestFiles/1.mp4')
+    parser.add_argument('--model', default='models/best.pt')
+    parser.add_argument('--tile', type=int, default=640, help='分块边长')
+    parser.add_argument('--overlap', type=float, default=0.2, help='分块重叠比例')
+    parser.add_argument('--batch', type=int, default=8)
+    parser.add_argument('--no-skip', action='store_true', help='不跳过静止分块')
+    parser.add_argument('--show', action='store_true')
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    perf = apply_profile(args.profile)
+    if perf.static_shape:
+        # 静态形状的 ONNX：分块边长取导出尺寸，逐块推理
+        args.tile, args.batch = perf.imgsz or args.tile, 1
+    detector = TiledDetector(perf.load_model(args.model), args.tile, args.overlap, args.batch,
+                             skip_static=not args.no_skip)
+    cap = cv2.VideoCapture(args.source)
+    start = time.perf_counter()
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        boxes, scores = detector.detect(frame)
+        if args.show:
+            cv2.imshow("Tiled Detection", tools.draw_boxes(frame, boxes.astype(int).tolist()))
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+    cap.release()
+    cv2.destroyAllWindows()
+    elapsed = time.perf_counter() - start
+    stats = detector.stats
+    print(f"处理 {stats['frames']} 帧，{stats['frames'] / max(elapsed, 1e-9):.1f} 帧/秒，"
+          f"实际推理分块 {stats['tiles_run']}/{stats['tiles_total']}，整图推理 {stats['full_frame_run']} 次")
@@ -1,8 +1,25 @@
 #coding:utf-8
+"""
+模型训练
+    python train.py                       # 常规训练
+    python train.py --search              # 模型规模 x 输入分辨率搜索，输出精度/CPU 延迟的 Pareto 前沿
+    python train.py --distill --teacher runs/search/yolov8s_640/weights/best.pt --export
+                                          # 用更大的教师模型给训练集打伪标签，训练低分辨率小模型，并导出 ONNX
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
 from ultralytics import YOLO
+import numpy as np
 import torch
 
-def main():
+DATA_YAML = 'datasets/PlateData/data.yaml'
+
+
+def select_device():
     # 检查GPU可用性
     if torch.cuda.is_available():
         device = 'cuda'
@@ -11,7 +28,18 @@ def main():
     else:
         device = 'cpu'
         print("使用CPU训练")
-    
+    return device
+
+
+def export_model(model, imgsz=640, fmt='onnx'):
+    """常规训练与蒸馏共用的导出路径"""
+    path = model.export(format=fmt, imgsz=imgsz)
+    if path:
+        print(f"模型已导出为{fmt.upper()}格式: {path}")
+    return path
+
+
+def train_default(device, export=False):
     # 加载预训练模型
     model = YOLO("yolov8n.pt")
     
@@ -69,10 +97,333 @@ def main():
     metrics = model.val()
     print(f"验证结果: mAP50={metrics.box.map50:.3f}, mAP50-95={metrics.box.map:.3f}")
     
-    # 将模型转为onnx格式（可选）
-    # success = model.export(format='onnx')
-    # if success:
-    #     print("模型已导出为ONNX格式")
+    # 将模型转为onnx格式（可选，--export）
+    if export:
+        export_model(model)
+
+
+# --------- 模型规模 x 分辨率搜索 ----------
+def latency_images(count=16, seed=0):
+    """延迟测量用的图片：优先取验证集，没有时用固定种子的随机图"""
+    try:
+        from evaluate import iter_batches, load_split
+        images = [img for _, chunk in iter_batches(load_split(DATA_YAML, 'val', limit=count), count) for img in chunk]
+    except Exception as e:
+        print(f"读取验证集失败，使用随机图测延迟: {e}")
+        images = []
+    if not images:
+        rng = np.random.default_rng(seed)
+        images = [rng.integers(0, 255, (720, 1160, 3), dtype=np.uint8) for _ in range(count)]
+    return images
+
+
+def measure_cpu_latency(weights, imgsz, images, repeat=3):
+    """单张 CPU 推理延迟（毫秒，取中位数），与部署时逐帧调用的方式一致"""
+    model = YOLO(weights, task='detect')
+    model(images[0], imgsz=imgsz, device='cpu', verbose=False)  # 预热
+    samples = []
+    for _ in range(repeat):
+        for img in images:
+            start = time.perf_counter()
+            model(img, imgsz=imgsz, device='cpu', verbose=False)
+            samples.append(time.perf_counter() - start)
+    return float(np.median(samples) * 1000)
+
+
+def pareto_front(candidates):
+    """延迟越低、mAP50 越高越好；返回不被任何其它候选同时在两项上超过的候选"""
+    done = sorted((c for c in candidates if c.get('map50') is not None), key=lambda c: (c['latency_ms'], -c['map50']))
+    front, best_map = [], -1.0
+    for c in done:
+        if c['map50'] > best_map:
+            front.append(c)
+            best_map = c['map50']
+    return front
+
+
+class ResolutionSearch:
+    """
+    在模型规模与输入分辨率上搜索满足 mAP50 下限的最快检测器
+    1. 先用预训练权重测每个候选的 CPU 延迟，比已达标候选还慢的直接跳过
+    2. 每个候选先短训 probe_epochs 轮，mAP50 距离下限超过 prune_margin 的提前淘汰
+    3. 幸存者在短训权重上继续训满 epochs 轮
+    进度保存在 <project>/search_state.json，中断后重新运行会跳过已完成的阶段，
+    训练到一半的阶段从 last.pt 续训
+    """
+
+    def __init__(self, models, imgsz_list, device, map_floor=0.9, epochs=100, probe_epochs=10,
+                 prune_margin=0.15, batch=8, project='runs/search'):
+        self.models = models
+        self.imgsz_list = imgsz_list
+        self.device = device
+        self.map_floor = map_floor
+        self.epochs = epochs
+        self.probe_epochs = probe_epochs
+        self.prune_margin = prune_margin
+        self.batch = batch
+        self.project = project
+        self.state_path = os.path.join(project, 'search_state.json')
+        self.state = self._load_state()
+        self._images = None
+
+    def _load_state(self):
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {'candidates': {}}
+
+    def _save_state(self):
+        os.makedirs(self.project, exist_ok=True)
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def _latency(self, weights, imgsz):
+        if self._images is None:
+            self._images = latency_images()
+        return measure_cpu_latency(weights, imgsz, self._images)
+
+    def _train(self, name, init_weights, imgsz, epochs):
+        """训练一个阶段，返回 best.pt；run 目录里已有 last.pt 时续训"""
+        run_dir = os.path.join(self.project, name)
+        last = os.path.join(run_dir, 'weights', 'last.pt')
+        if os.path.exists(last):
+            print(f"{name}: 从 {last} 续训")
+            try:
+                YOLO(last).train(resume=True)
+            except AssertionError as e:
+                # 训练已经结束、只是状态文件还没来得及记录
+                print(f"{name}: {e}")
+        else:
+            YOLO(init_weights).train(
+                data=DATA_YAML, epochs=epochs, imgsz=imgsz, batch=self.batch, device=self.device,
+                workers=4, project=self.project, name=name, exist_ok=True, plots=False, verbose=False,
+            )
+        return os.path.join(run_dir, 'weights', 'best.pt')
+
+    def _validate(self, weights, imgsz):
+        metrics = YOLO(weights).val(data=DATA_YAML, imgsz=imgsz, device=self.device, plots=False, verbose=False)
+        return float(metrics.box.map50)
+
+    def _fastest_passing(self):
+        passing = [c['latency_ms'] for c in self.state['candidates'].values()
+                   if c.get('stage') == 'done' and c['map50'] >= self.map_floor]
+        return min(passing) if passing else float('inf')
+
+    def run(self):
+        for model_name in self.models:
+            for imgsz in self.imgsz_list:
+                key = f"{os.path.splitext(os.path.basename(model_name))[0]}_{imgsz}"
+                c = self.state['candidates'].setdefault(key, {'model': model_name, 'imgsz': imgsz, 'stage': 'new'})
+                if 'base_latency_ms' not in c:
+                    c['base_latency_ms'] = self._latency(model_name, imgsz)
+                    self._save_state()
+                    print(f"{key}: 预训练权重 CPU 延迟 {c['base_latency_ms']:.1f}ms")
+
+        # 从快到慢训练，越早找到达标候选，后面越多的慢候选可以直接跳过
+        order = sorted(self.state['candidates'].items(), key=lambda item: item[1]['base_latency_ms'])
+        for key, c in order:
+            if c['stage'] in ('done', 'pruned'):
+                print(f"{key}: 已完成 ({c['stage']})")
+                continue
+            # 延迟只取决于结构与分辨率，比已达标的候选还慢就不必训练
+            if c['base_latency_ms'] >= self._fastest_passing():
+                c.update(stage='pruned', reason='比已达标的候选更慢')
+                self._save_state()
+                print(f"{key}: 跳过，{c['base_latency_ms']:.1f}ms 不快于已达标候选")
+                continue
+
+            if c['stage'] == 'new':
+                probe = self._train(key + '_probe', c['model'], c['imgsz'], self.probe_epochs)
+                c.update(stage='probed', probe_weights=probe, probe_map50=self._validate(probe, c['imgsz']))
+                self._save_state()
+                print(f"{key}: 短训 mAP50={c['probe_map50']:.3f}")
+            if c['probe_map50'] < self.map_floor - self.prune_margin:
+                c.update(stage='pruned', reason=f"短训 mAP50 {c['probe_map50']:.3f} 距下限过远")
+                self._save_state()
+                continue
+
+            weights = self._train(key, c['probe_weights'], c['imgsz'], self.epochs - self.probe_epochs)
+            c.update(stage='done', weights=weights, map50=self._validate(weights, c['imgsz']),
+                     latency_ms=self._latency(weights, c['imgsz']))
+            self._save_state()
+            print(f"{key}: mAP50={c['map50']:.3f}, CPU 延迟 {c['latency_ms']:.1f}ms")
+        return self.report()
+
+    def report(self):
+        candidates = list(self.state['candidates'].values())
+        front = pareto_front(candidates)
+        passing = [c for c in front if c['map50'] >= self.map_floor]
+        best = min(passing, key=lambda c: c['latency_ms']) if passing else None
+        print(f"\nPareto 前沿 (mAP50 下限 {self.map_floor}):")
+        print(f"{'模型':<16}{'imgsz':>6}{'mAP50':>8}{'CPU ms':>9}")
+        for c in front:
+            mark = ' <- 推荐' if c is best else ''
+            print(f"{os.path.basename(c['model']):<16}{c['imgsz']:>6}{c['map50']:>8.3f}{c['latency_ms']:>9.1f}{mark}")
+        if best is None:
+            print("没有候选达到 mAP50 下限")
+        self.state['pareto_front'] = front
+        self.state['recommended'] = best
+        self._save_state()
+        return best
+
+
+# --------- 知识蒸馏 ----------
+def _link_or_copy(src, dst):
+    if os.path.exists(dst):
+        return
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _xywh_to_xyxy(boxes):
+    return np.concatenate([boxes[:, :2] - boxes[:, 2:] / 2, boxes[:, :2] + boxes[:, 2:] / 2], axis=1)
+
+
+def build_distill_dataset(teacher_weights, out_dir, teacher_imgsz=640, conf=0.25, keep_gt=True,
+                          device='cpu', batch=16):
+    """
+    用教师模型给训练集重新打标签，生成学生模型的训练集（伪标签蒸馏）
+    教师输出经置信度阈值过滤后作为硬标签框，学生只学这些框，不学教师的分数分布或中间特征；
+    教师框更贴合、能补上漏标的车牌，keep_gt 时再补回教师漏检的人工标注框
+    验证集仍用原始标注，保证师生对比公平
+    """
+    from evaluate import IMAGE_EXTS, box_iou_matrix, resolve_split_dir
+    train_dir = resolve_split_dir(DATA_YAML, 'train')
+    image_dir = os.path.join(out_dir, 'images', 'train')
+    label_dir = os.path.join(out_dir, 'labels', 'train')
+    os.makedirs(image_dir, exist_ok=True)
+    os.makedirs(label_dir, exist_ok=True)
+
+    paths = sorted(os.path.join(train_dir, f) for f in os.listdir(train_dir) if f.lower().endswith(IMAGE_EXTS))
+    teacher = YOLO(teacher_weights)
+    teacher_boxes, added_gt = 0, 0
+    for start in range(0, len(paths), batch):
+        chunk = paths[start:start + batch]
+        for path, result in zip(chunk, teacher(chunk, imgsz=teacher_imgsz, conf=conf, device=device, verbose=False)):
+            name = os.path.basename(path)
+            _link_or_copy(path, os.path.join(image_dir, name))
+            boxes = result.boxes.xywhn.cpu().numpy().reshape(-1, 4)
+            teacher_boxes += len(boxes)
+            gt_path = os.path.splitext(path.replace(os.sep + 'images' + os.sep, os.sep + 'labels' + os.sep))[0] + '.txt'
+            if keep_gt and os.path.exists(gt_path):
+                gt = np.loadtxt(gt_path, ndmin=2, dtype=np.float64).reshape(-1, 5)[:, 1:]
+                if len(gt):
+                    missed = gt if len(boxes) == 0 else \
+                        gt[box_iou_matrix(_xywh_to_xyxy(gt), _xywh_to_xyxy(boxes)).max(axis=1) < 0.5]
+                    boxes = np.concatenate([boxes, missed]) if len(missed) else boxes
+                    added_gt += len(missed)
+            with open(os.path.join(label_dir, os.path.splitext(name)[0] + '.txt'), 'w') as f:
+                for cx, cy, w, h in boxes:
+                    f.write(f"0 {cx:.6f} {cy:.6f} {w:.6f} {h:.6f}\n")
+
+    data_yaml = os.path.join(out_dir, 'data.yaml')
+    with open(data_yaml, 'w', encoding='utf-8') as f:
+        f.write(f"train: {os.path.abspath(image_dir)}\n")
+        f.write(f"val: {os.path.abspath(resolve_split_dir(DATA_YAML, 'val'))}\n")
+        f.write("nc: 1\nnames: ['LicensePlate']\n")
+    print(f"蒸馏数据集: {len(paths)} 张图片，教师框 {teacher_boxes} 个，补回人工标注 {added_gt} 个")
+    return data_yaml
+
+
+def count_params(weights) -> int:
+    return int(sum(p.numel() for p in YOLO(weights).model.parameters()))
+
+
+def distill(device, teacher_weights, student='yolov8n.pt', teacher_imgsz=640, student_imgsz=320,
+            teacher_conf=0.25, epochs=100, project='runs/distill', export=False):
+    """
+    伪标签蒸馏：教师模型的硬标签框监督低分辨率学生模型，输出师生精度与 CPU 延迟对比报告
+    教师应是比学生更大的模型（如搜索得到的 yolov8s/m），同规模的教师只能提供分辨率上的差异
+    """
+    teacher_params, student_params = count_params(teacher_weights), count_params(student)
+    if student_params >= teacher_params:
+        print(f"警告: 学生模型 {student} 参数量 {student_params:,} 不少于教师模型 {teacher_weights} "
+              f"的 {teacher_params:,}，蒸馏只剩分辨率上的差异，建议改用 s/m 规模的教师")
+    data_yaml = build_distill_dataset(teacher_weights, os.path.join(project, 'data'), teacher_imgsz,
+                                      teacher_conf, device=device)
+    YOLO(student).train(
+        data=data_yaml, epochs=epochs, imgsz=student_imgsz, batch=8 if device == 'cuda' else 4,
+        device=device, workers=4, project=project, name='student', exist_ok=True, verbose=True, plots=True,
+    )
+    student_weights = os.path.join(project, 'student', 'weights', 'best.pt')
+
+    images = latency_images()
+    report = {}
+    for role, weights, imgsz in (('teacher', teacher_weights, teacher_imgsz), ('student', student_weights, student_imgsz)):
+        model = YOLO(weights)
+        metrics = model.val(data=DATA_YAML, imgsz=imgsz, device=device, plots=False, verbose=False)
+        report[role] = {
+            'weights': weights,
+            'imgsz': imgsz,
+            'params': count_params(weights),
+            'map50': float(metrics.box.map50),
+            'map50_95': float(metrics.box.map),
+            'cpu_latency_ms': measure_cpu_latency(weights, imgsz, images),
+        }
+    report['speedup'] = report['teacher']['cpu_latency_ms'] / max(report['student']['cpu_latency_ms'], 1e-9)
+    report['map50_drop'] = report['teacher']['map50'] - report['student']['map50']
+
+    print(f"\n{'':<10}{'imgsz':>6}{'参数量':>12}{'mAP50':>8}{'mAP50-95':>10}{'CPU ms':>9}")
+    for role in ('teacher', 'student'):
+        r = report[role]
+        print(f"{role:<10}{r['imgsz']:>6}{r['params']:>12,}{r['map50']:>8.3f}{r['map50_95']:>10.3f}{r['cpu_latency_ms']:>9.1f}")
+    print(f"学生模型 CPU 加速 {report['speedup']:.1f} 倍，mAP50 下降 {report['map50_drop']:.3f}")
+
+    if export:
+        report['student']['export'] = export_model(YOLO(student_weights), imgsz=student_imgsz)
+    with open(os.path.join(project, 'distill_report.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="车牌检测模型训练")
+    parser.add_argument('--search', action='store_true', help='模型规模 x 输入分辨率搜索')
+    parser.add_argument('--models', default='yolov8n.pt,yolov8s.pt,yolov8m.pt', help='搜索的预训练模型')
+    parser.add_argument('--imgsz', default='320,416,512,640', help='搜索的输入分辨率')
+    parser.add_argument('--map-floor', type=float, default=0.9, help='mAP50 下限')
+    parser.add_argument('--epochs', type=int, default=100)
+    parser.add_argument('--probe-epochs', type=int, default=10, help='提前淘汰前的短训轮数')
+    parser.add_argument('--prune-margin', type=float, default=0.15, help='短训 mAP50 低于下限多少时淘汰')
+    parser.add_argument('--project', default='runs/search')
+    parser.add_argument('--distill', action='store_true', help='伪标签蒸馏：教师模型的检测框监督小模型')
+    parser.add_argument('--teacher', default=None,
+                        help='教师模型权重（--distill 时必填），应比学生更大，如 runs/search/yolov8s_640/weights/best.pt')
+    parser.add_argument('--teacher-imgsz', type=int, default=640)
+    parser.add_argument('--teacher-conf', type=float, default=0.25, help='教师伪标签的置信度阈值')
+    parser.add_argument('--student', default='yolov8n.pt')
+    parser.add_argument('--student-imgsz', type=int, default=320)
+    parser.add_argument('--export', action='store_true', help='训练后导出 ONNX')
+    args = parser.parse_args()
+
+    if args.distill and not args.teacher:
+        parser.error('--distill 需要用 --teacher 指定教师模型权重')
+
+    device = select_device()
+    if args.distill:
+        distill(device, args.teacher, args.student, args.teacher_imgsz, args.student_imgsz,
+                args.teacher_conf, args.epochs, export=args.export)
+        return
+    if not args.search:
+        train_default(device, export=args.export)
+        return
+    search = ResolutionSearch(
+        models=[m for m in args.models.split(',') if m],
+        imgsz_list=[int(v) for v in args.imgsz.split(',') if v],
+        device=device,
+        map_floor=args.map_floor,
+        epochs=args.epochs,
+        probe_epochs=args.probe_epochs,
+        prune_margin=args.prune_margin,
+        batch=8 if device == 'cuda' else 4,
+        project=args.project,
+    )
+    search.run()
+
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,496 @@
+# encoding:utf-8
+"""
+监视文件夹的增量识别守护进程
+闸口摄像头的抓拍图片不断写入共享目录，single.py / batch.py 每次运行都重新扫描整个目录、重新识别全部图片。
+守护进程只处理新增或被修改的图片：
+1. Linux 下用 inotify 监听写入完成 / 移入事件（包括新建的子目录），其他平台退回定时轮询
+2. 已处理的图片记录在 SQLite 索引中（路径、大小、修改时间、内容哈希），重启后直接跳过；
+   每批图片先提交索引再写入停车后台，崩溃重启不会把同一批车牌重复提交给后台
+3. 新图片攒成批次：线程池并行预读解码，YOLO 按批检测，车牌截图交给多进程 OCR 执行器
+4. 启动时的积压按同样的批次流水线排空，解码、检测与 OCR 互相重叠
+5. 定期打印吞吐量（张/秒、车牌/秒、待处理数量）
+用法:
+    python watch_ingest.py --dirs snapshots/gate_in snapshots/gate_out --backend --data-file runs/ingest/parking_data.json
+    python watch_ingest.py --dirs TestFiles --once          # 只排空积压后退出
+"""
+
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import sqlite3
+import struct
+import sys
+import time
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from perf_profiles import add_profile_argument, apply_profile
+from pipeline_metrics import metrics
+from result_cache import file_digest
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def scan_images(dirs: Iterable[str], recursive: bool = True):
+    """用 os.scandir 遍历目录，逐个产出 (路径, stat)；只 stat 一次，不再 os.walk + glob"""
+    stack = list(dirs)
+    while stack:
+        current = stack.pop()
+        try:
+            entries = list(os.scandir(current))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        stack.append(entry.path)
+                elif entry.name.lower().endswith(IMAGE_EXTS):
+                    yield entry.path, entry.stat()
+            except OSError:
+                continue
+
+
+class ProcessedIndex:
+    """
+    已处理图片的持久化索引（SQLite）: 路径 -> (大小, 修改时间, 内容哈希)
+    只记录文件身份，不保存识别结果；每批一次事务提交，不会随图片数增长而整体重写
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS processed ("
+                         "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL, digest TEXT)")
+        self._db.commit()
+        self._import_legacy_json()
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM processed").fetchone()[0]
+
+    def _import_legacy_json(self):
+        """旧版同名 .json 索引（整表 JSON，含识别结果）只导入路径、大小与修改时间"""
+        legacy = os.path.splitext(self.path)[0] + '.json'
+        if legacy == self.path or not os.path.exists(legacy) or len(self):
+            return
+        try:
+            with open(legacy, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except Exception as e:
+            print(f"读取旧版索引失败: {e}")
+            return
+        with self._db:
+            self._db.executemany("INSERT OR IGNORE INTO processed (path, size, mtime) VALUES (?, ?, ?)",
+                                 [(p, e['size'], e['mtime']) for p, e in entries.items()])
+        print(f"已从 {legacy} 导入 {len(entries)} 条已处理记录")
+
+    def is_done(self, path: str, stat: os.stat_result) -> bool:
+        """
+        大小与修改时间都没变才算处理过；被覆盖写入的图片会重新识别
+        只有修改时间变了（例如被 touch 或复制时重置）时，内容哈希相同也算处理过
+        """
+        row = self._db.execute("SELECT size, mtime, digest FROM processed WHERE path = ?", (path,)).fetchone()
+        if row is None or row[0] != stat.st_size:
+            return False
+        if row[1] == stat.st_mtime:
+            return True
+        if row[2] is None:
+            return False
+        try:
+            if file_digest(path) != row[2]:
+                return False
+        except OSError:
+            return False
+        with self._db:
+            self._db.execute("UPDATE processed SET mtime = ? WHERE path = ?", (stat.st_mtime, path))
+        return True
+
+    def mark_many(self, items: Sequence[Tuple[str, os.stat_result, str]]):
+        """在一个事务中记录一批 (路径, stat, 内容哈希)，返回时已提交"""
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO processed (path, size, mtime, digest) VALUES (?, ?, ?, ?)",
+                                 [(path, stat.st_size, stat.st_mtime, digest) for path, stat, digest in items])
+
+    def close(self):
+        self._db.close()
+
+
+# --------- 文件监听 ----------
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _settle(previous: Dict[str, tuple], current: Dict[str, tuple]):
+    """
+    previous / current 为两次检查时的 {路径: (大小, 修改时间)}
+    两次都在且没有变化的文件视为写入完成并交出，其余记下等下一次检查
+    """
+    ready = [path for path, sig in current.items() if previous.get(path) == sig]
+    return ready, {path: sig for path, sig in current.items() if previous.get(path) != sig}
+
+
+def _stat_signature(path: str):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+class PollingWatcher:
+    """定时轮询：两次扫描之间大小和修改时间都不变的新文件才交出，避免读到写了一半的图片"""
+
+    def __init__(self, dirs: List[str], index: ProcessedIndex, interval: float = 2.0):
+        self.dirs = dirs
+        self.index = index
+        self.interval = interval
+        self._pending = {}  # 路径 -> (大小, 修改时间)
+        self._last_scan = 0.0
+
+    def poll(self, timeout: float) -> List[str]:
+        wait = self._last_scan + self.interval - time.monotonic()
+        if wait > 0:
+            time.sleep(min(wait, timeout))
+            if wait > timeout:
+                return []
+        self._last_scan = time.monotonic()
+        seen = {}
+        for path, stat in scan_images(self.dirs):
+            if self.index.is_done(path, stat):
+                continue
+            seen[path] = (stat.st_size, stat.st_mtime)
+        ready, self._pending = _settle(self._pending, seen)
+        return ready
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Linux inotify（通过 ctypes 调用 libc，不依赖第三方包），递归监听所有子目录
+    新建子目录时其中可能已有正在写入的文件，这些文件与轮询模式一样，
+    间隔 settle_interval 两次检查大小和修改时间都不变才交出
+    """
+
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, dirs: List[str], settle_interval: float = 2.0):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self._wd_paths = {}
+        self.settle_interval = settle_interval
+        self._settling = {}  # 新目录中已有的文件: 路径 -> (大小, 修改时间)
+        self._last_settle = time.monotonic()
+        self.overflowed = False
+        for d in dirs:
+            self._watch_tree(d)
+
+    @staticmethod
+    def available() -> bool:
+        return sys.platform.startswith('linux')
+
+    def _watch(self, path: str):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            print(f"无法监听目录 {path}: {os.strerror(ctypes.get_errno())}")
+            return
+        self._wd_paths[wd] = path
+
+    def _watch_tree(self, root: str) -> List[str]:
+        """监听 root 及其所有子目录，返回其中已有的图片（新建目录时可能已经写入了文件）"""
+        self._watch(root)
+        found = []
+        for current, subdirs, files in os.walk(root):
+            for name in subdirs:
+                self._watch(os.path.join(current, name))
+            found.extend(os.path.join(current, f) for f in files if f.lower().endswith(IMAGE_EXTS))
+        return found
+
+    def _check_settling(self) -> List[str]:
+        if not self._settling or time.monotonic() - self._last_settle < self.settle_interval:
+            return []
+        self._last_settle = time.monotonic()
+        current = {path: _stat_signature(path) for path in self._settling}
+        ready, self._settling = _settle(self._settling, {p: s for p, s in current.items() if s is not None})
+        return ready
+
+    def poll(self, timeout: float) -> List[str]:
+        if self._settling:
+            timeout = min(timeout, self.settle_interval)
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return self._check_settling()
+        data = os.read(self.fd, 64 * 1024)
+        ready, offset = [], 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出，调用方需要全量扫描一次补漏
+                self.overflowed = True
+                continue
+            if wd not in self._wd_paths:
+                continue
+            path = os.path.join(self._wd_paths[wd], os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    for found in self._watch_tree(path):
+                        signature = _stat_signature(found)
+                        if signature is not None:
+                            self._settling[found] = signature
+                    # 至少间隔 settle_interval 再做下一次检查
+                    self._last_settle = time.monotonic()
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and path.lower().endswith(IMAGE_EXTS):
+                # 写入完成事件说明文件已经完整，不必再等
+                self._settling.pop(path, None)
+                ready.append(path)
+        return ready + self._check_settling()
+
+    def close(self):
+        os.close(self.fd)
+
+
+# --------- 守护进程 ----------
+class IngestDaemon:
+    """监听目录，批量检测 + OCR 新图片，可选把识别结果写入停车后台"""
+
+    def __init__(self,
+                 dirs: List[str],
+                 model_path: str = 'models/best.pt',
+                 ocr_engine='hub',
+                 ocr_workers: int = None,
+                 batch_size: int = 16,
+                 index_path: str = '.cache/ingest_index.sqlite',
+                 backend=None,
+                 imgsz: int = 640,
+                 conf: float = 0.25,
+                 min_ocr_conf: float = 0.0,
+                 poll_interval: float = 2.0,
+                 report_interval: float = 10.0,
+                 use_inotify: bool = True,
+                 profile=None,
+                 dedup_seconds: float = 30.0):
+        """
+        Args:
+            backend: ParkingBackend 实例；为 None 时只识别、记录结果
+            min_ocr_conf: 低于该置信度的车牌不提交给后台
+            poll_interval: 轮询模式的扫描间隔（秒）；inotify 模式下新目录中已有文件的稳定检查间隔
+            report_interval: 吞吐量报告间隔（秒）
+            profile: perf_profiles.PerfProfile，决定模型格式、预热与 OCR 线程数
+            dedup_seconds: 同一车牌的连拍合并为一次进出，消失超过该秒数再出现才算新的进出场
+        """
+        from parking_backend import PlateDebouncer
+        from perf_profiles import get_profile
+
+        profile = profile or get_profile('default')
+
+        self.dirs = [os.path.normpath(d) for d in dirs]
+        # 静态形状的 ONNX 只能逐张、按导出尺寸推理
+        self.batch_size = 1 if profile.static_shape else batch_size
+        self.backend = backend
+        self.debouncer = PlateDebouncer(dedup_seconds)
+        self.imgsz = profile.imgsz if profile.static_shape and profile.imgsz else imgsz
+        self.conf = conf
+        self.min_ocr_conf = min_ocr_conf
+        self.report_interval = report_interval
+        self.index = ProcessedIndex(index_path)
+        self.model = profile.load_model(model_path)
+        self.ocr = profile.ocr_executor(ocr_engine, ocr_workers)
+        if use_inotify and InotifyWatcher.available():
+            self.watcher = InotifyWatcher(self.dirs, poll_interval)
+        else:
+            self.watcher = PollingWatcher(self.dirs, self.index, poll_interval)
+        self.stats = {'images': 0, 'plates': 0, 'failed': 0}
+        self._started = time.monotonic()
+        self._last_report = (self._started, 0, 0)
+
+    def backlog(self) -> List[str]:
+        """全量扫描一次，得到尚未处理的图片（按修改时间排序，先拍的先处理）"""
+        todo = [(stat.st_mtime, path) for path, stat in scan_images(self.dirs)
+                if not self.index.is_done(path, stat)]
+        return [path for _, path in sorted(todo)]
+
+    def process(self, paths: List[str]):
+        """
+        按批处理一组图片：img_cvread_iter 在后台线程中预读解码，
+        当前批次检测与 OCR 时下一批已在解码
+        """
+        import detect_tools as tools
+
+        batch = []
+        for path, img in tools.img_cvread_iter(paths, prefetch=self.batch_size * 2):
+            if img is None:
+                self.stats['failed'] += 1
+                metrics.count('decode_failures')
+                continue
+            batch.append((path, img))
+            if len(batch) >= self.batch_size:
+                self._process_batch(batch)
+                batch = []
+            self._maybe_report(len(paths))
+        if batch:
+            self._process_batch(batch)
+
+    def _process_batch(self, batch):
+        import detect_tools as tools
+
+        metrics.count('frames', len(batch))
+        with metrics.stage('yolo'):
+            results = self.model([img for _, img in batch], imgsz=self.imgsz, conf=self.conf, verbose=False)
+
+        # 整批的截图一起交给 OCR 执行器，多进程并行识别
+        all_crops, owners = [], []
+        with metrics.stage('crop'):
+            for i, ((_, img), result) in enumerate(zip(batch, results)):
+                crops, _, valid = tools.crop_plates(img, result.boxes.xyxy)
+                for crop in crops[valid]:
+                    all_crops.append(crop)
+                    owners.append(i)
+        metrics.count('plates', len(all_crops))
+        with metrics.stage('ocr'):
+            recognized = self.ocr.map(all_crops) if all_crops else []
+
+        texts = [[] for _ in batch]
+        confs = [[] for _ in batch]
+        for owner, (text, conf) in zip(owners, recognized):
+            if not text:
+                metrics.count('ocr_failures')
+            texts[owner].append(text or '')
+            confs[owner].append(float(conf or 0))
+
+        done = []
+        for i, (path, _) in enumerate(batch):
+            try:
+                stat = os.stat(path)
+                done.append((i, path, stat, file_digest(path)))
+            except OSError:
+                continue  # 处理期间被删除
+        # 先提交索引再写后台：崩溃最多让这一批车牌没写进后台，重启后不会把已写入的车牌再提交一遍
+        self.index.mark_many([(path, stat, digest) for _, path, stat, digest in done])
+        if self.backend is not None:
+            for i, path, stat, _ in done:
+                self._submit(path, stat, texts[i], confs[i])
+        self.stats['images'] += len(batch)
+        self.stats['plates'] += len(all_crops)
+
+    def _submit(self, path: str, stat: os.stat_result, texts: List[str], confs: List[float]):
+        """
+        抓拍时间取文件修改时间，重启后补处理的积压也按真实时间计费
+        同一辆车的一组连拍经 PlateDebouncer 合并，只计一次进出
+        """
+        from datetime import datetime
+        captured = datetime.fromtimestamp(stat.st_mtime)
+        for text, conf in zip(texts, confs):
+            if text and conf >= self.min_ocr_conf:
+                result = self.debouncer.submit(self.backend, text, captured)
+                if result is not None:
+                    print(f"{os.path.basename(path)}: {result.get('message', result)}")
+
+    def _maybe_report(self, pending: int = 0, force: bool = False):
+        now = time.monotonic()
+        last_time, last_images, last_plates = self._last_report
+        if not force and now - last_time < self.report_interval:
+            return
+        elapsed = max(now - last_time, 1e-9)
+        total = max(now - self._started, 1e-9)
+        print(f"[吞吐] 最近 {elapsed:.0f}s: {(self.stats['images'] - last_images) / elapsed:.1f} 张/秒, "
+              f"{(self.stats['plates'] - last_plates) / elapsed:.1f} 车牌/秒 | "
+              f"累计 {self.stats['images']} 张 ({self.stats['images'] / total:.1f} 张/秒), "
+              f"失败 {self.stats['failed']}, 待处理 {pending}, 索引 {len(self.index)} 条")
+        self._last_report = (now, self.stats['images'], self.stats['plates'])
+
+    def run(self, once: bool = False):
+        """先排空积压，再持续监听；once=True 时排空后退出"""
+        try:
+            todo = self.backlog()
+            print(f"积压图片 {len(todo)} 张（已处理 {len(self.index)} 张）")
+            start = time.perf_counter()
+            self.process(todo)
+            if todo:
+                elapsed = time.perf_counter() - start
+                print(f"积压处理完成: {len(todo)} 张, {elapsed:.1f}s, {len(todo) / max(elapsed, 1e-9):.1f} 张/秒")
+            if once:
+                return
+            print(f"开始监听 ({type(self.watcher).__name__}): {', '.join(self.dirs)}")
+            pending = []
+            while True:
+                arrived = self.watcher.poll(timeout=0.5)
+                pending.extend(arrived)
+                if getattr(self.watcher, 'overflowed', False):
+                    self.watcher.overflowed = False
+                    pending = self.backlog()
+                # 攒满一批，或者 0.5 秒内没有新事件时处理已到达的图片
+                if pending and (len(pending) >= self.batch_size or not arrived):
+                    todo = []
+                    for path in dict.fromkeys(pending):
+                        try:
+                            if not self.index.is_done(path, os.stat(path)):
+                                todo.append(path)
+                        except OSError:
+                            continue
+                    pending = []
+                    self.process(todo)
+                self._maybe_report(len(pending))
+        except KeyboardInterrupt:
+            print("停止监听")
+        finally:
+            self._maybe_report(force=True)
+            self.watcher.close()
+            self.index.close()
+            self.ocr.close()
+            metrics.report()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="监视文件夹的增量车牌识别")
+    parser.add_argument('--dirs', nargs='+', required=True, help='监听的目录（递归）')
+    parser.add_argument('--model', default='models/best.pt')
+    parser.add_argument('--ocr', default='hub')
+    parser.add_argument('--ocr-workers', type=int, default=None)
+    parser.add_argument('--batch', type=int, default=None, help='默认取性能配置档的批大小，未设置时为 16')
+    parser.add_argument('--imgsz', type=int, default=None, help='默认取性能配置档的输入尺寸，未设置时为 640')
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--index', default='.cache/ingest_index.sqlite', help='已处理索引文件 (SQLite)')
+    parser.add_argument('--backend', action='store_true', help='把识别结果写入停车后台')
+    parser.add_argument('--data-file', default='runs/ingest/parking_data.json', help='--backend 使用的停车数据文件')
+    parser.add_argument('--min-ocr-conf', type=float, default=0.0)
+    parser.add_argument('--dedup-seconds', type=float, default=30.0,
+                        help='同一车牌消失超过该秒数后再出现才算新的进出场')
+    parser.add_argument('--poll', action='store_true', help='强制使用轮询而不是 inotify')
+    parser.add_argument('--poll-interval', type=float, default=2.0)
+    parser.add_argument('--report-interval', type=float, default=10.0)
+    parser.add_argument('--once', action='store_true', help='排空积压后退出')
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    profile = apply_profile(args.profile)
+    batch = args.batch or (profile.batch if profile.batch > 1 else 16)
+    imgsz = args.imgsz or profile.imgsz or 640
+
+    backend = None
+    if args.backend:
+        from parking_backend import ParkingBackend
+        os.makedirs(os.path.dirname(args.data_file) or '.', exist_ok=True)
+        backend = ParkingBackend(args.data_file)
+    metrics.enable()
+    daemon = IngestDaemon(args.dirs, args.model, args.ocr, args.ocr_workers, batch, args.index, backend,
+                          imgsz, args.conf, args.min_ocr_conf, args.poll_interval, args.report_interval,
+                          use_inotify=not args.poll, profile=profile, dedup_seconds=args.dedup_seconds)
+    daemon.run(once=args.once)
+
+
+if __name__ == '__main__':
+    main()